@@ -1,4 +1,5 @@
 import json
+import os
 import sys
 
 # Add our source directory to the path as Python doesn't like sub-directories
@@ -14,5 +15,5 @@ if len(sys.argv) < 2:
 
 # Download details about this experiment run
 experiment_run_guid = sys.argv[1]
-experiment_run_details = studio_utils.get_wml_client().experiments.get_run_details(experiment_run_guid)
+experiment_run_details = studio_utils.get_details_cache().get_run_details(experiment_run_guid)
 print("\nExperiment details", json.dumps(experiment_run_details, indent=2))
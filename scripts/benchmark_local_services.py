@@ -0,0 +1,104 @@
+import os
+import sys
+import tempfile
+import time
+
+# Add source directory to the path as Python doesn't like sub-directories
+source_path = os.path.join("..", "source")
+sys.path.insert(0, source_path)
+from watson_studio_utils import WatsonStudioUtils
+from experiment_utils import Experiment
+from project_utils import ProjectUtils
+from local_services import LocalCosServer, LocalWmlClient, ServiceProfile
+
+# Measure submission, polling and transfer throughput against the local WML and COS stand-ins so changes to the
+# orchestration can be compared without network access.  Latency, throttling and failure rates are applied to
+# every simulated request.
+#
+# Usage: python benchmark_local_services.py [run_count] [latency] [throttle_rate] [failure_rate]
+
+run_count = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+latency = float(sys.argv[2]) if len(sys.argv) > 2 else 0.05
+throttle_rate = float(sys.argv[3]) if len(sys.argv) > 3 else 0.05
+failure_rate = float(sys.argv[4]) if len(sys.argv) > 4 else 0.01
+
+
+def create_profile():
+    return ServiceProfile(latency=latency, latency_jitter=latency, throttle_rate=throttle_rate,
+                          failure_rate=failure_rate, retry_after=0.1, seed=1)
+
+
+def print_stats(stats):
+    for endpoint in sorted(stats):
+        print("  %-32s %6d calls %6d throttled %6d failed" %
+              (endpoint, stats[endpoint]["calls"], stats[endpoint]["throttled"], stats[endpoint]["failed"]))
+
+
+cos_server = LocalCosServer(profile=create_profile())
+cos_server.start()
+wml_client = LocalWmlClient(profile=create_profile(), queue_seconds=1, training_seconds=3, guid_delay=0.5)
+
+studio_utils = WatsonStudioUtils(region="us-south")
+studio_utils.configure_utilities(cos_server.get_credentials(), {})
+studio_utils.set_wml_client(wml_client)
+cos_utils = studio_utils.get_cos_utils()
+
+data_bucket = cos_utils.create_unique_bucket("benchmark-data")
+results_bucket = cos_utils.create_unique_bucket("benchmark-results")
+project_utils = ProjectUtils(studio_utils)
+project_utils.settings[ProjectUtils.FASHION_MIST_ROOT_KEY] = {
+    ProjectUtils.FASHION_MIST_DATA_BUCKET_KEY: data_bucket,
+    ProjectUtils.FASHION_MIST_RESULTS_BUCKET_KEY: results_bucket
+}
+
+work_directory = tempfile.mkdtemp()
+experiment_zip = os.path.join("experiment_zips", "dropout_0.4.zip")
+
+# Submission
+start = time.time()
+experiment = Experiment("Local benchmark", "Benchmark against local services", "tensorflow", "1.5", "python", "3.5",
+                        studio_utils, project_utils)
+experiment.add_training_runs([{"name": "Run #%d" % index,
+                               "command": "python3 experiment.py",
+                               "experiment_zip": experiment_zip,
+                               "gpu_type": "k80",
+                               "hyperparameters": {"dropout": index / run_count}} for index in range(run_count)])
+experiment.execute()
+submission_seconds = time.time() - start
+
+# Polling until every training run has finished
+start = time.time()
+poll_count = 0
+while True:
+    states = [run.get_details()["entity"]["status"]["state"] for run in experiment.get_training_runs()]
+    poll_count += len(states)
+    if all(state in ["completed", "failed", "canceled"] for state in states):
+        break
+    time.sleep(0.5)
+polling_seconds = time.time() - start
+
+# Transfers
+files = []
+for index in range(run_count):
+    local_file = os.path.join(work_directory, "upload-%d.bin" % index)
+    with open(local_file, "wb") as f:
+        f.write(os.urandom(1024 * 1024))
+    files.append((local_file, "benchmark/upload-%d.bin" % index))
+upload_stats = cos_utils.upload_many(files, results_bucket)
+download_stats = cos_utils.download_many(results_bucket, [(key, local_file + ".download") for local_file, key in files])
+
+print("\nLocal services benchmark: %d training runs, latency %.3f s, throttle rate %.2f, failure rate %.2f" %
+      (run_count, latency, throttle_rate, failure_rate))
+print("  Submission: %.2f s (%.1f runs/s)" % (submission_seconds, run_count / submission_seconds))
+print("  Polling:    %.2f s for %d status requests" % (polling_seconds, poll_count))
+print("  Upload:     %.1f MB/s, %d failures" % (upload_stats["megabytes_per_second"], len(upload_stats["failures"])))
+print("  Download:   %.1f MB/s, %d failures" %
+      (download_stats["megabytes_per_second"], len(download_stats["failures"])))
+print("\nWML requests")
+print_stats(wml_client.get_stats())
+print("COS requests")
+print_stats(cos_server.get_stats())
+print("Scheduler")
+print(studio_utils.get_request_scheduler().get_stats())
+
+cos_server.stop()
@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+
+import numpy as np
+
+# Add source directory to the path as Python doesn't like sub-directories
+source_path = os.path.join("..", "source")
+sys.path.insert(0, source_path)
+from random_search import RandomSearch
+
+# Compare the RandomSearch strategies on synthetic objectives over the search space of run_random_search.py.
+# Reports the mean regret (best possible score - best score found) over many seeds for typical search sizes.
+# Lower is better.
+#
+# Usage: python benchmark_search_strategies.py [seed_count]
+
+SEARCH_COUNTS = [5, 10, 20, 60]
+STRATEGIES = [RandomSearch.STRATEGY_RANDOM, RandomSearch.STRATEGY_UNIQUE, RandomSearch.STRATEGY_SOBOL,
+              RandomSearch.STRATEGY_HALTON, RandomSearch.STRATEGY_LATIN_HYPERCUBE]
+
+
+def create_search(seed):
+
+    search = RandomSearch(seed=seed)
+    search.add_list("optimizer", ["sgd", "adam"])
+    search.add_power_range("num_filters_1", 5, 8, 2)
+    search.add_power_range("num_filters_2", 4, 8, 2)
+    search.add_power_range("num_filters_3", 4, 7, 2)
+    search.add_step_range("filter_size_1", 2, 3, 1)
+    search.add_step_range("filter_size_2", 2, 3, 1)
+    search.add_step_range("filter_size_3", 2, 3, 1)
+    search.add_step_range("dropout_1", 0.1, 0.9, 0.1)
+    search.add_step_range("dropout_2", 0.1, 0.9, 0.1)
+    search.add_step_range("dropout_3", 0.1, 0.9, 0.1)
+    search.add_step_range("dropout_4", 0.1, 0.9, 0.1)
+    search.add_power_range("dense_1", 6, 11, 2)
+    return search
+
+
+# Objectives are functions of each parameter's position in its values (0 to 1).  Their optimum is found by
+# evaluating them on the grid of positions along each axis as they're separable.
+def quadratic(positions, optimum):
+    return -np.sum((positions - optimum) ** 2, axis=-1)
+
+
+def cosine(positions, optimum):
+    return np.sum(np.cos(3 * np.pi * (positions - optimum)) - 2 * (positions - optimum) ** 2, axis=-1)
+
+
+def few_important(positions, optimum):
+    # Only a few parameters matter, the setting where Bergstra and Bengio found random search to beat grid search
+    weights = np.zeros(positions.shape[-1])
+    weights[:3] = 1
+    return -np.sum(weights * np.abs(positions - optimum), axis=-1)
+
+
+OBJECTIVES = [("quadratic", quadratic), ("cosine", cosine), ("few important", few_important)]
+
+
+def get_best_score(objective, radices, optimum):
+
+    best_score = 0
+    for column, radix in enumerate(radices):
+        # Score each axis on its own with the other axes at the optimum
+        positions = np.tile(optimum, (radix, 1))
+        positions[:, column] = np.arange(radix) / max(radix - 1, 1)
+        best_score += np.max(objective(positions, optimum) - objective(optimum[np.newaxis, :], optimum)[0])
+    return best_score + objective(optimum[np.newaxis, :], optimum)[0]
+
+
+seed_count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+radices = create_search(0).get_search_space().get_radices()
+print("Search space of %d parameters and %d grid points, mean regret over %d seeds" %
+      (len(radices), create_search(0).get_cardinality(), seed_count))
+
+for objective_name, objective in OBJECTIVES:
+    print("\n%s" % objective_name)
+    print("  %-16s %s" % ("strategy", "".join("%10s" % ("n=%d" % count) for count in SEARCH_COUNTS)))
+
+    for strategy in STRATEGIES:
+        start = time.time()
+        regrets = np.zeros((seed_count, len(SEARCH_COUNTS)))
+        for seed in range(seed_count):
+            optimum = np.random.default_rng(seed + 1000000).random(len(radices))
+            best_score = get_best_score(objective, radices, optimum)
+            for column, search_count in enumerate(SEARCH_COUNTS):
+                indices = create_search(seed).create_indices(search_count, strategy)
+                positions = indices / np.maximum(radices - 1, 1)
+                regrets[seed, column] = best_score - np.max(objective(positions, optimum))
+
+        print("  %-16s %s  (%.1f s)" % (strategy, "".join("%10.3f" % regret for regret in regrets.mean(axis=0)),
+                                         time.time() - start))
@@ -0,0 +1,47 @@
+import subprocess
+import sys
+import time
+
+# Measure how long short-lived scripts take to start.  Each scenario runs in a fresh interpreter so the
+# timings include module imports, and the lazily created COS and WML clients are only built by the
+# scenarios that use them.
+#
+# Usage: python benchmark_startup.py [repeat_count]
+
+SETUP = """
+import os, sys
+sys.path.insert(0, os.path.join("..", "source"))
+from watson_studio_utils import WatsonStudioUtils
+studio_utils = WatsonStudioUtils(region="us-south")
+studio_utils.configure_utilities_from_file()
+"""
+
+SCENARIOS = [
+    ("configure only", SETUP),
+    ("configure + COS client", SETUP + "studio_utils.get_cos_utils().get_cos_client()\n"),
+    ("configure + WML client", SETUP + "studio_utils.get_wml_client()\n"),
+    ("configure + both clients", SETUP + "studio_utils.get_cos_utils().get_cos_client()\n"
+                                         "studio_utils.get_wml_client()\n"),
+]
+
+
+def time_scenario(code, repeat_count):
+
+    timings = []
+    for _ in range(repeat_count):
+        start = time.time()
+        result = subprocess.run([sys.executable, "-c", code], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        timings.append(time.time() - start)
+        if result.returncode != 0:
+            return None, result.stderr.decode("utf-8").strip().splitlines()[-1]
+    return min(timings), None
+
+
+repeat_count = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+print("Startup time, best of %d runs" % repeat_count)
+for name, code in SCENARIOS:
+    seconds, error = time_scenario(code, repeat_count)
+    if error is not None:
+        print("  %-28s failed: %s" % (name, error))
+    else:
+        print("  %-28s %.3f s" % (name, seconds))
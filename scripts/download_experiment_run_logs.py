@@ -7,6 +7,7 @@ source_path = os.path.join("..","source")
 sys.path.insert(0, source_path)
 from watson_studio_utils import WatsonStudioUtils
 from project_utils import ProjectUtils
+from download_cache import DownloadCache
 
 # Initialize various utilities that will make our lives easier
 studio_utils = WatsonStudioUtils(region="us-south")
@@ -14,13 +15,16 @@ studio_utils.configure_utilities_from_file()
 
 project_utils = ProjectUtils(studio_utils)
 
+# Only objects that changed since the last run are downloaded again
+studio_utils.get_cos_utils().set_download_cache(DownloadCache())
+
 # Did user pass a training run?
 if len(sys.argv) < 2:
     raise ValueError("An experiment run guid must be passed as the first argument")
 
 # Print run details as may be useful for debugging
 experiment_run_guid = sys.argv[1]
-experiment_run_details = studio_utils.get_wml_client().experiments.get_run_details(experiment_run_guid)
+experiment_run_details = studio_utils.get_details_cache().get_run_details(experiment_run_guid)
 print("\nExperiment run details", json.dumps(experiment_run_details, sort_keys=True, indent=4))
 
 training_runs = experiment_run_details["entity"]["training_statuses"]
@@ -1,4 +1,3 @@
-import json
 import os
 import sys
 
@@ -20,18 +19,11 @@ if len(sys.argv) < 2:
 
 training_run_guid = sys.argv[1]
 
+# Only files that were added or changed since the last sync are downloaded so this script can be used to
+# poll a running training run for new checkpoints and logs.  Pass --delete to also remove local files
+# that no longer exist in the results bucket.
 results_bucket = project_utils.get_results_bucket()
-all_objects = studio_utils.get_cos_utils().get_all_objects_in_bucket(results_bucket, prefix=training_run_guid)
-
-for object in all_objects:
-
-    remote_file = object["Key"]
-    local_file = remote_file
-    local_file = os.path.join("training_runs", local_file)
-
-    if local_file.rfind(os.sep) != len(local_file)-1:  # not a directory
-
-        studio_utils.get_cos_utils().download_file(results_bucket,
-                                                   remote_file,
-                                                   local_file,
-                                                   is_redownload=True)
+studio_utils.get_cos_utils().sync_prefix(results_bucket,
+                                         training_run_guid,
+                                         "training_runs",
+                                         delete="--delete" in sys.argv)
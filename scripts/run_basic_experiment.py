@@ -7,6 +7,8 @@ sys.path.insert(0, source_path)
 from watson_studio_utils import WatsonStudioUtils
 from experiment_utils import Experiment
 from project_utils  import ProjectUtils
+from experiment_monitor import ExperimentMonitor
+from local_experiment import LocalExperiment
 
 # Initialize various utilities that will make our lives easier
 studio_utils = WatsonStudioUtils(region="us-south")
@@ -14,15 +16,16 @@ studio_utils.configure_utilities_from_file()
 
 project_utils = ProjectUtils(studio_utils)
 
-# Initialize our experiment
-experiment = Experiment("Fashion MNIST-dropout tests",
-                        "Test two different dropout values",
-                        "tensorflow",
-                        "1.5",
-                        "python",
-                        "3.5",
-                        studio_utils,
-                        project_utils)
+# Initialize our experiment.  Pass --local to run the training runs on this machine instead of in WML.
+experiment_class = LocalExperiment if "--local" in sys.argv else Experiment
+experiment = experiment_class("Fashion MNIST-dropout tests",
+                              "Test two different dropout values",
+                              "tensorflow",
+                              "1.5",
+                              "python",
+                              "3.5",
+                              studio_utils,
+                              project_utils)
 
 # Add two training runs to determine which dropout is best: 0.4 or 0.9
 run_1a_path = os.path.join("experiment_zips", "dropout_0.4.zip")
@@ -38,5 +41,16 @@ experiment.execute()
 # Print the current status of the Experiment.
 experiment.print_experiment_summary()
 
-# Now you'll want to continuously monitor your experiment.  To do that from the command line,
-# you should use the WML CLI.
+if "--local" in sys.argv:
+    experiment.wait()
+    experiment.print_experiment_summary()
+
+# Now you'll want to continuously monitor your experiment.  Pass --monitor to follow the training runs
+# until they finish, otherwise use the WML CLI: bx ml monitor training-runs TRAINING_RUN_ID
+if "--monitor" in sys.argv:
+    monitor = ExperimentMonitor(experiment)
+    monitor.on_state_change(lambda run, old_state, new_state, details:
+                            print("%s: %s -> %s" % (run.get_name(), old_state, new_state)))
+    monitor.on_complete(lambda run, state, details:
+                        print("%s finished with state: %s" % (run.get_name(), state)))
+    monitor.watch()
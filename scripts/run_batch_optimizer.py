@@ -0,0 +1,73 @@
+import sys
+import os
+
+source_path = os.path.join("..", "source")
+sys.path.insert(0, source_path)
+from batch_optimizer import BatchOptimizer
+from experiment_utils import Experiment
+from local_experiment import LocalExperiment
+from rbfopt_config import RBFOptConfig
+from project_utils import ProjectUtils
+from watson_studio_utils import WatsonStudioUtils
+
+# Same search as run_rbfopt_hpo.py but optimized on the client so batch_size training runs train in parallel
+# rather than WML's RBFOpt HPO running them one after another
+def get_rbfopt_config():
+
+    run_count = 16
+
+    config = RBFOptConfig(run_count,
+                          RBFOptConfig.OBJECTIVE_ACCURACY,
+                          RBFOptConfig.TIME_INTERVAL_EPOCH,
+                          RBFOptConfig.GOAL_MAXIMIZE)
+    config.add_static_var("batch_size", 128)
+
+    # Fashion MNIST converges around 25 epochs and CIFAR converges after 100 epochs
+    config.add_static_var("epochs", 10)
+
+    config.add_list("optimizer", ["sgd", "adam"])
+
+    config.add_power_range("num_filters_1", 5, 8, 2)  # 32 64 128 256
+    config.add_power_range("num_filters_2", 4, 8, 2)  # 16 32 64 128 256
+    config.add_power_range("num_filters_3", 4, 8, 2)  # 16 32 64 128 256
+    config.add_step_range("filter_size_1", 2, 3, 1)
+    config.add_step_range("filter_size_2", 2, 3, 1)
+    config.add_step_range("filter_size_3", 2, 3, 1)
+    config.add_step_range("pool_size_1", 2, 2, 1)
+    config.add_step_range("pool_size_2", 2, 2, 1)
+    config.add_step_range("pool_size_3", 2, 2, 1)
+    config.add_step_range("dropout_1", 0.1, 0.9, 0.1)
+    config.add_step_range("dropout_2", 0.1, 0.9, 0.1)
+    config.add_step_range("dropout_3", 0.1, 0.9, 0.1)
+    config.add_step_range("dropout_4", 0.1, 0.9, 0.1)
+    config.add_power_range("dense_1", 6, 11, 2)  # 64 128 256 512 1024 2048
+    return config
+
+
+# Pass --local to train on this machine instead of in WML
+is_local = "--local" in sys.argv
+if not is_local:
+    # Initialize various utilities that will make our lives easier
+    studio_utils = WatsonStudioUtils(region="us-south")
+    studio_utils.configure_utilities_from_file()
+    project_utils = ProjectUtils(studio_utils)
+
+framework = "tensorflow"
+version = "1.5"
+experiment_zip = os.path.join("experiment_zips", "dynamic_hyperparms_tf.zip")
+
+def create_experiment(name):
+    if is_local:
+        return LocalExperiment(name, "Batch model based HPO", framework, version, "python", "3.5")
+    return Experiment(name, "Batch model based HPO", framework, version, "python", "3.5",
+                      studio_utils, project_utils)
+
+# The experiment only writes "accuracy" to val_dict_list.json when SUBID is set (as it is for WML's HPO)
+optimizer = BatchOptimizer(create_experiment,
+                           get_rbfopt_config(),
+                           "SUBID=batch python3 experiment.py",
+                           experiment_zip,
+                           gpu_type="k80",
+                           batch_size=4)
+optimizer.run()
+optimizer.print_summary()
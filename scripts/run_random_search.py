@@ -35,8 +35,10 @@ def create_random_search():
     search.add_step_range("dropout_4", 0.1, 0.9, 0.1)
     search.add_power_range("dense_1", 6, 11, 2)  # 64 128 256 512 1024 2048
 
+    # Sample without replacement so no two training runs use the same hyperparameters
     search_count = 5
-    return search.create_random_search(search_count)
+    print("Sampling %d of %d hyperparameter combinations" % (search_count, search.get_cardinality()))
+    return search.create_unique_search(search_count)
 
 # Initialize various utilities that will make our lives easier
 studio_utils = WatsonStudioUtils(region="us-south")
@@ -69,18 +71,21 @@ experiment_zip = os.path.join("experiment_zips", experiment_zip)
 
 # Create random parameters to search then create a training run for each
 search = create_random_search()
+specs = []
 for index, run_params in enumerate(search):
 
-    # Append hyperparameters to the command
-    command = "python3 experiment.py"
-
     # Specify different GPU types as "k80", "k80x2", "k80x4", "p100", ...
-    run_name = "run_%d" % (index + 1)
-
-    # Add the hyperparameters to the experiment.zip (in config.json)
-    updated_experiment_zip = experiment.save_hyperparameters_config(run_params, experiment_zip)
-
-    experiment.add_training_run(run_name, command, updated_experiment_zip, gpu_type)
+    # The hyperparameters are added to each run's copy of the experiment.zip (in config.json)
+    specs.append({
+        "name": "run_%d" % (index + 1),
+        "command": "python3 experiment.py",
+        "experiment_zip": experiment_zip,
+        "gpu_type": gpu_type,
+        "hyperparameters": run_params
+    })
+
+# Build the archives and store the training definitions concurrently
+experiment.add_training_runs(specs)
 
 # Execute experiment
 experiment.execute()
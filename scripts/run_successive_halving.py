@@ -0,0 +1,67 @@
+import sys
+import os
+
+# Add source directory to the path as Python doesn't like sub-directories
+source_path = os.path.join("..", "source")
+sys.path.insert(0, source_path)
+from watson_studio_utils import WatsonStudioUtils
+from random_search import RandomSearch
+from experiment_utils import Experiment
+from local_experiment import LocalExperiment
+from project_utils import ProjectUtils
+from successive_halving import SuccessiveHalving
+
+# Configure the search space.  "epochs" is set by SuccessiveHalving for each rung.
+def create_random_search():
+
+    search = RandomSearch()
+    search.add_static_var("batch_size", 128)
+    search.add_list("optimizer", ["sgd", "adam"])
+
+    search.add_power_range("num_filters_1", 5, 8, 2)  # 32 64 128 256
+    search.add_power_range("num_filters_2", 4, 8, 2)  # 16 32 64 128 256
+    search.add_power_range("num_filters_3", 4, 7, 2)  # 16 32 64 128
+    search.add_step_range("filter_size_1", 2, 3, 1)
+    search.add_step_range("filter_size_2", 2, 3, 1)
+    search.add_step_range("filter_size_3", 2, 3, 1)
+    search.add_step_range("pool_size_1", 2, 2, 1)
+    search.add_step_range("pool_size_2", 2, 2, 1)
+    search.add_step_range("pool_size_3", 2, 2, 1)
+    search.add_step_range("dropout_1", 0.1, 0.9, 0.1)
+    search.add_step_range("dropout_2", 0.1, 0.9, 0.1)
+    search.add_step_range("dropout_3", 0.1, 0.9, 0.1)
+    search.add_step_range("dropout_4", 0.1, 0.9, 0.1)
+    search.add_power_range("dense_1", 6, 11, 2)  # 64 128 256 512 1024 2048
+    return search
+
+# Pass --local to train on this machine instead of in WML
+is_local = "--local" in sys.argv
+if not is_local:
+    # Initialize various utilities that will make our lives easier
+    studio_utils = WatsonStudioUtils(region="us-south")
+    studio_utils.configure_utilities_from_file()
+    project_utils = ProjectUtils(studio_utils)
+
+framework = "tensorflow"
+version = "1.5"
+experiment_zip = os.path.join("experiment_zips", "dynamic_hyperparms_tf.zip")
+
+def create_experiment(name):
+    if is_local:
+        return LocalExperiment(name, "Successive halving search", framework, version, "python", "3.5")
+    return Experiment(name, "Successive halving search", framework, version, "python", "3.5",
+                      studio_utils, project_utils)
+
+# The experiment only writes val_dict_list.json when SUBID is set (as it is for WML's HPO)
+search = SuccessiveHalving(create_experiment,
+                           create_random_search(),
+                           "SUBID=asha python3 experiment.py",
+                           experiment_zip,
+                           gpu_type="k80",
+                           min_epochs=1,
+                           max_epochs=27,
+                           reduction_factor=3,
+                           max_configurations=27,
+                           max_concurrent_runs=9)
+search.run()
+search.print_summary()
@@ -0,0 +1,165 @@
+import asyncio
+import functools
+import threading
+import weakref
+
+from concurrent.futures import ThreadPoolExecutor
+
+from details_cache import DetailsCache
+from request_scheduler import RequestScheduler
+
+
+# Runs blocking calls on a bounded thread pool so they can be awaited from asyncio.  At most max_pending calls
+# are queued or running at once; further calls wait for a free slot which applies back-pressure to the caller
+# instead of growing an unbounded backlog of work.  The limit applies per event loop as asyncio semaphores can't
+# be shared between loops.
+class AsyncExecutor:
+
+    DEFAULT_MAX_WORKERS = 32
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, max_pending=None):
+
+        if max_pending is None:
+            max_pending = max_workers * 4
+
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+
+        # Semaphores by event loop, created on first use in each loop
+        self.semaphores = weakref.WeakKeyDictionary()
+        self.lock = threading.Lock()
+
+    async def run(self, function, *args, **kwargs):
+
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            semaphore = self.semaphores.get(loop)
+            if semaphore is None:
+                semaphore = asyncio.Semaphore(self.max_pending)
+                self.semaphores[loop] = semaphore
+
+        async with semaphore:
+            return await loop.run_in_executor(self.executor, functools.partial(function, *args, **kwargs))
+
+    # Iterate a blocking generator without blocking the event loop.  Each item is fetched on the executor.
+    async def iterate(self, generator):
+
+        done = object()
+        while True:
+            item = await self.run(next, generator, done)
+            if item is done:
+                break
+            yield item
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
+
+
+# asyncio front-end for CosUtils.  Every method runs the matching CosUtils call on a shared AsyncExecutor.
+class AsyncCosUtils:
+
+    def __init__(self, cos_utils, executor=None):
+
+        if executor is None:
+            executor = AsyncExecutor()
+
+        self.cos_utils = cos_utils
+        self.executor = executor
+
+    def get_cos_utils(self):
+        return self.cos_utils
+
+    def get_executor(self):
+        return self.executor
+
+    async def get_all_buckets(self):
+        return await self.executor.run(self.cos_utils.get_all_buckets)
+
+    async def create_bucket(self, bucket):
+        return await self.executor.run(self.cos_utils.create_bucket, bucket)
+
+    async def create_unique_bucket(self, bucket_prefix):
+        return await self.executor.run(self.cos_utils.create_unique_bucket, bucket_prefix)
+
+    async def transfer_remote_file_to_bucket(self, file_url, file_name, bucket, save_directory=None, redownload=False,
+                                             checksum=None):
+        return await self.executor.run(self.cos_utils.transfer_remote_file_to_bucket,
+                                       file_url, file_name, bucket,
+                                       save_directory=save_directory, redownload=redownload, checksum=checksum)
+
+    async def upload_file(self, local_file, bucket, key):
+        return await self.executor.run(self.cos_utils.upload_file, local_file, bucket, key)
+
+    async def download_file(self, bucket, file_to_download, save_file, is_redownload=False, resumable=False):
+        return await self.executor.run(self.cos_utils.download_file, bucket, file_to_download, save_file,
+                                       is_redownload=is_redownload, resumable=resumable)
+
+    async def upload_many(self, files, bucket, max_workers=None):
+        return await self.executor.run(self.cos_utils.upload_many, files, bucket, max_workers=max_workers)
+
+    async def download_many(self, bucket, files, max_workers=None):
+        return await self.executor.run(self.cos_utils.download_many, bucket, files, max_workers=max_workers)
+
+    async def sync_prefix(self, bucket, prefix, local_directory, delete=False, max_workers=None):
+        return await self.executor.run(self.cos_utils.sync_prefix, bucket, prefix, local_directory,
+                                       delete=delete, max_workers=max_workers)
+
+    async def get_all_objects_in_bucket(self, bucket, prefix=None):
+        return await self.executor.run(self.cos_utils.get_all_objects_in_bucket, bucket, prefix=prefix)
+
+    # Async generator over the objects in a bucket.  Pages are still fetched lazily.
+    async def iterate_objects_in_bucket(self, bucket, prefix=None):
+        async for obj in self.executor.iterate(self.cos_utils.iterate_objects_in_bucket(bucket, prefix=prefix)):
+            yield obj
+
+
+# asyncio front-end for the WML client calls used by Experiment.  Calls are scheduled and details cached exactly
+# as Experiment does so pass the RequestScheduler and DetailsCache of the WatsonStudioUtils in use to share their
+# limits and cache with synchronous code.
+class AsyncWmlClient:
+
+    def __init__(self, wml_client, executor=None, scheduler=None, details_cache=None):
+
+        if executor is None:
+            executor = AsyncExecutor()
+        if scheduler is None:
+            scheduler = RequestScheduler()
+        if details_cache is None:
+            details_cache = DetailsCache(wml_client, scheduler=scheduler)
+
+        self.wml_client = wml_client
+        self.executor = executor
+        self.scheduler = scheduler
+        self.details_cache = details_cache
+
+    def get_wml_client(self):
+        return self.wml_client
+
+    def get_executor(self):
+        return self.executor
+
+    def get_request_scheduler(self):
+        return self.scheduler
+
+    def get_details_cache(self):
+        return self.details_cache
+
+    async def store_definition(self, experiment_zip, metadata):
+        return await self.executor.run(self.scheduler.call, RequestScheduler.METADATA,
+                                       self.wml_client.repository.store_definition, experiment_zip, metadata)
+
+    async def store_experiment(self, experiment_metadata):
+        return await self.executor.run(self.scheduler.call, RequestScheduler.METADATA,
+                                       self.wml_client.repository.store_experiment, meta_props=experiment_metadata)
+
+    async def run_experiment(self, experiment_guid):
+        return await self.executor.run(self.scheduler.call, RequestScheduler.RUN_SUBMIT,
+                                       self.wml_client.experiments.run, experiment_guid)
+
+    # max_age limits the age of cached details of unfinished runs as in DetailsCache
+    async def get_run_details(self, experiment_run_guid, max_age=None):
+        return await self.executor.run(self.details_cache.get_run_details, experiment_run_guid, max_age=max_age)
+
+    async def get_training_details(self, training_guid, max_age=None):
+        return await self.executor.run(self.details_cache.get_training_details, training_guid, max_age=max_age)
@@ -0,0 +1,342 @@
+import json
+import time
+
+from experiment_utils import read_objective_history
+from random_search import RandomSearch, _import_numpy
+
+
+# Client side model based optimizer that keeps batch_size training runs in flight rather than running one after
+# another like WML's RBFOpt HPO.  A radial basis function surrogate is fitted to the results so far and new
+# configurations are picked from candidate grid points by trading off the surrogate's prediction against the
+# distance to configurations already tried (Regis and Shoemaker's stochastic response surface method).  Runs that
+# are still training count as results with the mean score so far ("constant liar") which keeps each batch spread
+# out.  Replacements are proposed as soon as any run finishes.
+#
+# search is a RandomSearch or RBFOptConfig.  experiment_factory creates an Experiment (or LocalExperiment) for each
+# batch of training runs, e.g.
+#   lambda name: Experiment(name, "HPO", "tensorflow", "1.5", "python", "3.5", studio_utils, project_utils)
+class BatchOptimizer:
+
+    RESULTS_FILE = "val_dict_list.json"
+
+    TERMINAL_STATES = ["completed", "error", "failed", "canceled"]
+
+    # Seconds a training run may take to be assigned a guid after its experiment was executed.  Runs that time out
+    # are counted as failed and cancelled if their guid still appears later.
+    GUID_TIMEOUT = 600
+
+    # Weight of the surrogate's prediction vs. the distance to tried configurations, cycled through per proposal
+    MERIT_WEIGHTS = [0.3, 0.5, 0.8, 0.95]
+    CANDIDATE_COUNT = 1000
+
+    def __init__(self, experiment_factory, search, command, experiment_zip, gpu_type="k80", batch_size=4,
+                 max_training_runs=None, initial_runs=None, objective=None, goal=None, poll_interval=60, seed=None):
+
+        if hasattr(search, "get_random_search"):
+            # RBFOptConfig
+            if max_training_runs is None:
+                max_training_runs = search.get_training_run_count()
+            objective = objective if objective is not None else search.get_objective()
+            goal = goal if goal is not None else search.get_goal()
+            search = search.get_random_search(seed=seed)
+
+        objective = objective if objective is not None else "accuracy"
+        goal = goal if goal is not None else "maximize"
+        if goal not in ["maximize", "minimize"]:
+            raise ValueError("Invalid goal.  Must be 'maximize' or 'minimize'")
+        if max_training_runs is None:
+            raise ValueError("max_training_runs is required")
+
+        self.experiment_factory = experiment_factory
+        self.random_search = search
+        self.command = command
+        self.experiment_zip = experiment_zip
+        self.gpu_type = gpu_type
+        self.batch_size = batch_size
+        self.max_training_runs = max_training_runs
+        self.initial_runs = initial_runs if initial_runs is not None else batch_size
+        self.objective = objective
+        self.goal = goal
+        self.poll_interval = poll_interval
+
+        self.search_space = search.get_search_space()
+        self.categorical = [name in search.hpo_lists for name in self.search_space.get_names()]
+        self.trials = []
+        self.experiments = []
+        self.proposal_count = 0
+
+    def get_trials(self):
+        return self.trials
+
+    # Submit, poll and propose training runs until max_training_runs have finished.  Returns the best trial.
+    def run(self):
+
+        start = time.time()
+        while True:
+            self.__cancel_timed_out_runs()
+            for trial in self.__get_active_trials():
+                self.__update_trial(trial)
+
+            count = min(self.batch_size - len(self.__get_active_trials()),
+                        self.max_training_runs - len(self.trials),
+                        self.search_space.get_cardinality() - len(self.trials))
+            proposals = self.propose(count) if count > 0 else []
+            if len(proposals) > 0:
+                self.__submit(proposals)
+            elif len(self.__get_active_trials()) == 0:
+                break
+            else:
+                time.sleep(self.poll_interval)
+
+        self.__cancel_timed_out_runs()
+        for trial in [trial for trial in self.trials if trial["timed_out"]]:
+            print("Training run %s still has no guid, it may need to be cancelled once it starts" %
+                  trial["run"].get_name())
+
+        print("Batch optimization finished in %.0f seconds with %d training runs" %
+              (time.time() - start, len(self.trials)))
+        return self.get_best_trial()
+
+    # Propose count new configurations as value indices, one row per configuration
+    def propose(self, count):
+
+        np = _import_numpy()
+
+        tried = set(tuple(trial["indices"]) for trial in self.trials)
+        scored = [trial for trial in self.trials if trial["score"] is not None]
+
+        if len(scored) < max(self.initial_runs, 2):
+            # Space filling design until there's something to model
+            proposals = []
+            for indices in self.random_search.create_indices(count * 4, RandomSearch.STRATEGY_LATIN_HYPERCUBE):
+                if tuple(indices) not in tried and len(proposals) < count:
+                    tried.add(tuple(indices))
+                    proposals.append(indices)
+            while len(proposals) < count:
+                proposals.append(self.__get_new_candidates(1, tried)[0])
+                tried.add(tuple(proposals[-1]))
+            return np.array(proposals, dtype=np.int64)
+
+        # Scores are minimized internally
+        sign = -1 if self.goal == "maximize" else 1
+        points = [self.__encode(np.array(trial["indices"])[np.newaxis, :])[0] for trial in scored]
+        values = [sign * trial["score"] for trial in scored]
+        lie = float(np.mean(values))
+        pending = [self.__encode(np.array(trial["indices"])[np.newaxis, :])[0] for trial in self.trials
+                   if trial["score"] is None and trial["state"] not in BatchOptimizer.TERMINAL_STATES]
+
+        best = np.array(scored[int(np.argmin(values))]["indices"])
+        proposals = []
+        for _ in range(count):
+            candidates = self.__get_candidates(best, tried)
+            if len(candidates) == 0:
+                break
+
+            known = np.array(points + pending)
+            surrogate = _RbfSurrogate(known, np.array(values + [lie] * len(pending)))
+            encoded = self.__encode(candidates)
+            predictions = surrogate.predict(encoded)
+            distances = np.min(np.linalg.norm(encoded[:, np.newaxis, :] - known[np.newaxis, :, :], axis=2), axis=1)
+
+            weight = BatchOptimizer.MERIT_WEIGHTS[self.proposal_count % len(BatchOptimizer.MERIT_WEIGHTS)]
+            self.proposal_count += 1
+            merit = weight * _scale(predictions) + (1 - weight) * (1 - _scale(distances))
+            choice = candidates[int(np.argmin(merit))]
+
+            proposals.append(choice)
+            tried.add(tuple(choice))
+            pending.append(self.__encode(choice[np.newaxis, :])[0])
+
+        return np.array(proposals, dtype=np.int64).reshape(len(proposals), len(self.categorical))
+
+    def get_best_trial(self):
+        scored = [trial for trial in self.trials if trial["score"] is not None]
+        if len(scored) == 0:
+            return None
+        if self.goal == "maximize":
+            return max(scored, key=lambda trial: trial["score"])
+        return min(scored, key=lambda trial: trial["score"])
+
+    def get_summary(self):
+
+        summary = {"training_runs": []}
+        for trial in self.trials:
+            summary["training_runs"].append({"name": trial["run"].get_name(), "guid": trial["run"].get_guid(),
+                                             "state": trial["state"], "score": trial["score"],
+                                             "hyperparameters": trial["hyperparameters"]})
+        best = self.get_best_trial()
+        if best is not None:
+            summary["best"] = {"name": best["run"].get_name(), "score": best["score"],
+                               "hyperparameters": best["hyperparameters"]}
+        return summary
+
+    def print_summary(self):
+        print("\n**** Batch Optimizer Summary Start ****\n%s" % json.dumps(self.get_summary(), indent=2))
+        print("**** Batch Optimizer Summary End ****\n\n")
+
+    def __get_active_trials(self):
+        return [trial for trial in self.trials if trial["state"] not in BatchOptimizer.TERMINAL_STATES]
+
+    # Candidates are half random grid points and half perturbations of the best configuration so far
+    def __get_candidates(self, best, tried):
+
+        np = _import_numpy()
+
+        radices = self.search_space.get_radices()
+        generator = self.random_search.get_generator()
+
+        perturbed = np.tile(best, (BatchOptimizer.CANDIDATE_COUNT // 2, 1))
+        changes = generator.random(perturbed.shape) < max(1.0 / len(radices), 0.2)
+        steps = generator.choice([-2, -1, 1, 2], size=perturbed.shape)
+        categorical = np.array(self.categorical)
+        perturbed = np.where(changes & ~categorical, np.clip(perturbed + steps, 0, radices - 1), perturbed)
+        perturbed = np.where(changes & categorical, generator.integers(0, radices, size=perturbed.shape), perturbed)
+
+        random_candidates = self.random_search.create_random_indices(BatchOptimizer.CANDIDATE_COUNT // 2)
+        candidates = np.vstack([perturbed, random_candidates])
+        unique = {}
+        for candidate in candidates:
+            if tuple(candidate) not in tried:
+                unique[tuple(candidate)] = candidate
+        if len(unique) == 0:
+            return self.__get_new_candidates(1, tried) if self.__has_untried(tried) else np.zeros((0, len(radices)))
+        return np.array(list(unique.values()), dtype=np.int64)
+
+    def __get_new_candidates(self, count, tried):
+
+        np = _import_numpy()
+
+        candidates = []
+        while len(candidates) < count:
+            if not self.__has_untried(tried):
+                raise ValueError("All %d configurations have been tried" % self.search_space.get_cardinality())
+            indices = self.random_search.create_random_indices(1)[0]
+            if tuple(indices) not in tried:
+                candidates.append(indices)
+        return np.array(candidates, dtype=np.int64)
+
+    def __has_untried(self, tried):
+        return len(tried) < self.search_space.get_cardinality()
+
+    # Scale value indices to [0, 1] and one-hot encode lists
+    def __encode(self, indices):
+
+        np = _import_numpy()
+
+        radices = self.search_space.get_radices()
+        columns = []
+        for column, radix in enumerate(radices.tolist()):
+            if self.categorical[column]:
+                columns.append(np.eye(radix)[indices[:, column]])
+            else:
+                columns.append((indices[:, column] / max(radix - 1, 1))[:, np.newaxis])
+        return np.hstack(columns)
+
+    def __submit(self, proposals):
+
+        hyperparameters = self.search_space.get_hyperparameters(proposals)
+        first = len(self.trials) + 1
+        specs = [{"name": "bo-%d" % (first + index),
+                  "command": self.command,
+                  "experiment_zip": self.experiment_zip,
+                  "gpu_type": self.gpu_type,
+                  "hyperparameters": values} for index, values in enumerate(hyperparameters)]
+
+        experiment = self.experiment_factory("Batch optimizer batch %d" % (len(self.experiments) + 1))
+        self.experiments.append(experiment)
+        experiment.add_training_runs(specs)
+        experiment.execute()
+
+        runs = {run.get_name(): run for run in experiment.get_training_runs()}
+        for indices, values, spec in zip(proposals, hyperparameters, specs):
+            trial = {"indices": indices.tolist(), "hyperparameters": values, "run": runs[spec["name"]],
+                     "experiment": experiment, "submitted": time.time(), "state": "pending", "score": None,
+                     "timed_out": False}
+            self.trials.append(trial)
+        print("Submitted %d training runs" % len(specs))
+
+    # Cancel runs that timed out waiting for their guid as soon as it appears so they don't keep training unseen
+    def __cancel_timed_out_runs(self):
+
+        for trial in [trial for trial in self.trials if trial["timed_out"]]:
+            if trial["run"].get_guid() is None:
+                trial["experiment"].get_training_statuses(max_age=self.poll_interval)
+            if trial["run"].get_guid() is not None:
+                print("Cancelling training run %s which started after it timed out" % trial["run"].get_name())
+                trial["timed_out"] = False
+                trial["run"].cancel()
+
+    def __update_trial(self, trial):
+
+        # Runs that started slowly get their guid from the experiment run details
+        if trial["run"].get_guid() is None:
+            trial["experiment"].get_training_statuses()
+            if trial["run"].get_guid() is None:
+                if time.time() - trial["submitted"] > BatchOptimizer.GUID_TIMEOUT:
+                    print("Training run %s has no guid after %d seconds" %
+                          (trial["run"].get_name(), BatchOptimizer.GUID_TIMEOUT))
+                    trial["state"] = "failed"
+                    trial["timed_out"] = True
+                return
+
+        details = trial["run"].get_details()
+        trial["state"] = details["entity"]["status"]["state"] if details is not None else "failed"
+        if trial["state"] not in BatchOptimizer.TERMINAL_STATES:
+            return
+
+        history = read_objective_history(trial["run"], self.objective, BatchOptimizer.RESULTS_FILE)
+        if len(history) > 0:
+            trial["score"] = max(history.values()) if self.goal == "maximize" else min(history.values())
+            print("%s finished with %s %.4f" % (trial["run"].get_name(), self.objective, trial["score"]))
+        else:
+            print("Training run %s finished (%s) without results" % (trial["run"].get_name(), trial["state"]))
+
+
+# Radial basis function interpolant with a cubic kernel and linear tail (the model RBFOpt uses by default)
+class _RbfSurrogate:
+
+    SMOOTHING = 1e-6
+
+    def __init__(self, points, values):
+
+        np = _import_numpy()
+
+        self.points = points
+        self.mean = np.mean(values)
+        self.scale = np.std(values) if np.std(values) > 0 else 1.0
+        scaled = (values - self.mean) / self.scale
+
+        count, dimensions = points.shape
+        kernel = self.__kernel(points) + _RbfSurrogate.SMOOTHING * np.eye(count)
+        tail = np.hstack([np.ones((count, 1)), points])
+        system = np.block([[kernel, tail], [tail.T, np.zeros((dimensions + 1, dimensions + 1))]])
+        rhs = np.concatenate([scaled, np.zeros(dimensions + 1)])
+
+        # Least squares as there are usually fewer results than dimensions
+        solution = np.linalg.lstsq(system, rhs, rcond=None)[0]
+        self.weights = solution[:count]
+        self.coefficients = solution[count:]
+
+    def predict(self, points):
+
+        np = _import_numpy()
+
+        tail = np.hstack([np.ones((len(points), 1)), points])
+        scaled = self.__kernel(points) @ self.weights + tail @ self.coefficients
+        return scaled * self.scale + self.mean
+
+    def __kernel(self, points):
+
+        np = _import_numpy()
+
+        distances = np.linalg.norm(points[:, np.newaxis, :] - self.points[np.newaxis, :, :], axis=2)
+        return distances ** 3
+
+
+# Scale values to [0, 1]
+def _scale(values):
+
+    value_range = values.max() - values.min()
+    if value_range == 0:
+        return values * 0
+    return (values - values.min()) / value_range
@@ -1,16 +1,39 @@
-import ibm_boto3
+import hashlib
+import json
 import os
+import queue
 import random
+import shutil
 import string
 import sys
+import threading
+import time
 import urllib.request
 
-from ibm_botocore.client import Config
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from request_scheduler import RequestScheduler, get_status_code
 
 
 class CosUtils:
 
-    def __init__(self, cos_credentials, region):
+    # Default transfer settings.  Objects larger than the part size are split into parts that are sent over
+    # max_concurrency threads while bulk transfers run max_workers objects at once.
+    DEFAULT_PART_SIZE = 8 * 1024 * 1024
+    DEFAULT_MAX_CONCURRENCY = 10
+    DEFAULT_MAX_WORKERS = 8
+
+    SYNC_MANIFEST_FILE = ".cos_sync_manifest.json"
+    CHECKSUM_METADATA_KEY = "checksum"
+
+    # Requests are authenticated with IAM unless the credentials set "auth_method" to "hmac", in which case they're
+    # signed with the credentials' cos_hmac_keys (used by the LocalCosServer in local_services.py)
+    AUTH_METHOD_KEY = "auth_method"
+    AUTH_METHOD_HMAC = "hmac"
+
+    # If a TokenCache is provided, IAM tokens are shared with other processes through the cache rather than
+    # requested by every new client.  All requests are routed through the RequestScheduler (a private one unless
+    # provided) which rate limits them and retries throttled requests.
+    def __init__(self, cos_credentials, region, token_cache=None, scheduler=None):
 
         if region is None:
             self.region = "us-south"
@@ -19,7 +42,10 @@ class CosUtils:
 
         self.cos_credentials = cos_credentials
         self.cos_credentials["ibm_auth_endpoint"] = 'https://iam.ng.bluemix.net/oidc/token'
-        if "us-south" in self.region:
+        if "cos_service_endpoint" in self.cos_credentials:
+            # Explicit endpoint, e.g. a private endpoint or the LocalCosServer in local_services.py
+            pass
+        elif "us-south" in self.region:
             self.cos_credentials["cos_service_endpoint"] = 'https://s3-api.us-geo.objectstorage.softlayer.net'
         elif "eu-gb" in self.region:
             self.cos_credentials["cos_service_endpoint"] = 'https://s3.eu-geo.objectstorage.service.networklayer.com'
@@ -27,21 +53,119 @@ class CosUtils:
             raise ValueError("Region not recognized: %s. Acceptable values are `us-south` or `eu-gb`" % self.region)
 
         print("cos_service_endpoint: %s" % self.cos_credentials["cos_service_endpoint"])
-        self.cos_client = ibm_boto3.client('s3',
-                                           ibm_api_key_id=self.cos_credentials["apikey"],
-                                           ibm_service_instance_id=self.cos_credentials["resource_instance_id"],
-                                           ibm_auth_endpoint="https://iam.ng.bluemix.net/oidc/token",
-                                           config=Config(signature_version="oauth"),
-                                           endpoint_url=self.cos_credentials["cos_service_endpoint"])
+
+        # ibm_boto3 is slow to import so the client is only created the first time it's used
+        self.__cos_client = None
+        self.__transfer_config = None
+        self.__client_lock = threading.Lock()
+        self.download_cache = None
+        self.token_cache = token_cache
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.set_transfer_config()
+
+    # Configure multipart transfers.  part_size is the size in bytes of each part, max_concurrency the number of
+    # threads used for the parts of a single object and max_workers the number of objects transferred at once
+    # by upload_many() and download_many().
+    def set_transfer_config(self, part_size=DEFAULT_PART_SIZE, max_concurrency=DEFAULT_MAX_CONCURRENCY,
+                            max_workers=DEFAULT_MAX_WORKERS):
+
+        if part_size < 5 * 1024 * 1024:
+            raise ValueError("Part size must be at least 5MB: %d" % part_size)
+        if max_concurrency < 1 or max_workers < 1:
+            raise ValueError("max_concurrency and max_workers must be at least 1")
+
+        with self.__client_lock:
+            self.part_size = part_size
+            self.max_concurrency = max_concurrency
+            self.max_workers = max_workers
+
+            # Recreated on next use with the new settings
+            self.__cos_client = None
+            self.__transfer_config = None
+
+    @property
+    def cos_client(self):
+        if self.__cos_client is None:
+            with self.__client_lock:
+                if self.__cos_client is None:
+                    # All transfers share a single client so its connection pool must be large enough for every
+                    # part of every object in flight.
+                    self.__cos_client = self.__create_client(self.max_workers * self.max_concurrency)
+        return self.__cos_client
+
+    @property
+    def transfer_config(self):
+        if self.__transfer_config is None:
+            from ibm_boto3.s3.transfer import TransferConfig
+
+            self.__transfer_config = TransferConfig(multipart_threshold=self.part_size,
+                                                    multipart_chunksize=self.part_size,
+                                                    max_concurrency=self.max_concurrency,
+                                                    use_threads=self.max_concurrency > 1)
+        return self.__transfer_config
+
+    def __create_client(self, max_pool_connections):
+        import ibm_boto3
+        from ibm_botocore.client import Config
+
+        if self.cos_credentials.get(CosUtils.AUTH_METHOD_KEY) == CosUtils.AUTH_METHOD_HMAC:
+            # HMAC requests are signed locally so no IAM token is needed
+            return ibm_boto3.client('s3',
+                                    aws_access_key_id=self.cos_credentials["cos_hmac_keys"]["access_key_id"],
+                                    aws_secret_access_key=self.cos_credentials["cos_hmac_keys"]["secret_access_key"],
+                                    config=Config(signature_version="s3v4", max_pool_connections=max_pool_connections,
+                                                  s3={"addressing_style": "path"}),
+                                    region_name=self.region,
+                                    endpoint_url=self.cos_credentials["cos_service_endpoint"])
+
+        return ibm_boto3.client('s3',
+                                ibm_api_key_id=self.cos_credentials["apikey"],
+                                ibm_service_instance_id=self.cos_credentials["resource_instance_id"],
+                                ibm_auth_endpoint="https://iam.ng.bluemix.net/oidc/token",
+                                auth_function=self.__get_iam_token if self.token_cache is not None else None,
+                                config=Config(signature_version="oauth", max_pool_connections=max_pool_connections),
+                                endpoint_url=self.cos_credentials["cos_service_endpoint"])
+
+    # Token of the COS client from the shared TokenCache
+    def __get_iam_token(self):
+        return self.token_cache.get_iam_token(self.cos_credentials["apikey"], self.cos_credentials["ibm_auth_endpoint"])
+
     def get_cos_client(self):
         return self.cos_client
 
+    def get_transfer_config(self):
+        return self.transfer_config
+
+    def get_request_scheduler(self):
+        return self.scheduler
+
+    def __call(self, function, *args, **kwargs):
+        return self.scheduler.call(RequestScheduler.COS_DATA, function, *args, **kwargs)
+
+    # Serve repeated downloads from a DownloadCache.  Each download is revalidated with a HEAD request and only
+    # objects whose ETag changed are fetched again.
+    def set_download_cache(self, download_cache):
+        self.download_cache = download_cache
+
+    def get_download_cache(self):
+        return self.download_cache
+
     def get_all_buckets(self):
-        response = self.cos_client.list_buckets()
+        response = self.__call(self.cos_client.list_buckets)
         return [bucket['Name'] for bucket in response['Buckets']]
 
     def get_objects_in_bucket(self,bucket_name):
-        return self.cos_client.list_objects(Bucket=bucket_name)
+        return self.__call(self.cos_client.list_objects, Bucket=bucket_name)
+
+    # Read a small object, e.g. a training run's val_dict_list.json, into memory.  Returns None if it doesn't exist.
+    def get_object_content(self, bucket, key):
+        try:
+            response = self.__call(self.cos_client.get_object, Bucket=bucket, Key=key)
+        except Exception as err:
+            if get_status_code(err) == 404:
+                return None
+            raise
+        return response["Body"].read()
 
     # Cloud Object Storage (like all object stores) requires that all bucket names be globally unique.  Yes...that's
     # an od quirk but it's the reason object stores are cheap and can scale to terabytes of data.  So we now
@@ -58,68 +182,523 @@ class CosUtils:
 
     def create_bucket(self, bucket):
 
-        self.cos_client.create_bucket(Bucket=bucket)
+        self.__call(self.cos_client.create_bucket, Bucket=bucket)
         print('Bucket created: %s' % bucket)
 
-    # Download file from a URL then upload to the given COS bucket
-    def transfer_remote_file_to_bucket(self, file_url, file_name, bucket, save_directory=None, redownload=False):
+    # Download file from a URL then upload to the given COS bucket.  Unless a save_directory is provided, the HTTP
+    # response is streamed straight into a multipart upload so the file never touches local disk.
+    #
+    # If a checksum ("<algorithm>:<hex digest>", e.g. "sha256:9f86...") is provided, the data is verified while it
+    # streams through and the checksum is stored in the object's metadata so is_object_valid() can later confirm
+    # the upload with a single HEAD request.
+    def transfer_remote_file_to_bucket(self, file_url, file_name, bucket, save_directory=None, redownload=False,
+                                       checksum=None):
 
-        # If save directory provided then don't delete local downloads
-        working_directory = "temp_cos_files"
-        if save_directory is not None:
-            working_directory = save_directory
+        if save_directory is None:
+            self.stream_remote_file_to_bucket(file_url, file_name, bucket, checksum=checksum)
+            return
 
-        os.makedirs(working_directory, exist_ok=True)
+        # If save directory provided then don't delete local downloads
+        os.makedirs(save_directory, exist_ok=True)
 
         # Delete file if present as perhaps download failed and file corrupted
-        is_downloaded = False
-        file_path = os.path.join(working_directory, file_name)
+        file_path = os.path.join(save_directory, file_name)
         if os.path.exists(file_path):
-            if redownload:
-                os.remove(file_path)
+            if not redownload and (checksum is None or _get_file_checksum(file_path, checksum) == checksum):
+                print("Uploading %s to bucket: %s" % (file_name, bucket))
+                self.__call(self.cos_client.upload_file, file_path, bucket, file_name,
+                            Config=self.transfer_config, ExtraArgs=_get_checksum_args(checksum))
+                return
+            os.remove(file_path)
+
+        # Stream the upload while also saving a local copy
+        self.stream_remote_file_to_bucket(file_url, file_name, bucket, save_file=file_path, checksum=checksum)
+
+    # Pipe the body of an HTTP response into a multipart upload.  The upload reads one part at a time from the
+    # response while earlier parts are still being sent, so downloading and uploading overlap and memory use is
+    # bounded by the part size times the number of parts in flight regardless of the size of the file.
+    def stream_remote_file_to_bucket(self, file_url, file_name, bucket, save_file=None, checksum=None):
+
+        print("Streaming %s to bucket: %s" % (file_name, bucket))
+        with urllib.request.urlopen(file_url) as response:
+            if save_file is None:
+                stream = _CountingReader(response, checksum=checksum)
+                # The response can only be read once so a failed upload can't be retried
+                self.__call(self.cos_client.upload_fileobj, stream, bucket, file_name, max_retries=0,
+                            Config=self.transfer_config, ExtraArgs=_get_checksum_args(checksum))
+                self.__verify_checksum(stream, bucket, file_name)
             else:
-                is_downloaded = True
+                # Write to a temp file first so an interrupted transfer never leaves a partial file behind
+                temp_file = save_file + ".download"
+                try:
+                    with open(temp_file, "wb") as file:
+                        stream = _CountingReader(response, file, checksum=checksum)
+                        self.__call(self.cos_client.upload_fileobj, stream, bucket, file_name, max_retries=0,
+                                    Config=self.transfer_config, ExtraArgs=_get_checksum_args(checksum))
+                    self.__verify_checksum(stream, bucket, file_name)
+                    os.replace(temp_file, save_file)
+                except:
+                    if os.path.exists(temp_file):
+                        os.remove(temp_file)
+                    raise
 
-        if not is_downloaded:
-            file_path, _ = urllib.request.urlretrieve(file_url, file_path)
-            stat_info = os.stat(file_path)
-            print('Downloaded', file_name, stat_info.st_size, 'bytes.')
+        print('Transferred', file_name, stream.bytes_read, 'bytes.')
+        return stream.bytes_read
 
-        print("Uploading %s to bucket: %s" % (file_name,bucket))
-        self.cos_client.upload_file(file_path, bucket, file_name)
+    def __verify_checksum(self, stream, bucket, file_name):
 
-        # If user provided a save_directory then don't delete the local downloads.
-        if save_directory is None:
-            if not os.path.exists(file_path):
-                os.remove(file_path)
-                # Don't delete the download directory itself as calls to this method could be multi-threaded
+        if stream.checksum is not None and stream.get_checksum() != stream.checksum:
+            # Never leave corrupted data behind in the bucket
+            self.__call(self.cos_client.delete_object, Bucket=bucket, Key=file_name)
+            raise ValueError("Checksum mismatch for %s: expected %s but received %s" %
+                             (file_name, stream.checksum, stream.get_checksum()))
+
+    # Check with a HEAD request whether an object exists with the expected size and the checksum stored in its
+    # metadata by transfer_remote_file_to_bucket()
+    def is_object_valid(self, bucket, key, size=None, checksum=None):
+
+        try:
+            head = self.__call(self.cos_client.head_object, Bucket=bucket, Key=key)
+        except Exception as err:
+            if get_status_code(err) == 404:
+                return False
+            raise
+
+        if size is not None and head["ContentLength"] != size:
+            return False
+        if checksum is not None and head.get("Metadata", {}).get(CosUtils.CHECKSUM_METADATA_KEY) != checksum:
+            return False
+        return True
 
     def get_all_objects_in_bucket(self, bucket, prefix=None):
+        return list(self.iterate_objects_in_bucket(bucket, prefix=prefix))
 
-        all_objects = []
-        response = self.cos_client.list_objects(Bucket=bucket, Prefix=prefix)
-        while response['IsTruncated'] is True:
-            # Hit max response limit so get next set of objects
-            all_objects = all_objects + response['Contents']
-            response = self.cos_client.list_objects(Bucket=bucket, Marker=response['NextMarker'])
-        all_objects = all_objects + response['Contents']
-        return all_objects
+    # Lazily iterate over the objects in a bucket using ListObjectsV2.  Each page is only requested once the caller
+    # has consumed the previous one so memory stays flat even for buckets with millions of objects.
+    def iterate_objects_in_bucket(self, bucket, prefix=None, page_size=1000):
+        for page in self.__iterate_pages(bucket, prefix=prefix, page_size=page_size):
+            for obj in page.get("Contents", []):
+                yield obj
 
-    def download_file(self, bucket, file_to_download, save_file, is_redownload=False):
+    # Return the "directories" directly below the prefix, e.g. the training run guids of a results bucket
+    def get_common_prefixes(self, bucket, prefix=None, delimiter="/"):
+        common_prefixes = []
+        for page in self.__iterate_pages(bucket, prefix=prefix, delimiter=delimiter):
+            common_prefixes.extend([common_prefix["Prefix"] for common_prefix in page.get("CommonPrefixes", [])])
+        return common_prefixes
+
+    # Iterate over the objects in a bucket by listing several prefixes in parallel.  If prefixes is not provided
+    # then the bucket is split on the delimiter one level below prefix (e.g. one listing per training run).
+    # Objects are yielded as each page arrives so the order is not deterministic.
+    def iterate_objects_in_bucket_parallel(self, bucket, prefix=None, prefixes=None, delimiter="/",
+                                           max_workers=None, page_size=1000):
+
+        if max_workers is None:
+            max_workers = self.max_workers
+
+        if prefixes is None:
+            prefixes = []
+            for page in self.__iterate_pages(bucket, prefix=prefix, delimiter=delimiter, page_size=page_size):
+                # Objects stored directly at this level aren't part of any sub-prefix
+                for obj in page.get("Contents", []):
+                    yield obj
+                prefixes.extend([common_prefix["Prefix"] for common_prefix in page.get("CommonPrefixes", [])])
+
+        if len(prefixes) == 0:
+            return
+
+        # Workers hand pages back through a bounded queue so a slow consumer applies back-pressure to the listing
+        pages = queue.Queue(maxsize=max_workers * 2)
+        stopped = threading.Event()
+        done = object()
+
+        def put(item):
+            while not stopped.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    pass
 
-        end_of_path = save_file.rfind(os.sep)
-        save_path = save_file[0:end_of_path]
-        os.makedirs(save_path, exist_ok=True)
+        def list_prefix(sub_prefix):
+            try:
+                for page in self.__iterate_pages(bucket, prefix=sub_prefix, page_size=page_size):
+                    if stopped.is_set():
+                        break
+                    put(page.get("Contents", []))
+            except Exception as err:
+                put(err)
+            finally:
+                put(done)
+
+        executor = ThreadPoolExecutor(max_workers=max_workers)
+        try:
+            for sub_prefix in prefixes:
+                executor.submit(list_prefix, sub_prefix)
+
+            remaining = len(prefixes)
+            while remaining > 0:
+                item = pages.get()
+                if item is done:
+                    remaining -= 1
+                elif isinstance(item, Exception):
+                    raise item
+                else:
+                    for obj in item:
+                        yield obj
+        finally:
+            stopped.set()
+            executor.shutdown(wait=False)
+
+    def __iterate_pages(self, bucket, prefix=None, delimiter=None, page_size=1000):
+
+        request = {"Bucket": bucket, "MaxKeys": page_size}
+        if prefix is not None:
+            request["Prefix"] = prefix
+        if delimiter is not None:
+            request["Delimiter"] = delimiter
+
+        while True:
+            response = self.__call(self.cos_client.list_objects_v2, **request)
+            yield response
+
+            # Hit max response limit so get next set of objects.  Prefix and Delimiter are sent with every page.
+            if not response.get("IsTruncated", False):
+                break
+            request["ContinuationToken"] = response["NextContinuationToken"]
+
+    # Download an object to a local file.  With resumable=True the object is fetched in byte ranges and a failed
+    # download keeps its progress so calling download_file() again only fetches the missing ranges.
+    def download_file(self, bucket, file_to_download, save_file, is_redownload=False, resumable=False):
+
+        save_path = os.path.dirname(save_file)
+        if len(save_path) > 0:
+            os.makedirs(save_path, exist_ok=True)
 
         if not os.path.exists(save_file) or is_redownload:
-            with open(save_file, 'wb') as file:
-                print("Downloading %s" % file_to_download)  # "\r" allows us to overwrite the same line
+            if self.download_cache is not None:
+                self.__download_file_with_cache(bucket, file_to_download, save_file, resumable)
+                return
+
+            print("Downloading %s" % file_to_download)
+            try:
+                if resumable:
+                    self.download_file_resumable(bucket, file_to_download, save_file)
+                else:
+                    with open(save_file, 'wb') as file:
+                        self.__call(self.cos_client.download_fileobj, bucket, file_to_download, file, max_retries=0,
+                                    Config=self.transfer_config)
+            except:
+                e = sys.exc_info()[0]
+                print('An error occured downloading %s from %s' % (file_to_download, bucket))
+                print("Detailed error: ", e)
+                if not resumable and os.path.exists(save_file):
+                    os.remove(save_file)
+
+    # Download an object with HTTP Range requests into a preallocated "<save_file>.part" file.  Ranges of part_size
+    # bytes are fetched by max_workers threads and written in place with positional writes.  Completed ranges are
+    # recorded in a "<save_file>.part.json" checkpoint so an interrupted download resumes where it stopped.  The
+    # checkpoint is discarded if the object changed (different ETag) since the download started.  If etag is given
+    # the download fails unless the object still has that ETag.
+    def download_file_resumable(self, bucket, file_to_download, save_file, part_size=None, max_workers=None,
+                                etag=None):
+
+        if part_size is None:
+            part_size = self.part_size
+        if max_workers is None:
+            max_workers = self.max_concurrency
+
+        head = self.__call(self.cos_client.head_object, Bucket=bucket, Key=file_to_download)
+        size = head["ContentLength"]
+        if etag is not None and head["ETag"] != etag:
+            raise ValueError("%s changed while downloading: ETag %s is now %s" % (file_to_download, etag, head["ETag"]))
+        etag = head["ETag"]
+
+        os.makedirs(os.path.dirname(save_file) or ".", exist_ok=True)
+        partial_file = save_file + ".part"
+        checkpoint_file = partial_file + ".json"
+        checkpoint = None
+        if os.path.exists(checkpoint_file) and os.path.exists(partial_file):
+            with open(checkpoint_file) as json_data:
+                checkpoint = json.load(json_data)
+            if checkpoint["etag"] != etag or checkpoint["size"] != size or checkpoint["part_size"] != part_size \
+                    or os.path.getsize(partial_file) != size:
+                print("Remote file changed, restarting download of %s" % file_to_download)
+                checkpoint = None
+
+        if checkpoint is None:
+            checkpoint = {"etag": etag, "size": size, "part_size": part_size, "completed": []}
+            with open(partial_file, "wb") as file:
+                file.truncate(size)
+        else:
+            print("Resuming download of %s: %d of %d parts already downloaded" %
+                  (file_to_download, len(checkpoint["completed"]), (size + part_size - 1) // part_size))
+
+        completed = set(checkpoint["completed"])
+        starts = [start for start in range(0, size, part_size) if start not in completed]
+        lock = threading.Lock()
+
+        def save_checkpoint():
+            temp_file = checkpoint_file + ".tmp"
+            with open(temp_file, "w") as outfile:
+                json.dump(checkpoint, outfile)
+            os.replace(temp_file, checkpoint_file)
+
+        fd = os.open(partial_file, os.O_RDWR | getattr(os, "O_BINARY", 0))
+        try:
+            def download_range(start):
+                end = min(start + part_size, size) - 1
+                response = self.__call(self.cos_client.get_object, Bucket=bucket, Key=file_to_download,
+                                       Range="bytes=%d-%d" % (start, end), IfMatch=etag)
+                offset = start
+                for chunk in iter(lambda: response["Body"].read(1024 * 1024), b""):
+                    offset += _write_at(fd, chunk, offset)
+                if offset != end + 1:
+                    raise IOError("Incomplete range %d-%d of %s" % (start, end, file_to_download))
+
+                with lock:
+                    checkpoint["completed"].append(start)
+                    save_checkpoint()
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                for future in [executor.submit(download_range, start) for start in starts]:
+                    future.result()
+        finally:
+            os.close(fd)
+
+        os.replace(partial_file, save_file)
+        if os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+
+    def __download_file_with_cache(self, bucket, file_to_download, save_file, resumable=False):
+
+        try:
+            etag = self.__call(self.cos_client.head_object, Bucket=bucket, Key=file_to_download)["ETag"]
+            if self.download_cache.copy(bucket, file_to_download, etag, save_file):
+                print("Unchanged, using cached copy of %s" % file_to_download)
+                return
+
+            print("Downloading %s" % file_to_download)
+            # The download must be of the version the ETag was read for, otherwise newer bytes would be
+            # cached under the old ETag
+            if resumable:
+                # A partial download of this version is resumed by the next call
+                temp_file = self.download_cache.get_partial_file(bucket, file_to_download, etag)
+                self.download_file_resumable(bucket, file_to_download, temp_file, etag=etag)
+            else:
+                temp_file = self.download_cache.get_temp_file()
                 try:
-                    self.cos_client.download_fileobj(bucket, file_to_download, file)
+                    self.__download_version(bucket, file_to_download, temp_file, etag)
                 except:
-                    e = sys.exc_info()[0]
-                    print('An error occured downloading %s from %s' % (file_to_download, bucket))
-                    print("Detailed error: ", e)
+                    if os.path.exists(temp_file):
+                        os.remove(temp_file)
+                    raise
+            self.download_cache.add(bucket, file_to_download, etag, temp_file, copy_to=save_file)
+        except Exception as err:
+            print('An error occured downloading %s from %s' % (file_to_download, bucket))
+            print("Detailed error: %s: %s" % (type(err).__name__, err))
+
+    # Stream one version of an object to a local file.  download_file() can't be used as the transfer manager
+    # doesn't accept IfMatch, so the object is read with a single conditional GET.
+    def __download_version(self, bucket, file_to_download, save_file, etag):
+
+        def download():
+            response = self.cos_client.get_object(Bucket=bucket, Key=file_to_download, IfMatch=etag)
+            with open(save_file, "wb") as file:
+                shutil.copyfileobj(response["Body"], file, 1024 * 1024)
+
+        self.__call(download)
+
+    # Mirror every object below a prefix to a local directory.  A manifest of the size, ETag and last modified
+    # time of each synced object is kept in the local directory so repeated syncs only download objects that
+    # were added or changed.  If delete is True, local files whose objects no longer exist are removed.  Only
+    # objects below the prefix are considered for deletion as several prefixes may share a local directory.
+    def sync_prefix(self, bucket, prefix, local_directory, delete=False, max_workers=None):
+
+        prefix = prefix or ""
+        os.makedirs(local_directory, exist_ok=True)
+        manifest_file = os.path.join(local_directory, CosUtils.SYNC_MANIFEST_FILE)
+        manifest = {}
+        if os.path.exists(manifest_file):
+            with open(manifest_file) as json_data:
+                manifest = json.load(json_data)
+
+        remote_objects = {}
+        for obj in self.iterate_objects_in_bucket(bucket, prefix=prefix):
+            if not obj["Key"].endswith("/"):  # not a directory
+                remote_objects[obj["Key"]] = {
+                    "size": obj["Size"],
+                    "etag": obj["ETag"],
+                    "last_modified": str(obj["LastModified"])
+                }
+
+        changed = []
+        for key, remote in remote_objects.items():
+            local_file = os.path.join(local_directory, *key.split("/"))
+            is_unchanged = manifest.get(key) == remote and \
+                os.path.exists(local_file) and os.path.getsize(local_file) == remote["size"]
+            if not is_unchanged:
+                changed.append((key, local_file))
+
+        print("Syncing %s/%s: %d of %d objects changed" % (bucket, prefix, len(changed), len(remote_objects)))
+        summary = self.download_many(bucket, changed, max_workers=max_workers)
+        for key, _ in changed:
+            if (bucket, key) not in summary["failures"]:
+                manifest[key] = remote_objects[key]
+
+        deleted = 0
+        if delete:
+            for key in [key for key in manifest if key.startswith(prefix) and key not in remote_objects]:
+                local_file = os.path.join(local_directory, *key.split("/"))
+                if os.path.exists(local_file):
                     os.remove(local_file)
-                finally:
-                    file.close()
+                    deleted += 1
+                del manifest[key]
+
+        temp_file = manifest_file + ".tmp"
+        with open(temp_file, "w") as outfile:
+            json.dump(manifest, outfile)
+        os.replace(temp_file, manifest_file)
+
+        summary["unchanged"] = len(remote_objects) - len(changed)
+        summary["deleted"] = deleted
+        return summary
+
+    def upload_file(self, local_file, bucket, key):
+        self.__call(self.cos_client.upload_file, local_file, bucket, key, Config=self.transfer_config)
+
+    # Upload many local files concurrently.  files is a list of (local_file, key) tuples.
+    # Returns a summary with the aggregate throughput plus any keys that failed.
+    def upload_many(self, files, bucket, max_workers=None):
+
+        def upload(local_file, key, config):
+            self.__call(self.cos_client.upload_file, local_file, bucket, key, Config=config)
+            return os.path.getsize(local_file)
+
+        print("Uploading %d files to bucket: %s" % (len(files), bucket))
+        return self.__transfer_many(upload, [(local_file, key, key) for local_file, key in files], bucket,
+                                    max_workers)
+
+    # Download many objects concurrently.  files is a list of (key, save_file) tuples.
+    # Returns a summary with the aggregate throughput plus any keys that failed.
+    def download_many(self, bucket, files, max_workers=None):
+
+        def download(key, save_file, config):
+            save_path = os.path.dirname(save_file)
+            if len(save_path) > 0:
+                os.makedirs(save_path, exist_ok=True)
+            self.__call(self.cos_client.download_file, bucket, key, save_file, Config=config)
+            return os.path.getsize(save_file)
+
+        print("Downloading %d files from bucket: %s" % (len(files), bucket))
+        return self.__transfer_many(download, [(key, save_file, key) for key, save_file in files], bucket,
+                                    max_workers)
+
+    # files is a list of (source, target, key) tuples.  Failures are keyed by (bucket, key) as the same local file
+    # may be transferred to several keys.
+    def __transfer_many(self, transfer, files, bucket, max_workers):
+
+        if max_workers is None:
+            max_workers = self.max_workers
+
+        # The client's connection pool is sized for self.max_workers objects of max_concurrency parts each so
+        # more workers transfer fewer parts of each object at once
+        config = self.transfer_config
+        if max_workers > self.max_workers:
+            from ibm_boto3.s3.transfer import TransferConfig
+
+            max_concurrency = max(self.max_workers * self.max_concurrency // max_workers, 1)
+            config = TransferConfig(multipart_threshold=self.part_size,
+                                    multipart_chunksize=self.part_size,
+                                    max_concurrency=max_concurrency,
+                                    use_threads=max_concurrency > 1)
+
+        start = time.time()
+        total_bytes = 0
+        failures = {}
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(transfer, source, target, config): (source, key)
+                       for source, target, key in files}
+            for future in as_completed(futures):
+                source, key = futures[future]
+                try:
+                    total_bytes += future.result()
+                except Exception as err:
+                    print("Error transferring %s: %s" % (source, err))
+                    failures[(bucket, key)] = str(err)
+
+        seconds = max(time.time() - start, 1e-6)
+        summary = {
+            "files": len(files) - len(failures),
+            "bytes": total_bytes,
+            "seconds": seconds,
+            "megabytes_per_second": total_bytes / seconds / (1024 * 1024),
+            "failures": failures
+        }
+        print("Transferred %d files (%d bytes) in %.2f seconds: %.2f MB/s" %
+              (summary["files"], total_bytes, seconds, summary["megabytes_per_second"]))
+        return summary
+
+
+_write_lock = threading.Lock()
+
+
+# Write data at the given offset of a file descriptor without moving a shared file position.  Platforms
+# without pwrite() (e.g. Windows) fall back to seek and write under a lock.
+def _write_at(fd, data, offset):
+    if hasattr(os, "pwrite"):
+        written = 0
+        while written < len(data):
+            written += os.pwrite(fd, data[written:], offset + written)
+        return written
+
+    with _write_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        written = 0
+        while written < len(data):
+            written += os.write(fd, data[written:])
+        return written
+
+
+def _create_hasher(checksum):
+    return hashlib.new(checksum.split(":", 1)[0])
+
+
+def _get_file_checksum(file_path, checksum):
+    hasher = _create_hasher(checksum)
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            hasher.update(chunk)
+    return "%s:%s" % (hasher.name, hasher.hexdigest())
+
+
+def _get_checksum_args(checksum):
+    if checksum is None:
+        return None
+    return {"Metadata": {CosUtils.CHECKSUM_METADATA_KEY: checksum}}
+
+
+# File-like wrapper that counts the bytes read from a stream and optionally copies them to a second file and
+# computes their checksum
+class _CountingReader:
+
+    def __init__(self, stream, copy_to=None, checksum=None):
+        self.stream = stream
+        self.copy_to = copy_to
+        self.checksum = checksum
+        self.hasher = None if checksum is None else _create_hasher(checksum)
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        if self.copy_to is not None:
+            self.copy_to.write(data)
+        if self.hasher is not None:
+            self.hasher.update(data)
+        return data
+
+    def get_checksum(self):
+        if self.hasher is None:
+            return None
+        return "%s:%s" % (self.hasher.name, self.hasher.hexdigest())
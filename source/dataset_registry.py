@@ -0,0 +1,55 @@
+# Registry of datasets that ProjectUtils.download_dataset() can transfer to COS.  Each dataset lists its files
+# with their source URL, size in bytes and checksum ("<algorithm>:<hex digest>") so transfers can be verified
+# and files already present in the data bucket can be skipped.  Add new datasets with register_dataset().
+
+DATASETS = {}
+
+
+def register_dataset(name, bucket_prefix, files):
+
+    for file in files:
+        for key in ["name", "url", "size", "checksum"]:
+            if key not in file:
+                raise ValueError("Dataset file must define '%s': %s" % (key, file))
+
+    DATASETS[name] = {
+        "bucket_prefix": bucket_prefix,
+        "files": files
+    }
+
+
+def get_dataset(name):
+
+    if name not in DATASETS:
+        raise ValueError("Unknown dataset: %s. Registered datasets are: %s" % (name, ", ".join(sorted(DATASETS))))
+    return DATASETS[name]
+
+
+# Checksums are the MD5 digests published with the dataset at https://github.com/zalandoresearch/fashion-mnist
+FASHION_MNIST_URL = "https://github.com/zalandoresearch/fashion-mnist/raw/master/data/fashion/"
+register_dataset("fashion_mnist", "fashion-mnist", [
+    {
+        "name": "train-images-idx3-ubyte.gz",
+        "url": FASHION_MNIST_URL + "train-images-idx3-ubyte.gz",
+        "size": 26421880,
+        "checksum": "md5:8d4fb7e6c68d591d4c3dfef9ec88bf0d"
+    },
+    {
+        "name": "train-labels-idx1-ubyte.gz",
+        "url": FASHION_MNIST_URL + "train-labels-idx1-ubyte.gz",
+        "size": 29515,
+        "checksum": "md5:25c81989df183df01b3e8a0aad5dffbe"
+    },
+    {
+        "name": "t10k-images-idx3-ubyte.gz",
+        "url": FASHION_MNIST_URL + "t10k-images-idx3-ubyte.gz",
+        "size": 4422102,
+        "checksum": "md5:bef4ecab320f06d8554ea6380940ec79"
+    },
+    {
+        "name": "t10k-labels-idx1-ubyte.gz",
+        "url": FASHION_MNIST_URL + "t10k-labels-idx1-ubyte.gz",
+        "size": 5148,
+        "checksum": "md5:bb300cfdad3c16e7a12a480ee83cd310"
+    }
+])
@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+import threading
+import zipfile
+
+
+# Remembers the training definitions stored in the WML repository so an identical definition is never uploaded
+# twice.  Definitions are keyed by the SHA-256 of the experiment .zip's files plus the metadata that affects how it runs
+# (framework, runtime, execution command and WML instance) and the cache is persisted to disk so definitions
+# stored by earlier searches are reused too.
+class DefinitionCache:
+
+    def __init__(self, cache_file=None):
+
+        if cache_file is None:
+            cache_file = os.path.join("..", "settings", "definition_cache.json")
+
+        self.cache_file = cache_file
+        self.lock = threading.Lock()
+        self.definitions = self.__load()
+
+    # Create the cache key for an experiment .zip and the metadata values it will be stored with.  Only the name,
+    # size and CRC-32 of each file are hashed so rebuilding a .zip with the same files (but new timestamps or
+    # compression) gives the same key.
+    @staticmethod
+    def get_key(experiment_zip, metadata_values):
+
+        with zipfile.ZipFile(experiment_zip) as z:
+            entries = sorted([info.filename, info.file_size, info.CRC] for info in z.infolist())
+
+        hasher = hashlib.sha256()
+        hasher.update(json.dumps(entries).encode("utf-8"))
+        hasher.update(json.dumps([str(value) for value in metadata_values]).encode("utf-8"))
+        return hasher.hexdigest()
+
+    # Return the stored definition url for a key or None
+    def get(self, key):
+        with self.lock:
+            return self.definitions.get(key)
+
+    def put(self, key, definition_url):
+        with self.lock:
+            self.definitions[key] = definition_url
+            self.__save()
+
+    # Forget a definition, e.g. because it was deleted from the WML repository
+    def remove(self, key):
+        with self.lock:
+            self.definitions.pop(key, None)
+            self.__save(removed_key=key)
+
+    def clear(self):
+        with self.lock:
+            self.definitions = {}
+            if os.path.exists(self.cache_file):
+                os.remove(self.cache_file)
+
+    def __load(self):
+        if not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file) as json_data:
+                return json.load(json_data)
+        except ValueError:
+            return {}
+
+    def __save(self, removed_key=None):
+
+        # Merge with definitions stored by other processes since this cache was loaded
+        definitions = self.__load()
+        definitions.pop(removed_key, None)
+        definitions.update(self.definitions)
+        self.definitions = definitions
+
+        temp_file = "%s.%d.tmp" % (self.cache_file, os.getpid())
+        with open(temp_file, "w") as outfile:
+            json.dump(definitions, outfile)
+        os.replace(temp_file, self.cache_file)
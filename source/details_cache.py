@@ -0,0 +1,138 @@
+import json
+import os
+import threading
+import time
+
+from request_scheduler import RequestScheduler
+
+
+# Caches WML experiment run and training run details.  How long details are cached depends on the state of the
+# run: details of finished runs never change so they're cached for good (and optionally persisted to disk) while
+# details of running runs expire after a few seconds.  Concurrent requests for the same guid are coalesced into a
+# single API call which is scheduled as a low priority status poll.
+class DetailsCache:
+
+    TERMINAL_STATES = ["completed", "error", "failed", "canceled"]
+
+    # Seconds to cache details by state.  None caches details forever.
+    DEFAULT_TTLS = {
+        "completed": None,
+        "error": None,
+        "failed": None,
+        "canceled": None,
+        "pending": 30,
+        "queued": 30,
+        "running": 5
+    }
+    DEFAULT_TTL = 10
+
+    def __init__(self, wml_client, ttls=None, persist_file=None, scheduler=None):
+
+        self.wml_client = wml_client
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
+        self.ttls = dict(DetailsCache.DEFAULT_TTLS)
+        if ttls is not None:
+            self.ttls.update(ttls)
+        self.persist_file = persist_file
+
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.pending = {}
+
+        if persist_file is not None and os.path.exists(persist_file):
+            with open(persist_file) as json_data:
+                for key, details in json.load(json_data).items():
+                    self.entries[key] = (details, 0, None)
+
+    def get_training_details(self, training_guid, max_age=None):
+        return self.__get("training/%s" % training_guid, max_age,
+                          lambda: self.scheduler.call(RequestScheduler.STATUS_POLL,
+                                                      self.wml_client.training.get_details, run_uid=training_guid))
+
+    def get_run_details(self, experiment_run_guid, max_age=None):
+        return self.__get("experiment_run/%s" % experiment_run_guid, max_age,
+                          lambda: self.scheduler.call(RequestScheduler.STATUS_POLL,
+                                                      self.wml_client.experiments.get_run_details,
+                                                      experiment_run_guid))
+
+    def invalidate(self, guid):
+        with self.lock:
+            for key in ["training/%s" % guid, "experiment_run/%s" % guid]:
+                self.entries.pop(key, None)
+
+    # max_age optionally limits the age of details of unfinished runs, e.g. max_age=0 always fetches fresh details
+    def __get(self, key, max_age, fetch):
+
+        with self.lock:
+            if key in self.entries:
+                details, fetch_time, expires = self.entries[key]
+                if max_age is not None and expires is not None:
+                    expires = min(expires, fetch_time + max_age)
+                if expires is None or expires > time.time():
+                    return details
+
+            # Another thread is already fetching these details so wait for its result
+            request = self.pending.get(key)
+            is_fetching = request is None
+            if is_fetching:
+                request = _PendingRequest()
+                self.pending[key] = request
+
+        if not is_fetching:
+            return request.wait()
+
+        try:
+            details = fetch()
+        except Exception as err:
+            with self.lock:
+                del self.pending[key]
+            request.set_error(err)
+            raise
+
+        ttl = self.ttls.get(DetailsCache.__get_state(details), DetailsCache.DEFAULT_TTL)
+        with self.lock:
+            now = time.time()
+            self.entries[key] = (details, now, None if ttl is None else now + ttl)
+            del self.pending[key]
+            if ttl is None and self.persist_file is not None:
+                self.__save()
+        request.set_result(details)
+        return details
+
+    def __save(self):
+        finished = {key: details for key, (details, _, expires) in self.entries.items() if expires is None}
+        temp_file = "%s.%d.tmp" % (self.persist_file, os.getpid())
+        with open(temp_file, "w") as outfile:
+            json.dump(finished, outfile)
+        os.replace(temp_file, self.persist_file)
+
+    @staticmethod
+    def __get_state(details):
+        entity = details.get("entity", {})
+        for status_key in ["status", "experiment_run_status"]:
+            if isinstance(entity.get(status_key), dict) and "state" in entity[status_key]:
+                return entity[status_key]["state"]
+        return None
+
+
+# Result of a fetch that other threads are waiting for
+class _PendingRequest:
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+    def set_result(self, result):
+        self.result = result
+        self.event.set()
+
+    def set_error(self, error):
+        self.error = error
+        self.event.set()
+
+    def wait(self):
+        self.event.wait()
+        if self.error is not None:
+            raise self.error
+        return self.result
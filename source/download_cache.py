@@ -0,0 +1,176 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+
+from token_cache import _FileLock
+
+
+# Local cache of downloaded COS objects.  Entries are keyed by bucket, key and ETag so a changed object is
+# never served from the cache, and the least recently used entries are evicted once the cache grows past
+# its byte budget.  index.json is shared by every process using the cache directory so it's only rewritten,
+# under a file lock, when entries are inserted or evicted.  Cache hits only update the access time in memory and
+# it's persisted with the next write.  Cached files are only removed while holding the file lock, so copy() and
+# add(copy_to=...) copy them out under the same lock to never read a file another process is evicting.
+class DownloadCache:
+
+    DEFAULT_MAX_BYTES = 10 * 1024 * 1024 * 1024
+    INDEX_FILE = "index.json"
+
+    def __init__(self, cache_directory=None, max_bytes=DEFAULT_MAX_BYTES):
+
+        if cache_directory is None:
+            cache_directory = os.path.join("..", "cache", "cos")
+
+        self.cache_directory = cache_directory
+        self.objects_directory = os.path.join(cache_directory, "objects")
+        self.index_file = os.path.join(cache_directory, DownloadCache.INDEX_FILE)
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.lock_file = self.index_file + ".lock"
+
+        os.makedirs(self.objects_directory, exist_ok=True)
+
+        with self.lock, _FileLock(self.lock_file):
+            self.index = self.__load_index()
+
+    def get_cache_directory(self):
+        return self.cache_directory
+
+    def get_size(self):
+        with self.lock:
+            return sum([entry["size"] for entry in self.index.values()])
+
+    # Return the path of the cached copy of an object or None if this version isn't cached
+    def get(self, bucket, key, etag):
+
+        name = DownloadCache.__get_name(bucket, key, etag)
+        with self.lock:
+            if name not in self.index:
+                return None
+            # Another process may have evicted it
+            if not os.path.exists(self.__get_path(name)):
+                del self.index[name]
+                return None
+            self.index[name]["last_access"] = time.time()
+            return self.__get_path(name)
+
+    # Copy the cached copy of an object to save_file.  Returns False if this version isn't cached.
+    def copy(self, bucket, key, etag, save_file):
+
+        name = DownloadCache.__get_name(bucket, key, etag)
+        with self.lock, _FileLock(self.lock_file):
+            if name not in self.index or not os.path.exists(self.__get_path(name)):
+                self.index.pop(name, None)
+                return False
+            shutil.copyfile(self.__get_path(name), save_file)
+            self.index[name]["last_access"] = time.time()
+            return True
+
+    # Move a downloaded file into the cache and return its cached path.  Older versions of the same object are
+    # removed as they can never be served again.  If copy_to is given the cached file is also copied there before
+    # another process can evict it.
+    def add(self, bucket, key, etag, downloaded_file, copy_to=None):
+
+        name = DownloadCache.__get_name(bucket, key, etag)
+        cached_file = self.__get_path(name)
+        shutil.move(downloaded_file, cached_file)
+
+        with self.lock, _FileLock(self.lock_file):
+            self.__merge_index()
+            for other_name, entry in list(self.index.items()):
+                if entry["bucket"] == bucket and entry["key"] == key and other_name != name:
+                    self.__remove(other_name)
+
+            self.index[name] = {
+                "bucket": bucket,
+                "key": key,
+                "etag": etag,
+                "size": os.path.getsize(cached_file),
+                "last_access": time.time()
+            }
+            self.__evict(keep=name)
+            self.__save_index()
+
+            if copy_to is not None:
+                shutil.copyfile(cached_file, copy_to)
+
+        return cached_file
+
+    # Return a temporary path inside the cache directory to download to.  Downloading inside the cache
+    # directory lets add() move the file without copying it.
+    def get_temp_file(self):
+        return os.path.join(self.objects_directory, "download-%d-%d.tmp" % (os.getpid(), threading.get_ident()))
+
+    # Return the path to download a specific version of an object to when the download should be resumable.  The
+    # path is the same for every process so an interrupted download is resumed by the next run.
+    def get_partial_file(self, bucket, key, etag):
+        return self.__get_path(DownloadCache.__get_name(bucket, key, etag)) + ".download"
+
+    def clear(self):
+        with self.lock, _FileLock(self.lock_file):
+            self.index = self.__load_index()
+            for name in list(self.index):
+                self.__remove(name)
+            self.__save_index()
+
+    def __evict(self, keep=None):
+
+        total_bytes = sum([entry["size"] for entry in self.index.values()])
+        if total_bytes <= self.max_bytes:
+            return
+
+        # Remove least recently used entries first
+        for name in sorted(self.index, key=lambda name: self.index[name]["last_access"]):
+            if total_bytes <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            total_bytes -= self.index[name]["size"]
+            self.__remove(name)
+
+    def __remove(self, name):
+        del self.index[name]
+        try:
+            os.remove(self.__get_path(name))
+        except OSError:
+            pass
+
+    # Replace the index with the one on disk, which other processes may have changed, keeping the more recent
+    # access times of this process
+    def __merge_index(self):
+
+        index = self.__load_index()
+        for name, entry in index.items():
+            if name in self.index:
+                entry["last_access"] = max(entry["last_access"], self.index[name]["last_access"])
+        self.index = index
+
+    def __load_index(self):
+
+        index = {}
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file) as json_data:
+                    index = json.load(json_data)
+            except ValueError:
+                # Corrupted index so the cached files are simply downloaded again
+                index = {}
+
+        # Drop entries whose files were removed outside of the cache
+        return {name: entry for name, entry in index.items() if os.path.exists(self.__get_path(name))}
+
+    def __save_index(self):
+        temp_file = "%s.%d.tmp" % (self.index_file, os.getpid())
+        with open(temp_file, "w") as outfile:
+            json.dump(self.index, outfile)
+        os.replace(temp_file, self.index_file)
+
+    def __get_path(self, name):
+        return os.path.join(self.objects_directory, name)
+
+    @staticmethod
+    def __get_name(bucket, key, etag):
+        return hashlib.sha256(("%s/%s/%s" % (bucket, key, etag)).encode("utf-8")).hexdigest()
@@ -0,0 +1,82 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import zipfile
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Builds per-run copies of an experiment .zip with the run's hyperparameters added as "config.json".
+#
+# The base .zip is read into memory once.  Each run archive is produced by appending config.json to an in-memory
+# copy of it, which leaves the compressed entries of the base .zip untouched so nothing is recompressed.  Every
+# archive is written to its own unique temp file so concurrent searches never overwrite each other's archives.
+# config.json is written with a fixed timestamp so the same hyperparameters always produce the same archive.
+class ExperimentArchive:
+
+    HYPERPARAMETERS_FILE = "config.json"
+    HYPERPARAMETERS_DATE_TIME = (1980, 1, 1, 0, 0, 0)
+
+    def __init__(self, experiment_zip, temp_directory=None):
+
+        self.experiment_zip = experiment_zip
+        self.temp_directory = tempfile.mkdtemp(prefix="experiment_archive_", dir=temp_directory)
+        self.lock = threading.Lock()
+        self.archive_count = 0
+
+        with open(experiment_zip, "rb") as file:
+            self.base_zip = file.read()
+
+        # An existing config.json would end up duplicated so build a base without it.  This only recompresses
+        # the base entries once rather than for every run.
+        with zipfile.ZipFile(io.BytesIO(self.base_zip)) as z:
+            if ExperimentArchive.HYPERPARAMETERS_FILE in z.namelist():
+                self.base_zip = ExperimentArchive.__remove_entry(z, ExperimentArchive.HYPERPARAMETERS_FILE)
+
+    def get_experiment_zip(self):
+        return self.experiment_zip
+
+    # Return the bytes of an archive containing the given hyperparameters
+    def build(self, hyperparameters):
+
+        buffer = io.BytesIO(self.base_zip)
+        buffer.seek(0, io.SEEK_END)
+        info = zipfile.ZipInfo(ExperimentArchive.HYPERPARAMETERS_FILE, ExperimentArchive.HYPERPARAMETERS_DATE_TIME)
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.external_attr = 0o644 << 16
+        with zipfile.ZipFile(buffer, "a") as z:
+            z.writestr(info, json.dumps(hyperparameters))
+        return buffer.getvalue()
+
+    # Write an archive containing the given hyperparameters to a unique temp file and return its path
+    def save(self, hyperparameters):
+
+        with self.lock:
+            self.archive_count += 1
+            archive_file = os.path.join(self.temp_directory, "experiment_%d.zip" % self.archive_count)
+
+        with open(archive_file, "wb") as file:
+            file.write(self.build(hyperparameters))
+        return archive_file
+
+    # Build one archive per set of hyperparameters concurrently.  Paths are returned in the same order.
+    def save_many(self, hyperparameters_list, max_workers=4):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(self.save, hyperparameters_list))
+
+    # Remove every archive created by this builder
+    def cleanup(self):
+        shutil.rmtree(self.temp_directory, ignore_errors=True)
+
+    @staticmethod
+    def __remove_entry(z, name):
+
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as new_zip:
+            for info in z.infolist():
+                if info.filename != name:
+                    new_zip.writestr(info, z.read(info.filename), compress_type=info.compress_type)
+        return buffer.getvalue()
@@ -0,0 +1,262 @@
+import asyncio
+import collections
+import threading
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Watches every training run of an Experiment and notifies callbacks when a run changes state, reports new metrics
+# or finishes.  Each poll reads the state of every run with a single experiment run details call.  Training details
+# are only requested for runs whose state changed and, while on_metrics() callbacks are registered, for running
+# runs.  Polls are adaptive: queued runs are checked rarely, running runs more often and runs that are expected to
+# finish soon (based on how long completed runs took) most often.  The total number of status calls is capped at
+# max_calls_per_minute.
+#
+#   monitor = ExperimentMonitor(experiment)
+#   monitor.on_complete(lambda run, state, details: print(run.get_name(), state))
+#   monitor.watch()
+class ExperimentMonitor:
+
+    QUEUED_STATES = ["pending", "queued"]
+    TERMINAL_STATES = ["completed", "error", "failed", "canceled"]
+
+    # Seconds between polls.  Pending runs (and runs still waiting for their guid) usually start within seconds
+    # while queued runs may wait for a GPU for a long time.
+    PENDING_POLL_INTERVAL = 5
+    QUEUED_POLL_INTERVAL = 60
+    RUNNING_POLL_INTERVAL = 20
+    FINISHING_POLL_INTERVAL = 5
+
+    EVENT_STATE_CHANGE = "state_change"
+    EVENT_METRICS = "metrics"
+    EVENT_COMPLETE = "complete"
+
+    def __init__(self, experiment, max_calls_per_minute=60, max_workers=8):
+
+        self.experiment = experiment
+        self.max_calls_per_minute = max_calls_per_minute
+        self.max_workers = max_workers
+
+        self.callbacks = {
+            ExperimentMonitor.EVENT_STATE_CHANGE: [],
+            ExperimentMonitor.EVENT_METRICS: [],
+            ExperimentMonitor.EVENT_COMPLETE: []
+        }
+        self.lock = threading.Lock()
+
+        self.states = {}
+        self.metric_counts = {}
+        self.running_since = {}
+        self.durations = []
+        self.next_poll = {}
+        self.call_times = collections.deque()
+
+        # Stop events of the watch() calls in progress
+        self.stop_events = set()
+
+    # callback(run, old_state, new_state, details)
+    def on_state_change(self, callback):
+        self.__add_callback(ExperimentMonitor.EVENT_STATE_CHANGE, callback)
+
+    # callback(run, new_metrics, details) where new_metrics lists the metrics reported since the last poll
+    def on_metrics(self, callback):
+        self.__add_callback(ExperimentMonitor.EVENT_METRICS, callback)
+
+    # callback(run, final_state, details)
+    def on_complete(self, callback):
+        self.__add_callback(ExperimentMonitor.EVENT_COMPLETE, callback)
+
+    def get_states(self):
+        return dict(self.states)
+
+    # Stop the watch() calls in progress.  The monitor can watch again afterwards.
+    def stop(self):
+        with self.lock:
+            for stopped in self.stop_events:
+                stopped.set()
+
+    # Block until every training run has finished, stop() is called or timeout seconds have passed.
+    # Returns the latest state of each run keyed by training run guid.
+    def watch(self, timeout=None):
+        return self.__watch(timeout, threading.Event())
+
+    # Async generator of (event, run, data) tuples.  watch() runs on a background thread and its events are handed
+    # over to the event loop as they happen.  Closing the generator stops its watch.
+    async def events(self, timeout=None):
+
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        done = object()
+        stopped = threading.Event()
+
+        def forward(event):
+            def callback(run, *data):
+                loop.call_soon_threadsafe(events.put_nowait, (event, run, data))
+            return callback
+
+        forwards = {event: forward(event) for event in self.callbacks}
+        for event, callback in forwards.items():
+            self.__add_callback(event, callback)
+
+        def watch():
+            try:
+                self.__watch(timeout, stopped)
+            finally:
+                loop.call_soon_threadsafe(events.put_nowait, done)
+
+        thread = threading.Thread(target=watch, daemon=True)
+        thread.start()
+        try:
+            while True:
+                item = await events.get()
+                if item is done:
+                    break
+                yield item
+        finally:
+            stopped.set()
+            with self.lock:
+                for event, callback in forwards.items():
+                    self.callbacks[event].remove(callback)
+
+    def __watch(self, timeout, stopped):
+
+        with self.lock:
+            self.stop_events.add(stopped)
+
+        start = time.time()
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while not stopped.is_set():
+
+                    # Runs without a guid are still starting and get theirs from the experiment run details
+                    runs = self.experiment.get_training_runs()
+                    active_runs = [run for run in runs if run.get_guid() is None or
+                                   self.states.get(run.get_guid()) not in self.TERMINAL_STATES]
+                    if len(active_runs) == 0:
+                        break
+                    if timeout is not None and time.time() - start > timeout:
+                        print("Stopped monitoring after %d seconds" % timeout)
+                        break
+
+                    now = time.time()
+                    next_poll = min([self.next_poll.get(self.__get_key(run), start) for run in active_runs])
+                    if next_poll <= now and self.__get_call_budget(now) > 0:
+                        self.__poll(active_runs, executor)
+
+                    # Sleep until the next run is due, but wake regularly so stop() is honoured
+                    next_poll = min([self.next_poll.get(self.__get_key(run), start) for run in active_runs])
+                    stopped.wait(min(max(next_poll - time.time(), 0.5), 5))
+        finally:
+            with self.lock:
+                self.stop_events.discard(stopped)
+
+        return self.get_states()
+
+    # Read the state of every run with one call then fetch the training details of the runs that need them
+    def __poll(self, runs, executor):
+
+        now = time.time()
+        self.call_times.append(now)
+        try:
+            statuses = self.experiment.get_training_statuses(max_age=0)
+        except Exception as err:
+            print("Error getting training run statuses: %s" % err)
+            for run in runs:
+                self.next_poll[self.__get_key(run)] = now + ExperimentMonitor.RUNNING_POLL_INTERVAL
+            return
+
+        due_runs = []
+        for run in runs:
+            status = statuses.get(run.get_name())
+            if run.get_guid() is None or status is None:
+                self.next_poll[self.__get_key(run)] = now + ExperimentMonitor.PENDING_POLL_INTERVAL
+                continue
+
+            guid = run.get_guid()
+            self.next_poll.pop(run.get_name(), None)
+            is_metrics_due = status["state"] not in self.QUEUED_STATES and \
+                len(self.callbacks[ExperimentMonitor.EVENT_METRICS]) > 0 and self.next_poll.get(guid, now) <= now
+            if status["state"] != self.states.get(guid) or is_metrics_due:
+                due_runs.append(run)
+            else:
+                self.next_poll[guid] = now + self.__get_poll_interval(guid, status["state"])
+
+        due_runs = due_runs[:self.__get_call_budget(now)]
+        self.call_times.extend([now] * len(due_runs))
+        for future in [executor.submit(self.__update_run, run) for run in due_runs]:
+            future.result()
+
+    def __update_run(self, run):
+
+        guid = run.get_guid()
+        try:
+            details = run.get_details()
+        except Exception as err:
+            print("Error getting details of training run %s: %s" % (guid, err))
+            self.next_poll[guid] = time.time() + ExperimentMonitor.RUNNING_POLL_INTERVAL
+            return
+
+        status = details["entity"]["status"]
+        state = status["state"]
+        old_state = self.states.get(guid)
+        self.states[guid] = state
+
+        if state != old_state:
+            if state not in self.QUEUED_STATES and guid not in self.running_since:
+                self.running_since[guid] = time.time()
+            self.__notify(ExperimentMonitor.EVENT_STATE_CHANGE, run, old_state, state, details)
+
+        metrics = status.get("metrics", [])
+        metric_count = self.metric_counts.get(guid, 0)
+        if len(metrics) > metric_count:
+            self.metric_counts[guid] = len(metrics)
+            self.__notify(ExperimentMonitor.EVENT_METRICS, run, metrics[metric_count:], details)
+
+        if state in self.TERMINAL_STATES:
+            if guid in self.running_since:
+                self.durations.append(time.time() - self.running_since[guid])
+            self.__notify(ExperimentMonitor.EVENT_COMPLETE, run, state, details)
+        else:
+            self.next_poll[guid] = time.time() + self.__get_poll_interval(guid, state)
+
+    # Poll times are keyed by guid, or by name while a run has no guid yet
+    @staticmethod
+    def __get_key(run):
+        return run.get_guid() if run.get_guid() is not None else run.get_name()
+
+    def __get_poll_interval(self, guid, state):
+
+        if state == "pending":
+            return ExperimentMonitor.PENDING_POLL_INTERVAL
+        if state in self.QUEUED_STATES:
+            return ExperimentMonitor.QUEUED_POLL_INTERVAL
+
+        # Runs are expected to take about as long as the runs that already finished
+        if len(self.durations) > 0 and guid in self.running_since:
+            expected_duration = sorted(self.durations)[len(self.durations) // 2]
+            if time.time() - self.running_since[guid] > 0.8 * expected_duration:
+                return ExperimentMonitor.FINISHING_POLL_INTERVAL
+
+        return ExperimentMonitor.RUNNING_POLL_INTERVAL
+
+    # Number of calls that can be made now without exceeding max_calls_per_minute
+    def __get_call_budget(self, now):
+
+        while len(self.call_times) > 0 and now - self.call_times[0] > 60:
+            self.call_times.popleft()
+
+        return max(self.max_calls_per_minute - len(self.call_times), 0)
+
+    def __add_callback(self, event, callback):
+        with self.lock:
+            self.callbacks[event].append(callback)
+
+    def __notify(self, event, run, *data):
+        with self.lock:
+            callbacks = list(self.callbacks[event])
+        for callback in callbacks:
+            try:
+                callback(run, *data)
+            except Exception as err:
+                print("Error in %s callback: %s" % (event, err))
@@ -1,19 +1,26 @@
 import json
-import os
+import random
+import threading
 import time
-import zipfile
 
-from pathlib import Path
-from shutil import copyfile
+from concurrent.futures import ThreadPoolExecutor
+from experiment_archive import ExperimentArchive
+from request_scheduler import RequestScheduler, get_status_code
 
 class Experiment:
 
+    # Polling of the experiment run for training run guids after execute()
+    GUID_DEADLINE = 60
+    GUID_POLL_INITIAL_DELAY = 1
+    GUID_POLL_MAX_DELAY = 10
+
     def __init__(self, experiment_name, experiment_description,
                  framework_name, framework_version,
                  runtime_name, runtime_version,
-                 studio_utils, project_utils):
+                 studio_utils, project_utils, data_set_name="fashion_mnist"):
 
         self.experiment_name = experiment_name
+        self.data_set_name = data_set_name
         self.framework_name = framework_name
         self.framework_version = framework_version
         self.runtime_name = runtime_name
@@ -29,8 +36,17 @@ class Experiment:
         self.training_runs = []
         self.training_references = []
 
+        # Per-run archive builders keyed by the experiment .zip they extend
+        self.archives = {}
+        self.archives_lock = threading.Lock()
+
+        # (training reference, definition key, experiment .zip, metadata) of runs reusing a cached definition
+        self.reused_definitions = []
+
         cos_credentials = studio_utils.get_cos_credentials()
         self.wml_client = studio_utils.get_wml_client()
+        self.definition_cache = studio_utils.get_definition_cache()
+        self.scheduler = studio_utils.get_request_scheduler()
 
         self.experiment_metadata = {
                     self.wml_client.repository.ExperimentMetaNames.NAME: self.experiment_name,
@@ -42,7 +58,7 @@ class Experiment:
                                         "secret_access_key": cos_credentials['cos_hmac_keys']['secret_access_key']
                                     },
                                     "source": {
-                                        "bucket": project_utils.get_data_bucket(),
+                                        "bucket": project_utils.get_data_bucket(data_set_name),
                                     },
                                     "type": "s3"
                                 },
@@ -53,7 +69,7 @@ class Experiment:
                                         "secret_access_key": cos_credentials['cos_hmac_keys']['secret_access_key']
                                     },
                                     "target": {
-                                        "bucket": project_utils.get_results_bucket(),
+                                        "bucket": project_utils.get_results_bucket(data_set_name),
                                     },
                                     "type": "s3"
                                 }
@@ -68,19 +84,38 @@ class Experiment:
                 }
             ]
 
-    def execute(self):
+    # Store and run the experiment then wait up to guid_deadline seconds for all training runs to start
+    def execute(self, guid_deadline=GUID_DEADLINE):
         print("Starting experiment: {}".format(self.experiment_name))
 
         # add stored runs to experiment
         self.experiment_metadata[self.wml_client.repository.ExperimentMetaNames.TRAINING_REFERENCES] = self.training_references
 
-        # Store new experiment in Watson Machine Learning repository
-        experiment_details = self.wml_client.repository.store_experiment(meta_props=self.experiment_metadata)
+        # Store new experiment in Watson Machine Learning repository.  Cached definitions may have been deleted
+        # from the repository since they were stored so if the experiment is rejected because of a missing
+        # definition those definitions are stored again.  Each retry stores at least one definition again so this
+        # ends once every reused definition was replaced.
+        while True:
+            try:
+                experiment_details = self.__store_experiment()
+                break
+            except Exception as err:
+                missing_definitions = self.__get_missing_definitions(err)
+                if len(missing_definitions) == 0:
+                    raise
+                print("Unable to store experiment (%s), storing %d reused training definitions again" %
+                      (err, len(missing_definitions)))
+                self.__store_reused_definitions(missing_definitions)
+        self.reused_definitions = []
         self.experiment_guid = self.wml_client.repository.get_experiment_uid(experiment_details)
-        experiment_run_details = self.wml_client.experiments.run(self.experiment_guid)
+        experiment_run_details = self.scheduler.call(RequestScheduler.RUN_SUBMIT,
+                                                     self.wml_client.experiments.run, self.experiment_guid)
 
         self.experiment_run_guid = experiment_run_details["metadata"]["guid"]
-        self.__update_training_run_ids()
+
+        # All training definitions are stored so the per-run archives are no longer needed
+        self.__cleanup_archives()
+        self.__update_training_run_ids(guid_deadline)
 
         print("Experiment started with {} training runs".format(len(self.training_references)))
 
@@ -89,9 +124,21 @@ class Experiment:
     def get_training_runs(self):
         return self.training_runs
 
-    def print_experiment_summary(self):
+    def get_experiment_run_guid(self):
+        return self.experiment_run_guid
+
+    # Statuses of the training runs keyed by run name from a single experiment run details call.  Runs still
+    # waiting for their guid are assigned it as soon as it appears.
+    def get_training_statuses(self, max_age=None):
+
+        experiment_run_details = self.studio_utils.get_details_cache().get_run_details(self.experiment_run_guid,
+                                                                                       max_age=max_age)
+        self.__set_training_run_ids(experiment_run_details)
+        return {run_status["training_reference_name"]: run_status
+                for run_status in experiment_run_details["entity"]["training_statuses"]}
+
+    def get_experiment_summary(self):
 
-        # Use json to pretty print a summary
         summary = {
                     "experiment_run_guid" : self.experiment_run_guid,
                     "experiment_guid": self.experiment_guid
@@ -101,50 +148,107 @@ class Experiment:
         for run in self.training_runs:
 
             # Get latest statuses for all runs
-            training_run_details = self.wml_client.training.get_details(run_uid=run.get_guid())
+            training_run_details = run.get_details()
             #print("training_run_details",json.dumps(training_run_details, indent=2))
 
+            state = None
+            if training_run_details is not None:
+                state = training_run_details["entity"]["status"]["state"]
+
             summary["training_runs"].append({
                 "name" : run.get_name(),
                 "guid" : run.get_guid(),
+                "state" : state,
                 "metadata" : run.get_metadata(),
             })
+        return summary
+
+    def print_experiment_summary(self):
+
+        # Use json to pretty print a summary
+        summary = self.get_experiment_summary()
         print("\n**** Experiment Summary Start ****\n%s" % json.dumps(summary, indent=2))
         print("**** Experiment Summary End ****\n\n")
 
-    # Write hyperparameters to a "config.json" added to the training run's experiment.zip.
+    # Write hyperparameters to a "config.json" added to a copy of the training run's experiment.zip.
+    # Every call returns a new, uniquely named archive.  These are deleted once the experiment has been executed.
     def save_hyperparameters_config(self, hyperparameters, experiment_zip):
 
         # "config.json" is also the file passed to our Experiments if you use Watson Studio's HPO.
-        hyperparameters_file = "config.json"
-        if Path(hyperparameters_file).is_file():
-            os.remove(Path(hyperparameters_file))
-
-        with open(hyperparameters_file, "w") as file:
-            file.write(json.dumps(hyperparameters))
-
-        # Append our new hyperparameters file to the existing Experiment's .zip.
-        new_experiment_zip = "hpo_experiment_temp.zip"
-        if Path(new_experiment_zip).is_file():
-            os.remove(Path(new_experiment_zip))
-
-        copyfile(experiment_zip,new_experiment_zip)
-        z = zipfile.ZipFile(new_experiment_zip, "a")
-        z.write(hyperparameters_file)
+        return self.__get_archive(experiment_zip).save(hyperparameters)
 
-        # Remove temp file
-        try:
-            os.remove(hyperparameters_file)
-        except OSError as err:
-            print("Error deleting {}: {}".format(hyperparameters_file, err))
+    def __get_archive(self, experiment_zip):
+        with self.archives_lock:
+            if experiment_zip not in self.archives:
+                self.archives[experiment_zip] = ExperimentArchive(experiment_zip)
+            return self.archives[experiment_zip]
 
-        return new_experiment_zip
+    def __cleanup_archives(self):
+        with self.archives_lock:
+            for archive in self.archives.values():
+                archive.cleanup()
+            self.archives = {}
 
     def set_rbfopt_config(self, rbfopt_config):
         self.rbfopt_config = rbfopt_config
 
     def add_training_run(self, run_name, command, experiment_zip, gpu_type):
 
+        training_reference, run = self.__create_training_run(run_name, command, experiment_zip, gpu_type)
+        self.training_references.append(training_reference)
+        self.training_runs.append(run)
+
+        print("Training run %d added to experiment" % (len(self.training_references)))
+
+    # Add many training runs at once.  Each spec is a dict with "name", "command", "experiment_zip" and "gpu_type"
+    # plus optional "hyperparameters" which are saved to the run's config.json.  Archives are built and training
+    # definitions stored concurrently but runs are added in the order of specs.  Returns the time spent preparing
+    # and storing each run.  If some specs fail the others are still added, so their stored definitions aren't
+    # orphaned, before the first error is raised.
+    def add_training_runs(self, specs, max_workers=8):
+
+        if self.experiment_metadata is None:
+            raise ValueError("Experiment must first be initialized")
+
+        def add(spec):
+            start = time.time()
+            experiment_zip = spec["experiment_zip"]
+            if spec.get("hyperparameters") is not None:
+                experiment_zip = self.save_hyperparameters_config(spec["hyperparameters"], experiment_zip)
+            archive_time = time.time()
+
+            training_run = self.__create_training_run(spec["name"], spec["command"], experiment_zip, spec["gpu_type"])
+            timing = {
+                "name": spec["name"],
+                "archive_seconds": archive_time - start,
+                "store_seconds": time.time() - archive_time
+            }
+            return training_run, timing
+
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(add, spec) for spec in specs]
+
+        timings = []
+        failures = []
+        for spec, future in zip(specs, futures):
+            if future.exception() is not None:
+                failures.append((spec["name"], future.exception()))
+                continue
+            (training_reference, run), timing = future.result()
+            self.training_references.append(training_reference)
+            self.training_runs.append(run)
+            timings.append(timing)
+
+        print("%d training runs added to experiment in %.2f seconds" % (len(timings), time.time() - start))
+        if len(failures) > 0:
+            for name, err in failures:
+                print("Unable to add training run %s: %s" % (name, err))
+            raise failures[0][1]
+        return timings
+
+    def __create_training_run(self, run_name, command, experiment_zip, gpu_type):
+
         if self.experiment_metadata is None:
             raise ValueError("Experiment must first be initialized")
 
@@ -157,8 +261,7 @@ class Experiment:
             self.wml_client.repository.DefinitionMetaNames.RUNTIME_VERSION: self.runtime_version,
             self.wml_client.repository.DefinitionMetaNames.EXECUTION_COMMAND: command
         }
-        definition_details = self.wml_client.repository.store_definition(experiment_zip, metadata)
-        training_run_url = self.wml_client.repository.get_definition_url(definition_details)
+        training_run_url, definition_key = self.__store_definition(experiment_zip, metadata)
 
         training_reference = {
                     "name": run_name,
@@ -168,41 +271,239 @@ class Experiment:
 
         if self.rbfopt_config is not None:
             training_reference["hyper_parameters_optimization"] = self.rbfopt_config.get_hpo_config()
-        self.training_references.append(training_reference)
-
-        print("Training run %d added to experiment" % (len(self.training_references)))
 
-        run = TrainingRun(run_name, metadata, self.studio_utils, self.wml_client, self.project_utils.get_results_bucket())
+        if definition_key is not None:
+            with self.archives_lock:
+                self.reused_definitions.append((training_reference, definition_key, experiment_zip, metadata))
+
+        run = TrainingRun(run_name, metadata, self.studio_utils, self.wml_client,
+                          self.project_utils.get_results_bucket(self.data_set_name))
+        return training_reference, run
+
+    def __store_experiment(self):
+        return self.scheduler.call(RequestScheduler.METADATA, self.wml_client.repository.store_experiment,
+                                   meta_props=self.experiment_metadata)
+
+    # Return the reused definitions an error storing the experiment reports as missing.  Only a 404, or a 400
+    # naming a definition, means a definition is missing.  Any other error, e.g. auth, throttling or network
+    # errors, returns an empty list so it's raised instead.
+    def __get_missing_definitions(self, err):
+
+        status_code = get_status_code(err)
+        if status_code not in (400, 404):
+            return []
+
+        message = "%s %s" % (err, getattr(getattr(err, "response", None), "text", ""))
+        named = [reused for reused in self.reused_definitions
+                 if reused[0]["training_definition_url"].rstrip("/").split("/")[-1] in message]
+        if len(named) > 0 or status_code == 400:
+            return named
+
+        # A 404 that doesn't say which definition is missing
+        return list(self.reused_definitions)
+
+    # Forget the given cached definitions used by this experiment and store them again
+    def __store_reused_definitions(self, reused_definitions):
+
+        # Remove every key first so runs sharing a definition store it only once
+        for _, definition_key, _, _ in reused_definitions:
+            self.definition_cache.remove(definition_key)
+        for training_reference, _, experiment_zip, metadata in reused_definitions:
+            training_reference["training_definition_url"] = self.__store_definition(experiment_zip, metadata)[0]
+        self.reused_definitions = [reused for reused in self.reused_definitions if reused not in reused_definitions]
+
+    # Store a training definition unless an identical one (same .zip contents, framework, runtime and command)
+    # was already stored, in which case the existing definition is reused.  Returns the definition url plus the
+    # cache key if a cached definition was reused or None.
+    def __store_definition(self, experiment_zip, metadata):
+
+        definition_key = None
+        if self.definition_cache is not None:
+            wml_credentials = self.studio_utils.get_wml_credentials()
+            definition_key = self.definition_cache.get_key(experiment_zip, [
+                wml_credentials.get("url"),
+                wml_credentials.get("instance_id"),
+                self.framework_name,
+                self.framework_version,
+                self.runtime_name,
+                self.runtime_version,
+                metadata[self.wml_client.repository.DefinitionMetaNames.EXECUTION_COMMAND]
+            ])
+            training_run_url = self.definition_cache.get(definition_key)
+            if training_run_url is not None:
+                print("Reusing stored training definition: %s" % training_run_url)
+                return training_run_url, definition_key
+
+        definition_details = self.scheduler.call(RequestScheduler.METADATA,
+                                                 self.wml_client.repository.store_definition, experiment_zip, metadata)
+        training_run_url = self.wml_client.repository.get_definition_url(definition_details)
 
-        self.training_runs.append(run)
+        if definition_key is not None:
+            self.definition_cache.put(definition_key, training_run_url)
+        return training_run_url, None
 
-    def __update_training_run_ids(self):
+    # Poll the experiment run until every training run has been assigned a guid or guid_deadline seconds have
+    # passed.  Polls back off exponentially (with jitter so many experiments don't poll in lockstep) since most
+    # runs start within the first few seconds.
+    def __update_training_run_ids(self, guid_deadline):
 
-        # This method waits a max of 60 seconds for the trainings runs to start
         start = time.time()
 
         # Populate training runs with their guid so we can look up details as needed.
         print("Extracting guids for training runs")
-        runs_started = 0
-        while runs_started < len(self.training_runs) and time.time() - start < 60:
-
-            # Pause 1 second to give time for all runs to have started
-            time.sleep(1)
-            experiment_run_details = self.wml_client.experiments.get_run_details(self.experiment_run_guid)
-
-            # Loop through runs to assign variables.
-            for run_status in experiment_run_details["entity"]["training_statuses"]:
-                for run in self.training_runs:
-                    if run.get_name() == run_status["training_reference_name"] and run_status["training_guid"] is not None:
-                        run.set_guid(run_status["training_guid"])
-                        runs_started += 1
-
-        print("\nexperiment_details", json.dumps(experiment_run_details, indent=2))
-        if runs_started < len(self.training_runs):
-            print("Unable to obtain all training run guids")
+        experiment_run_details = None
+        delay = Experiment.GUID_POLL_INITIAL_DELAY
+        while any(run.get_guid() is None for run in self.training_runs):
+
+            remaining = guid_deadline - (time.time() - start)
+            if remaining <= 0:
+                break
+
+            time.sleep(min(delay / 2 + random.uniform(0, delay / 2), remaining))
+            delay = min(delay * 2, Experiment.GUID_POLL_MAX_DELAY)
+            experiment_run_details = self.studio_utils.get_details_cache().get_run_details(self.experiment_run_guid,
+                                                                                           max_age=0)
+
+            self.__set_training_run_ids(experiment_run_details)
+
+        unresolved_runs = [run.get_name() for run in self.training_runs if run.get_guid() is None]
+        if experiment_run_details is not None:
+            print("\nexperiment_details", json.dumps(experiment_run_details, indent=2))
+        if len(unresolved_runs) > 0:
+            print("Unable to obtain guids for %d training runs: %s" %
+                  (len(unresolved_runs), ", ".join(sorted(unresolved_runs))))
         else:
             print("All training run guids found")
 
+    # Look up each run without a guid by name in the experiment run's training statuses
+    def __set_training_run_ids(self, experiment_run_details):
+
+        unresolved_runs = {run.get_name(): run for run in self.training_runs if run.get_guid() is None}
+        for run_status in experiment_run_details["entity"]["training_statuses"]:
+            run = unresolved_runs.get(run_status["training_reference_name"])
+            if run is not None and run_status["training_guid"] is not None:
+                run.set_guid(run_status["training_guid"])
+
+# Splits a large set of training runs across several experiments of at most max_runs_per_experiment runs each
+# which are stored and submitted concurrently.  This keeps each experiment within the service's limits and lets
+# the experiments run side by side rather than queueing behind one huge experiment.  Run specs are the same as
+# for Experiment.add_training_runs().
+class ExperimentBatch:
+
+    DEFAULT_MAX_RUNS_PER_EXPERIMENT = 50
+
+    def __init__(self, experiment_name, experiment_description,
+                 framework_name, framework_version,
+                 runtime_name, runtime_version,
+                 studio_utils, project_utils,
+                 max_runs_per_experiment=DEFAULT_MAX_RUNS_PER_EXPERIMENT, max_workers=4):
+
+        if max_runs_per_experiment < 1:
+            raise ValueError("max_runs_per_experiment must be at least 1")
+
+        self.experiment_name = experiment_name
+        self.experiment_description = experiment_description
+        self.framework_name = framework_name
+        self.framework_version = framework_version
+        self.runtime_name = runtime_name
+        self.runtime_version = runtime_version
+        self.studio_utils = studio_utils
+        self.project_utils = project_utils
+        self.max_runs_per_experiment = max_runs_per_experiment
+        self.max_workers = max_workers
+
+        self.specs = []
+        self.experiments = []
+
+    def add_training_runs(self, specs):
+        self.specs.extend(specs)
+
+    # Create, populate and execute all experiments concurrently.  Returns the experiments in the order of the specs.
+    # If some experiments fail to start the ones that did start are kept in get_experiments(), so they can be
+    # monitored or cancelled, before an exception listing the failed chunks is raised.
+    def execute(self, guid_deadline=Experiment.GUID_DEADLINE):
+
+        if len(self.specs) == 0:
+            raise ValueError("No training runs were added")
+
+        chunks = [self.specs[index:index + self.max_runs_per_experiment]
+                  for index in range(0, len(self.specs), self.max_runs_per_experiment)]
+        print("Splitting %d training runs across %d experiments" % (len(self.specs), len(chunks)))
+
+        def execute_chunk(index):
+            name = self.experiment_name
+            if len(chunks) > 1:
+                name = "%s (%d of %d)" % (self.experiment_name, index + 1, len(chunks))
+            experiment = Experiment(name, self.experiment_description,
+                                    self.framework_name, self.framework_version,
+                                    self.runtime_name, self.runtime_version,
+                                    self.studio_utils, self.project_utils)
+            experiment.add_training_runs(chunks[index])
+            experiment.execute(guid_deadline=guid_deadline)
+            return experiment
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(execute_chunk, index) for index in range(len(chunks))]
+
+        self.experiments = []
+        failures = []
+        for index, future in enumerate(futures):
+            if future.exception() is not None:
+                failures.append((index, future.exception()))
+                continue
+            self.experiments.append(future.result())
+
+        if len(failures) > 0:
+            for index, err in failures:
+                print("Unable to execute experiment %d of %d: %s" % (index + 1, len(chunks), err))
+            raise Exception("%d of %d experiments failed to execute: %s" %
+                            (len(failures), len(chunks), ", ".join([str(index + 1) for index, _ in failures])))
+
+        return self.experiments
+
+    def get_experiments(self):
+        return self.experiments
+
+    def get_training_runs(self):
+        return [run for experiment in self.experiments for run in experiment.get_training_runs()]
+
+    def get_experiment_run_guids(self):
+        return [experiment.get_experiment_run_guid() for experiment in self.experiments]
+
+    # Training statuses of every experiment keyed by run name, with one experiment run details call per experiment
+    def get_training_statuses(self, max_age=None):
+
+        statuses = {}
+        for experiment in self.experiments:
+            statuses.update(experiment.get_training_statuses(max_age=max_age))
+        return statuses
+
+    def get_training_run_guids(self):
+        return [run.get_guid() for run in self.get_training_runs()]
+
+    # Combined summary of all experiments plus the number of training runs in each state
+    def get_experiment_summary(self):
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            summaries = list(executor.map(lambda experiment: experiment.get_experiment_summary(), self.experiments))
+
+        states = {}
+        for summary in summaries:
+            for run in summary["training_runs"]:
+                states[run["state"]] = states.get(run["state"], 0) + 1
+
+        return {
+            "experiment_name": self.experiment_name,
+            "training_run_count": len(self.specs),
+            "training_run_states": states,
+            "experiments": summaries
+        }
+
+    def print_experiment_summary(self):
+        summary = self.get_experiment_summary()
+        print("\n**** Experiment Batch Summary Start ****\n%s" % json.dumps(summary, indent=2))
+        print("**** Experiment Batch Summary End ****\n\n")
+
 # Helper class to track run details so we can match to guids and stats coming
 # back from Studio
 class TrainingRun:
@@ -227,3 +528,44 @@ class TrainingRun:
 
     def get_guid(self):
         return self.guid
+
+    # Latest training details from the shared details cache
+    def get_details(self, max_age=None):
+        if self.guid is None:
+            return None
+        return self.studio_utils.get_details_cache().get_training_details(self.guid, max_age=max_age)
+
+    # Contents of a file the training run wrote to $RESULT_DIR, e.g. "val_dict_list.json", or None if it's missing
+    def get_result_file(self, file_name):
+        if self.guid is None:
+            return None
+        return self.studio_utils.get_cos_utils().get_object_content(self.results_bucket,
+                                                                    "%s/%s" % (self.guid, file_name))
+
+    def cancel(self):
+        if self.guid is None:
+            return False
+        self.studio_utils.get_request_scheduler().call(RequestScheduler.RUN_SUBMIT, self.wml_client.training.cancel,
+                                                       self.guid)
+        self.studio_utils.get_details_cache().invalidate(self.guid)
+        return True
+
+
+# Objective value per epoch from the "val_dict_list.json" written by a TrainingRun or LocalTrainingRun, e.g.
+# {1: 0.81, 2: 0.86}.  Empty if the run hasn't written it (yet) or it can't be read.
+def read_objective_history(run, objective, results_file="val_dict_list.json"):
+
+    try:
+        content = run.get_result_file(results_file)
+    except Exception as err:
+        print("Unable to read %s of %s: %s" % (results_file, run.get_name(), err))
+        return {}
+    if content is None:
+        return {}
+
+    try:
+        return {int(entry["epoch"]): float(entry[objective]) for entry in json.loads(content.decode("utf-8"))
+                if objective in entry}
+    except (ValueError, KeyError, TypeError) as err:
+        print("Invalid %s for %s: %s" % (results_file, run.get_name(), err))
+        return {}
@@ -0,0 +1,411 @@
+import atexit
+import json
+import multiprocessing
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+import uuid
+import zipfile
+
+from concurrent.futures import ProcessPoolExecutor
+from experiment_archive import ExperimentArchive
+from project_utils import ProjectUtils
+
+
+# Runs an experiment's training runs on the local machine with the same API as Experiment.  Useful for cheap smoke
+# searches and CI without a round trip to WML.
+#
+# Each run's experiment .zip (including the config.json written by save_hyperparameters_config()) is extracted to
+# its own working directory and the execution command is run in a LocalWorkerPool.  Every worker process is pinned
+# to its own set of CPUs so concurrent runs don't compete for cores, and every LocalExperiment shares the default
+# pool unless given its own so searches creating many experiments don't oversubscribe the machine.  $DATA_DIR is
+# the directory ProjectUtils.download_dataset() saves the dataset to.  Results are written in the same layout as the
+# results bucket: $RESULT_DIR is "<results_directory>/<training guid>" (so val_dict_list.json ends up there) and the
+# command's output is saved to "<training guid>/learner-1/training-log.txt".
+class LocalExperiment:
+
+    def __init__(self, experiment_name, experiment_description,
+                 framework_name, framework_version,
+                 runtime_name, runtime_version,
+                 studio_utils=None, project_utils=None,
+                 results_directory=None, data_directory=None, worker_pool=None,
+                 data_set_name=ProjectUtils.DATA_SET_FASHION_MNIST):
+
+        if results_directory is None:
+            results_directory = os.path.join("local_runs", "results")
+        if data_directory is None:
+            data_directory = ProjectUtils.get_data_directory(data_set_name)
+        if worker_pool is None:
+            worker_pool = LocalWorkerPool.get_default()
+
+        self.experiment_name = experiment_name
+        self.experiment_description = experiment_description
+        self.framework_name = framework_name
+        self.framework_version = framework_version
+        self.runtime_name = runtime_name
+        self.runtime_version = runtime_version
+        self.studio_utils = studio_utils
+        self.project_utils = project_utils
+
+        self.results_directory = os.path.abspath(results_directory)
+        self.data_directory = os.path.abspath(data_directory)
+        self.worker_pool = worker_pool
+
+        self.experiment_guid = "local-experiment-%s" % uuid.uuid4().hex[:12]
+        self.experiment_run_guid = None
+        self.work_directory = os.path.join(os.path.dirname(self.results_directory), "work", self.experiment_guid)
+
+        self.training_runs = []
+        self.archives = {}
+        self.archives_lock = threading.Lock()
+
+    # Write hyperparameters to a "config.json" added to a copy of the training run's experiment.zip
+    def save_hyperparameters_config(self, hyperparameters, experiment_zip):
+        with self.archives_lock:
+            if experiment_zip not in self.archives:
+                self.archives[experiment_zip] = ExperimentArchive(experiment_zip)
+            archive = self.archives[experiment_zip]
+        return archive.save(hyperparameters)
+
+    def set_rbfopt_config(self, rbfopt_config):
+        raise ValueError("RBFOpt HPO is only available when running experiments in WML")
+
+    # gpu_type is ignored when running locally
+    def add_training_run(self, run_name, command, experiment_zip, gpu_type=None):
+
+        guid = "local-training-%s" % uuid.uuid4().hex[:12]
+        working_directory = os.path.join(self.work_directory, guid)
+        os.makedirs(working_directory, exist_ok=True)
+        with zipfile.ZipFile(experiment_zip) as z:
+            z.extractall(working_directory)
+
+        metadata = {
+            "name": run_name,
+            "framework_name": self.framework_name,
+            "framework_version": self.framework_version,
+            "runtime_name": self.runtime_name,
+            "runtime_version": self.runtime_version,
+            "execution_command": command
+        }
+        run = LocalTrainingRun(run_name, metadata, guid, working_directory,
+                               os.path.join(self.results_directory, guid))
+        self.training_runs.append(run)
+
+        print("Training run %d added to experiment" % (len(self.training_runs)))
+
+    # Same specs as Experiment.add_training_runs()
+    def add_training_runs(self, specs, max_workers=8):
+
+        timings = []
+        for spec in specs:
+            start = time.time()
+            experiment_zip = spec["experiment_zip"]
+            if spec.get("hyperparameters") is not None:
+                experiment_zip = self.save_hyperparameters_config(spec["hyperparameters"], experiment_zip)
+            self.add_training_run(spec["name"], spec["command"], experiment_zip, spec.get("gpu_type"))
+            timings.append({"name": spec["name"], "archive_seconds": time.time() - start, "store_seconds": 0})
+        return timings
+
+    # Start all training runs in the worker pool.  Like Experiment.execute() this returns once the runs have
+    # been submitted; call wait() to block until they have finished.
+    def execute(self, guid_deadline=None):
+
+        print("Starting local experiment: {}".format(self.experiment_name))
+        self.__cleanup_archives()
+        self.experiment_run_guid = "local-run-%s" % uuid.uuid4().hex[:12]
+
+        for run in self.training_runs:
+            if run.get_state() == LocalTrainingRun.STATE_PENDING:
+                run.start(self.worker_pool, self.data_directory)
+
+        print("Experiment started with {} training runs".format(len(self.training_runs)))
+        return {"metadata": {"guid": self.experiment_run_guid}}, self.experiment_guid
+
+    # Block until every training run has finished.  Returns the final state of each run keyed by guid.
+    def wait(self):
+        for run in self.training_runs:
+            run.wait()
+        return {run.get_guid(): run.get_state() for run in self.training_runs}
+
+    def get_training_runs(self):
+        return self.training_runs
+
+    def get_experiment_run_guid(self):
+        return self.experiment_run_guid
+
+    # Statuses of the training runs keyed by run name, shaped like Experiment.get_training_statuses()
+    def get_training_statuses(self, max_age=None):
+        return {run.get_name(): {"training_reference_name": run.get_name(), "training_guid": run.get_guid(),
+                                 "state": run.get_details()["entity"]["status"]["state"]}
+                for run in self.training_runs}
+
+    def get_results_directory(self):
+        return self.results_directory
+
+    def get_worker_pool(self):
+        return self.worker_pool
+
+    def get_experiment_summary(self):
+
+        summary = {
+            "experiment_run_guid": self.experiment_run_guid,
+            "experiment_guid": self.experiment_guid,
+            "training_runs": []
+        }
+        for run in self.training_runs:
+            summary["training_runs"].append({
+                "name": run.get_name(),
+                "guid": run.get_guid(),
+                "state": run.get_state(),
+                "metadata": run.get_metadata()
+            })
+        return summary
+
+    def print_experiment_summary(self):
+        summary = self.get_experiment_summary()
+        print("\n**** Experiment Summary Start ****\n%s" % json.dumps(summary, indent=2))
+        print("**** Experiment Summary End ****\n\n")
+
+    def __cleanup_archives(self):
+        # Archives have already been extracted to the runs' working directories
+        with self.archives_lock:
+            for archive in self.archives.values():
+                archive.cleanup()
+            self.archives = {}
+
+
+# Process pool running the training commands of LocalExperiments.  Worker processes are started on first use and
+# each is pinned to its own set of CPUs.  Experiments share the default pool (half of the CPUs) unless they're
+# given their own, e.g. LocalExperiment(..., worker_pool=LocalWorkerPool(max_workers=2)).  Every pool is shut down
+# when the interpreter exits, which waits for the submitted runs to finish.
+class LocalWorkerPool:
+
+    default_pool = None
+    default_pool_lock = threading.Lock()
+
+    def __init__(self, max_workers=None, pin_cpus=True):
+
+        if max_workers is None:
+            max_workers = max(multiprocessing.cpu_count() // 2, 1)
+
+        self.max_workers = max_workers
+        self.pin_cpus = pin_cpus
+        self.executor = None
+        self.lock = threading.Lock()
+
+        atexit.register(self.shutdown)
+
+    @staticmethod
+    def get_default():
+        with LocalWorkerPool.default_pool_lock:
+            if LocalWorkerPool.default_pool is None:
+                LocalWorkerPool.default_pool = LocalWorkerPool()
+            return LocalWorkerPool.default_pool
+
+    def get_max_workers(self):
+        return self.max_workers
+
+    def submit(self, function, *args):
+
+        with self.lock:
+            if self.executor is None:
+                cpu_sets = multiprocessing.Queue()
+                for cpus in LocalWorkerPool.__get_cpu_sets(self.max_workers) if self.pin_cpus else []:
+                    cpu_sets.put(cpus)
+                self.executor = ProcessPoolExecutor(max_workers=self.max_workers, initializer=_initialize_worker,
+                                                    initargs=(cpu_sets,))
+            return self.executor.submit(function, *args)
+
+    # Stop the worker processes once the submitted runs have finished.  The pool starts new workers if it's used
+    # again.
+    def shutdown(self, wait=True):
+        with self.lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=wait)
+                self.executor = None
+
+    # Split the available CPUs into one set per worker
+    @staticmethod
+    def __get_cpu_sets(worker_count):
+
+        if not hasattr(os, "sched_getaffinity"):
+            # CPU pinning is only supported on Linux
+            return []
+
+        cpus = sorted(os.sched_getaffinity(0))
+        if len(cpus) < worker_count:
+            return [cpus] * worker_count
+
+        size = len(cpus) // worker_count
+        return [cpus[index * size:(index + 1) * size] for index in range(worker_count)]
+
+
+# Tracks a training run executed by LocalExperiment.  Offers the same methods as TrainingRun plus details shaped
+# like WML's training details so ExperimentMonitor can watch local runs too.
+class LocalTrainingRun:
+
+    STATE_PENDING = "pending"
+    STATE_RUNNING = "running"
+    STATE_COMPLETED = "completed"
+    STATE_ERROR = "error"
+    STATE_CANCELED = "canceled"
+
+    def __init__(self, name, metadata, guid, working_directory, result_directory):
+
+        self.name = name
+        self.metadata = metadata
+        self.guid = guid
+        self.working_directory = working_directory
+        self.result_directory = result_directory
+        self.future = None
+        self.cancel_requested = False
+        self.cancel_lock = threading.Lock()
+        self.return_code = None
+        self.submitted = None
+        self.finished = None
+
+    def get_name(self):
+        return self.name
+
+    def get_metadata(self):
+        return self.metadata
+
+    def set_guid(self, guid):
+        self.guid = guid
+
+    def get_guid(self):
+        return self.guid
+
+    def get_result_directory(self):
+        return self.result_directory
+
+    def get_log_file(self):
+        return os.path.join(self.result_directory, "learner-1", "training-log.txt")
+
+    def get_state(self):
+        if self.future is None:
+            return LocalTrainingRun.STATE_PENDING
+        if self.future.cancelled():
+            return LocalTrainingRun.STATE_CANCELED
+        if not self.future.done():
+            return LocalTrainingRun.STATE_RUNNING if self.future.running() else LocalTrainingRun.STATE_PENDING
+        if self.future.exception() is None and self.future.result() == 0:
+            return LocalTrainingRun.STATE_COMPLETED
+        if self.cancel_requested:
+            return LocalTrainingRun.STATE_CANCELED
+        return LocalTrainingRun.STATE_ERROR
+
+    def get_details(self, max_age=None):
+
+        status = {"state": self.get_state()}
+        if self.future is not None and self.future.done() and not self.future.cancelled():
+            if self.future.exception() is not None:
+                status["message"] = str(self.future.exception())
+            else:
+                status["return_code"] = self.future.result()
+        return {"metadata": {"guid": self.guid}, "entity": {"status": status}}
+
+    def get_result_file(self, file_name):
+        result_file = os.path.join(self.result_directory, file_name)
+        if not os.path.isfile(result_file):
+            return None
+        with open(result_file, "rb") as f:
+            return f.read()
+
+    # Pending runs are removed from the pool and running runs have their command (and its child processes)
+    # terminated.  Returns False if the run had already finished.
+    def cancel(self):
+
+        with self.cancel_lock:
+            if self.future is None or self.future.done():
+                return False
+            if self.future.cancel():
+                return True
+
+            # The worker checks for the marker after starting the command in case it hadn't written its pid yet.  The
+            # working directory is removed once the command exits so a missing directory means it already finished.
+            try:
+                open(os.path.join(self.working_directory, _CANCEL_FILE), "w").close()
+            except FileNotFoundError:
+                return False
+            self.cancel_requested = True
+
+            try:
+                with open(os.path.join(self.working_directory, _PID_FILE)) as file:
+                    pid = int(file.read())
+            except (OSError, ValueError):
+                # Not started yet, or finished in the meantime
+                return True
+            _terminate(pid)
+            return True
+
+    def start(self, worker_pool, data_directory):
+        self.future = worker_pool.submit(_run_training, self.metadata["execution_command"], self.working_directory,
+                                         self.result_directory, data_directory, self.guid)
+
+    def wait(self):
+        if self.future is not None and not self.future.cancelled():
+            try:
+                self.future.result()
+            except Exception as err:
+                print("Training run %s failed: %s" % (self.name, err))
+
+
+# Files in a run's working directory used to cancel a running command
+_PID_FILE = ".training.pid"
+_CANCEL_FILE = ".training.cancel"
+
+
+def _initialize_worker(cpu_sets):
+
+    # Children of this worker, i.e. the training commands, inherit its CPU affinity
+    try:
+        cpus = cpu_sets.get_nowait()
+        os.sched_setaffinity(0, cpus)
+    except Exception:
+        pass
+
+
+# Run a training command with the environment variables WML provides and return its exit code
+def _run_training(command, working_directory, result_directory, data_directory, guid):
+
+    log_directory = os.path.join(result_directory, "learner-1")
+    os.makedirs(log_directory, exist_ok=True)
+    os.makedirs(os.path.join(result_directory, "logs"), exist_ok=True)
+
+    environment = dict(os.environ)
+    environment.update({
+        "DATA_DIR": data_directory,
+        "RESULT_DIR": result_directory,
+        "LOG_DIR": os.path.join(result_directory, "logs"),
+        "JOB_STATE_DIR": result_directory,
+        "TRAINING_ID": guid
+    })
+
+    # The command runs in its own process group so cancel() can terminate it together with its children
+    with open(os.path.join(log_directory, "training-log.txt"), "w") as log_file:
+        process = subprocess.Popen(command, shell=True, cwd=working_directory, env=environment,
+                                   stdout=log_file, stderr=subprocess.STDOUT, start_new_session=True)
+        with open(os.path.join(working_directory, _PID_FILE), "w") as file:
+            file.write(str(process.pid))
+        if os.path.exists(os.path.join(working_directory, _CANCEL_FILE)):
+            _terminate(process.pid)
+        process.wait()
+
+    # The working directory only holds the extracted experiment so it isn't needed anymore
+    shutil.rmtree(working_directory, ignore_errors=True)
+    return process.returncode
+
+
+def _terminate(pid):
+    try:
+        if hasattr(os, "killpg"):
+            os.killpg(pid, signal.SIGTERM)
+        else:
+            os.kill(pid, signal.SIGTERM)
+    except OSError:
+        # Already finished
+        pass
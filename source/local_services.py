@@ -0,0 +1,672 @@
+import base64
+import collections
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import uuid
+
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+from urllib.parse import parse_qs, unquote, urlparse
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+
+# Latency, throttling and failure behaviour shared by the local WML and COS stand-ins.  Every call sleeps for
+# latency seconds (plus up to latency_jitter), then fails with a 429 when more than rate_limit calls were made in
+# the last second or, at random, with throttle_rate, and otherwise fails with a 500 with failure_rate.
+class ServiceProfile:
+
+    def __init__(self, latency=0.0, latency_jitter=0.0, rate_limit=None, throttle_rate=0.0, failure_rate=0.0,
+                 retry_after=1, seed=None):
+
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.rate_limit = rate_limit
+        self.throttle_rate = throttle_rate
+        self.failure_rate = failure_rate
+        self.retry_after = retry_after
+
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.call_times = collections.deque()
+        self.stats = {}
+
+    # Simulate a call to endpoint.  Raises a LocalServiceError when the call is throttled or fails.
+    def apply(self, endpoint):
+
+        with self.lock:
+            now = time.time()
+            while len(self.call_times) > 0 and self.call_times[0] <= now - 1:
+                self.call_times.popleft()
+            self.call_times.append(now)
+
+            stats = self.stats.setdefault(endpoint, {"calls": 0, "throttled": 0, "failed": 0})
+            stats["calls"] += 1
+
+            delay = self.latency + self.random.uniform(0, self.latency_jitter)
+            status_code = None
+            if self.rate_limit is not None and len(self.call_times) > self.rate_limit:
+                status_code = 429
+            elif self.random.random() < self.throttle_rate:
+                status_code = 429
+            elif self.random.random() < self.failure_rate:
+                status_code = 500
+
+            if status_code == 429:
+                stats["throttled"] += 1
+            elif status_code == 500:
+                stats["failed"] += 1
+
+        if delay > 0:
+            time.sleep(delay)
+        if status_code is not None:
+            raise LocalServiceError(status_code, endpoint, self.retry_after if status_code == 429 else None)
+
+    # Calls, throttled calls and failed calls per endpoint
+    def get_stats(self):
+        with self.lock:
+            return {endpoint: dict(stats) for endpoint, stats in self.stats.items()}
+
+
+# Raised by the local stand-ins.  Carries a response with status_code and headers like the WML client's errors so
+# RequestScheduler handles it the same way.
+class LocalServiceError(Exception):
+
+    def __init__(self, status_code, endpoint, retry_after=None, message=None):
+        super().__init__("%s failed with status %d%s" % (endpoint, status_code,
+                                                         "" if message is None else ": " + message))
+        headers = {} if retry_after is None else {"Retry-After": str(retry_after)}
+        self.response = _LocalResponse(status_code, headers)
+
+
+class _LocalResponse:
+
+    def __init__(self, status_code, headers):
+        self.status_code = status_code
+        self.headers = headers
+
+
+# In-process stand-in for the WML client covering the calls made by Experiment, TrainingRun and DetailsCache.
+# Submitted training runs are pending for queue_seconds, running for about training_seconds and then completed
+# (or failed with run_failure_rate).  Training guids only appear in the experiment run details after guid_delay
+# seconds, like the real service.
+#
+# studio_utils.set_wml_client(LocalWmlClient()) makes every utility use the stand-in.
+class LocalWmlClient:
+
+    def __init__(self, profile=None, queue_seconds=1.0, training_seconds=5.0, guid_delay=0.5, run_failure_rate=0.0,
+                 seed=None):
+
+        self.version = "local"
+        self.profile = profile if profile is not None else ServiceProfile()
+        self.queue_seconds = queue_seconds
+        self.training_seconds = training_seconds
+        self.guid_delay = guid_delay
+        self.run_failure_rate = run_failure_rate
+
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.definitions = {}
+        self.stored_experiments = {}
+        self.experiment_runs = {}
+        self.training_runs = {}
+
+        self.repository = _LocalRepository(self)
+        self.experiments = _LocalExperiments(self)
+        self.training = _LocalTraining(self)
+
+    def get_stats(self):
+        return self.profile.get_stats()
+
+    def create_training_run(self, reference):
+
+        training_guid = "training-%s" % uuid.uuid4().hex[:9]
+        with self.lock:
+            self.training_runs[training_guid] = {
+                "name": reference["name"],
+                "submitted": time.time(),
+                "duration": self.training_seconds * self.random.uniform(0.8, 1.2),
+                "fails": self.random.random() < self.run_failure_rate,
+                "canceled": False
+            }
+        return training_guid
+
+    def get_training_state(self, training_guid):
+
+        run = self.training_runs.get(training_guid)
+        if run is None:
+            raise LocalServiceError(404, "training.get_details")
+
+        elapsed = time.time() - run["submitted"]
+        if run["canceled"]:
+            return "canceled"
+        if elapsed < self.queue_seconds:
+            return "pending"
+        if elapsed < self.queue_seconds + run["duration"]:
+            return "running"
+        return "failed" if run["fails"] else "completed"
+
+    def get_training_details(self, training_guid):
+
+        state = self.get_training_state(training_guid)
+        run = self.training_runs[training_guid]
+        return {
+            "metadata": {"guid": training_guid},
+            "entity": {
+                "training_definition": {"name": run["name"]},
+                "status": {"state": state, "submitted_at": formatdate(run["submitted"], usegmt=True)}
+            }
+        }
+
+
+class _LocalRepository:
+
+    class DefinitionMetaNames:
+        NAME = "name"
+        DESCRIPTION = "description"
+        FRAMEWORK_NAME = "framework_name"
+        FRAMEWORK_VERSION = "framework_version"
+        RUNTIME_NAME = "runtime_name"
+        RUNTIME_VERSION = "runtime_version"
+        EXECUTION_COMMAND = "command"
+
+    class ExperimentMetaNames:
+        NAME = "name"
+        DESCRIPTION = "description"
+        TAGS = "tags"
+        TRAINING_DATA_REFERENCE = "training_data_reference"
+        TRAINING_RESULTS_REFERENCE = "training_results_reference"
+        TRAINING_REFERENCES = "training_references"
+
+    def __init__(self, client):
+        self.client = client
+
+    def store_definition(self, training_definition, meta_props):
+
+        self.client.profile.apply("repository.store_definition")
+        if not os.path.isfile(training_definition):
+            raise ValueError("Training definition not found: %s" % training_definition)
+
+        guid = str(uuid.uuid4())
+        url = "http://localhost/v3/ml_assets/training_definitions/%s" % guid
+        with self.client.lock:
+            self.client.definitions[url] = {"meta_props": dict(meta_props),
+                                            "size": os.path.getsize(training_definition)}
+        return {"metadata": {"guid": guid, "url": url}, "entity": dict(meta_props)}
+
+    def get_definition_url(self, definition_details):
+        return definition_details["metadata"]["url"]
+
+    def store_experiment(self, meta_props):
+
+        self.client.profile.apply("repository.store_experiment")
+        for reference in meta_props.get(self.ExperimentMetaNames.TRAINING_REFERENCES, []):
+            if reference["training_definition_url"] not in self.client.definitions:
+                raise LocalServiceError(404, "repository.store_experiment",
+                                        message="Unknown training definition: %s" %
+                                                reference["training_definition_url"])
+
+        guid = str(uuid.uuid4())
+        with self.client.lock:
+            self.client.stored_experiments[guid] = json.loads(json.dumps(meta_props))
+        return {"metadata": {"guid": guid}, "entity": {"settings": meta_props}}
+
+    def get_experiment_uid(self, experiment_details):
+        return experiment_details["metadata"]["guid"]
+
+
+class _LocalExperiments:
+
+    def __init__(self, client):
+        self.client = client
+
+    def run(self, experiment_uid, asynchronous=True):
+
+        self.client.profile.apply("experiments.run")
+        experiment = self.client.stored_experiments.get(experiment_uid)
+        if experiment is None:
+            raise LocalServiceError(404, "experiments.run")
+
+        references = experiment.get(_LocalRepository.ExperimentMetaNames.TRAINING_REFERENCES, [])
+        experiment_run_guid = str(uuid.uuid4())
+        with self.client.lock:
+            self.client.experiment_runs[experiment_run_guid] = {"experiment_guid": experiment_uid,
+                                                                "submitted": time.time(),
+                                                                "training_guids": []}
+        training_guids = [self.client.create_training_run(reference) for reference in references]
+        self.client.experiment_runs[experiment_run_guid]["training_guids"] = training_guids
+        return self.__get_details(experiment_run_guid)
+
+    def get_run_details(self, experiment_run_uid):
+        self.client.profile.apply("experiments.get_run_details")
+        return self.__get_details(experiment_run_uid)
+
+    def __get_details(self, experiment_run_guid):
+
+        experiment_run = self.client.experiment_runs.get(experiment_run_guid)
+        if experiment_run is None:
+            raise LocalServiceError(404, "experiments.get_run_details")
+
+        # Training guids only become visible after a short delay
+        visible = time.time() - experiment_run["submitted"] >= self.client.guid_delay
+        statuses = []
+        states = []
+        for training_guid in experiment_run["training_guids"]:
+            state = self.client.get_training_state(training_guid)
+            states.append(state)
+            statuses.append({
+                "training_reference_name": self.client.training_runs[training_guid]["name"],
+                "training_guid": training_guid if visible else None,
+                "state": state
+            })
+
+        if len(states) > 0 and all(state in ["completed", "failed", "canceled"] for state in states):
+            state = "completed"
+        elif "running" in states:
+            state = "running"
+        else:
+            state = "pending"
+
+        return {
+            "metadata": {"guid": experiment_run_guid},
+            "entity": {
+                "experiment_run_status": {"state": state},
+                "training_statuses": statuses
+            }
+        }
+
+
+class _LocalTraining:
+
+    def __init__(self, client):
+        self.client = client
+
+    def get_details(self, run_uid=None):
+        self.client.profile.apply("training.get_details")
+        return self.client.get_training_details(run_uid)
+
+    def get_status(self, run_uid):
+        return self.get_details(run_uid)["entity"]["status"]
+
+    def cancel(self, run_uid):
+
+        self.client.profile.apply("training.cancel")
+        with self.client.lock:
+            run = self.client.training_runs.get(run_uid)
+            if run is None:
+                raise LocalServiceError(404, "training.cancel")
+            if self.client.get_training_state(run_uid) in ["pending", "running"]:
+                run["canceled"] = True
+
+
+# S3 compatible object store on localhost covering the requests made by CosUtils: buckets, objects with metadata,
+# Range and If-Match reads, multipart uploads and both versions of ListObjects.  Objects are kept in memory.
+# Requests aren't authenticated so any HMAC keys are accepted.
+#
+#   server = LocalCosServer(profile=ServiceProfile(latency=0.02))
+#   server.start()
+#   cos_utils = CosUtils(server.get_credentials(), "us-south")
+#   ...
+#   server.stop()
+class LocalCosServer(ThreadingMixIn, HTTPServer):
+
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, profile=None):
+
+        HTTPServer.__init__(self, (host, port), _CosRequestHandler)
+        self.profile = profile if profile is not None else ServiceProfile()
+        self.lock = threading.Lock()
+        self.buckets = {}
+        self.uploads = {}
+        self.thread = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+        print("Local COS server listening on %s" % self.get_endpoint())
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self.thread is not None:
+            self.thread.join()
+
+    def get_endpoint(self):
+        return "http://%s:%d" % self.server_address[:2]
+
+    # COS credentials for CosUtils pointing at this server.  Requests are signed with the HMAC keys rather than IAM.
+    def get_credentials(self):
+        return {
+            "apikey": "local",
+            "resource_instance_id": "local",
+            "cos_hmac_keys": {"access_key_id": "local", "secret_access_key": "local"},
+            "cos_service_endpoint": self.get_endpoint(),
+            "auth_method": "hmac"
+        }
+
+    def get_stats(self):
+        return self.profile.get_stats()
+
+
+class _CosRequestHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self.__handle("GET")
+
+    def do_HEAD(self):
+        self.__handle("HEAD")
+
+    def do_PUT(self):
+        self.__handle("PUT")
+
+    def do_POST(self):
+        self.__handle("POST")
+
+    def do_DELETE(self):
+        self.__handle("DELETE")
+
+    def __handle(self, method):
+
+        url = urlparse(self.path)
+        self.query = {name: values[0] for name, values in parse_qs(url.query, keep_blank_values=True).items()}
+        path = unquote(url.path).lstrip("/")
+        bucket, _, key = path.partition("/")
+        body = self.__read_body() if method in ["PUT", "POST"] else b""
+
+        try:
+            self.server.profile.apply("%s %s" % (method, "object" if key else "bucket" if bucket else "service"))
+        except LocalServiceError as err:
+            code = "SlowDown" if err.response.status_code == 429 else "InternalError"
+            return self.__send_error(err.response.status_code, code, str(err), method, err.response.headers)
+
+        if bucket == "":
+            return self.__list_buckets(method)
+        if key == "":
+            return self.__handle_bucket(method, bucket, body)
+        return self.__handle_object(method, bucket, key, body)
+
+    def __handle_bucket(self, method, bucket, body):
+
+        store = self.server.buckets
+        if method == "PUT":
+            with self.server.lock:
+                store.setdefault(bucket, {})
+            return self.__send(200, method=method)
+        if bucket not in store:
+            return self.__send_error(404, "NoSuchBucket", bucket, method)
+        if method == "HEAD":
+            return self.__send(200, method=method)
+        if method == "DELETE":
+            if len(store[bucket]) > 0:
+                return self.__send_error(409, "BucketNotEmpty", bucket, method)
+            with self.server.lock:
+                del store[bucket]
+            return self.__send(204, method=method)
+        if method == "POST" and "delete" in self.query:
+            return self.__delete_objects(bucket, body)
+        if method == "GET":
+            return self.__list_objects(bucket)
+        return self.__send_error(405, "MethodNotAllowed", method, method)
+
+    def __handle_object(self, method, bucket, key, body):
+
+        if bucket not in self.server.buckets:
+            return self.__send_error(404, "NoSuchBucket", bucket, method)
+        objects = self.server.buckets[bucket]
+
+        if method == "POST" and "uploads" in self.query:
+            return self.__create_multipart_upload(bucket, key)
+        if method == "PUT" and "uploadId" in self.query:
+            return self.__upload_part(body)
+        if method == "POST" and "uploadId" in self.query:
+            return self.__complete_multipart_upload(bucket, key, body)
+        if method == "DELETE" and "uploadId" in self.query:
+            with self.server.lock:
+                self.server.uploads.pop(self.query["uploadId"], None)
+            return self.__send(204, method=method)
+
+        if method == "PUT":
+            self.__put_object(bucket, key, body, hashlib.md5(body).hexdigest())
+            return self.__send(200, headers={"ETag": '"%s"' % objects[key]["etag"]}, method=method)
+        if method == "DELETE":
+            with self.server.lock:
+                objects.pop(key, None)
+            return self.__send(204, method=method)
+
+        obj = objects.get(key)
+        if obj is None:
+            return self.__send_error(404, "NoSuchKey", key, method)
+
+        etag = '"%s"' % obj["etag"]
+        if self.headers.get("If-Match") not in [None, etag, obj["etag"]]:
+            return self.__send_error(412, "PreconditionFailed", key, method)
+
+        headers = {"ETag": etag, "Last-Modified": formatdate(obj["modified"], usegmt=True),
+                   "Accept-Ranges": "bytes", "Content-Type": "binary/octet-stream"}
+        for name, value in obj["metadata"].items():
+            headers["x-amz-meta-%s" % name] = value
+
+        data = obj["data"]
+        status = 200
+        byte_range = self.headers.get("Range")
+        if byte_range is not None and byte_range.startswith("bytes="):
+            start, _, end = byte_range[len("bytes="):].partition("-")
+            if start == "":
+                start = max(len(data) - int(end), 0)
+                end = len(data) - 1
+            else:
+                start = int(start)
+                end = min(int(end), len(data) - 1) if end != "" else len(data) - 1
+            if start >= len(data):
+                return self.__send_error(416, "InvalidRange", byte_range, method)
+            headers["Content-Range"] = "bytes %d-%d/%d" % (start, end, len(data))
+            data = data[start:end + 1]
+            status = 206
+
+        if method == "HEAD":
+            headers["Content-Length"] = str(len(data))
+            return self.__send(status, headers=headers, method=method)
+        return self.__send(status, data, headers, method)
+
+    def __put_object(self, bucket, key, data, etag):
+
+        metadata = {}
+        for name, value in self.headers.items():
+            if name.lower().startswith("x-amz-meta-"):
+                metadata[name.lower()[len("x-amz-meta-"):]] = value
+
+        with self.server.lock:
+            self.server.buckets[bucket][key] = {"data": data, "etag": etag, "modified": time.time(),
+                                                "metadata": metadata}
+
+    def __create_multipart_upload(self, bucket, key):
+
+        upload_id = uuid.uuid4().hex
+        metadata = {name.lower()[len("x-amz-meta-"):]: value for name, value in self.headers.items()
+                    if name.lower().startswith("x-amz-meta-")}
+        with self.server.lock:
+            self.server.uploads[upload_id] = {"parts": {}, "metadata": metadata}
+        return self.__send_xml("InitiateMultipartUploadResult",
+                               "<Bucket>%s</Bucket><Key>%s</Key><UploadId>%s</UploadId>" %
+                               (escape(bucket), escape(key), upload_id))
+
+    def __upload_part(self, body):
+
+        upload = self.server.uploads.get(self.query["uploadId"])
+        if upload is None:
+            return self.__send_error(404, "NoSuchUpload", self.query["uploadId"], "PUT")
+        etag = hashlib.md5(body).hexdigest()
+        with self.server.lock:
+            upload["parts"][int(self.query["partNumber"])] = (body, etag)
+        return self.__send(200, headers={"ETag": '"%s"' % etag}, method="PUT")
+
+    def __complete_multipart_upload(self, bucket, key, body):
+
+        with self.server.lock:
+            upload = self.server.uploads.pop(self.query["uploadId"], None)
+        if upload is None:
+            return self.__send_error(404, "NoSuchUpload", self.query["uploadId"], "POST")
+
+        part_numbers = [int(element.text) for element in ElementTree.fromstring(body).iter()
+                        if element.tag.endswith("PartNumber")]
+        if any(number not in upload["parts"] for number in part_numbers):
+            return self.__send_error(400, "InvalidPart", key, "POST")
+
+        data = b"".join(upload["parts"][number][0] for number in part_numbers)
+        digests = b"".join(bytes.fromhex(upload["parts"][number][1]) for number in part_numbers)
+        etag = "%s-%d" % (hashlib.md5(digests).hexdigest(), len(part_numbers))
+        self.__put_object(bucket, key, data, etag)
+        self.server.buckets[bucket][key]["metadata"] = upload["metadata"]
+        return self.__send_xml("CompleteMultipartUploadResult",
+                               "<Bucket>%s</Bucket><Key>%s</Key><ETag>&quot;%s&quot;</ETag>" %
+                               (escape(bucket), escape(key), etag))
+
+    def __delete_objects(self, bucket, body):
+
+        keys = [element.text for element in ElementTree.fromstring(body).iter() if element.tag.endswith("Key")]
+        with self.server.lock:
+            for key in keys:
+                self.server.buckets[bucket].pop(key, None)
+        return self.__send_xml("DeleteResult", "".join("<Deleted><Key>%s</Key></Deleted>" % escape(key)
+                                                       for key in keys))
+
+    def __list_buckets(self, method):
+
+        buckets = "".join("<Bucket><Name>%s</Name><CreationDate>%s</CreationDate></Bucket>" %
+                          (escape(name), "2018-01-01T00:00:00.000Z") for name in sorted(self.server.buckets))
+        return self.__send_xml("ListAllMyBucketsResult",
+                               "<Owner><ID>local</ID></Owner><Buckets>%s</Buckets>" % buckets)
+
+    def __list_objects(self, bucket):
+
+        prefix = self.query.get("prefix", "")
+        delimiter = self.query.get("delimiter", "")
+        max_keys = int(self.query.get("max-keys", 1000))
+        is_v2 = self.query.get("list-type") == "2"
+        if not is_v2:
+            marker = self.query.get("marker", "")
+        elif "continuation-token" in self.query:
+            marker = base64.urlsafe_b64decode(self.query["continuation-token"].encode("ascii")).decode("utf-8")
+        else:
+            marker = self.query.get("start-after", "")
+
+        # A marker ending with the delimiter is a common prefix whose keys were already rolled up
+        skip_prefix = None
+        if delimiter != "" and marker.endswith(delimiter) and len(marker) > len(prefix) and marker.startswith(prefix):
+            skip_prefix = marker
+
+        with self.server.lock:
+            keys = sorted(key for key in self.server.buckets[bucket] if key.startswith(prefix) and key > marker and
+                          (skip_prefix is None or not key.startswith(skip_prefix)))
+
+        contents = []
+        common_prefixes = []
+        last_key = None
+        truncated = False
+        for key in keys:
+            if len(contents) + len(common_prefixes) >= max_keys:
+                truncated = True
+                break
+
+            if delimiter != "" and delimiter in key[len(prefix):]:
+                common_prefix = key[:len(prefix) + key[len(prefix):].index(delimiter) + len(delimiter)]
+                if common_prefix not in common_prefixes:
+                    common_prefixes.append(common_prefix)
+                last_key = key
+                continue
+
+            obj = self.server.buckets[bucket][key]
+            contents.append("<Contents><Key>%s</Key><LastModified>%s</LastModified><ETag>&quot;%s&quot;</ETag>"
+                            "<Size>%d</Size><StorageClass>STANDARD</StorageClass></Contents>" %
+                            (escape(key), time.strftime("%Y-%m-%dT%H:%M:%S.000Z", time.gmtime(obj["modified"])),
+                             obj["etag"], len(obj["data"])))
+            last_key = key
+
+        # Continue after the last common prefix rather than its last key so it's only listed once
+        if truncated and len(common_prefixes) > 0 and last_key.startswith(common_prefixes[-1]):
+            last_key = common_prefixes[-1]
+
+        body = "<Name>%s</Name><Prefix>%s</Prefix><MaxKeys>%d</MaxKeys><IsTruncated>%s</IsTruncated>" % \
+               (escape(bucket), escape(prefix), max_keys, "true" if truncated else "false")
+        if delimiter != "":
+            body += "<Delimiter>%s</Delimiter>" % escape(delimiter)
+        if is_v2:
+            body += "<KeyCount>%d</KeyCount>" % (len(contents) + len(common_prefixes))
+            if truncated:
+                # Tokens are opaque to clients, any key is safe to send once encoded
+                token = base64.urlsafe_b64encode(last_key.encode("utf-8")).decode("ascii")
+                body += "<NextContinuationToken>%s</NextContinuationToken>" % token
+        elif truncated:
+            body += "<NextMarker>%s</NextMarker>" % escape(last_key)
+        body += "".join(contents)
+        body += "".join("<CommonPrefixes><Prefix>%s</Prefix></CommonPrefixes>" % escape(common_prefix)
+                        for common_prefix in common_prefixes)
+        return self.__send_xml("ListBucketResult", body)
+
+    def __read_body(self):
+
+        if "chunked" in self.headers.get("Transfer-Encoding", ""):
+            body = b""
+            while True:
+                size = int(self.rfile.readline().split(b";")[0].strip(), 16)
+                chunk = self.rfile.read(size)
+                self.rfile.readline()
+                if size == 0:
+                    break
+                body += chunk
+        else:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+        if "aws-chunked" in self.headers.get("Content-Encoding", ""):
+            body = _decode_aws_chunked(body)
+        return body
+
+    def __send_xml(self, root, body):
+        data = ('<?xml version="1.0" encoding="UTF-8"?><%s xmlns="http://s3.amazonaws.com/doc/2006-03-01/">%s</%s>'
+                % (root, body, root)).encode("utf-8")
+        return self.__send(200, data, {"Content-Type": "application/xml"})
+
+    def __send_error(self, status, code, message, method, headers=None):
+        data = ('<?xml version="1.0" encoding="UTF-8"?><Error><Code>%s</Code><Message>%s</Message></Error>' %
+                (code, escape(message))).encode("utf-8")
+        headers = dict(headers or {})
+        headers["Content-Type"] = "application/xml"
+        return self.__send(status, data, headers, method)
+
+    def __send(self, status, data=b"", headers=None, method=None):
+
+        self.send_response(status)
+        headers = dict(headers or {})
+        headers.setdefault("Content-Length", str(len(data)))
+        headers["x-amz-request-id"] = uuid.uuid4().hex
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        if method != "HEAD" and len(data) > 0:
+            self.wfile.write(data)
+
+
+# Strip the chunk signatures from an "aws-chunked" request body
+def _decode_aws_chunked(body):
+
+    data = b""
+    position = 0
+    while position < len(body):
+        line_end = body.index(b"\r\n", position)
+        size = int(body[position:line_end].split(b";")[0], 16)
+        if size == 0:
+            break
+        data += body[line_end + 2:line_end + 2 + size]
+        position = line_end + 2 + size + 2
+    return data
@@ -2,6 +2,9 @@ import json
 import os
 import os.path
 
+from concurrent.futures import ThreadPoolExecutor
+from dataset_registry import get_dataset
+
 
 class ProjectUtils:
 
@@ -30,11 +33,17 @@ class ProjectUtils:
             print("No project settings found")
             self.settings = {}
 
-    def get_data_bucket(self):
-        return self.settings[ProjectUtils.FASHION_MIST_ROOT_KEY][ProjectUtils.FASHION_MIST_DATA_BUCKET_KEY]
+    # Buckets of a dataset registered in dataset_registry.py and transferred with download_dataset()
+    def get_data_bucket(self, data_set_name=DATA_SET_FASHION_MNIST):
+        return self.__get_buckets(data_set_name)[ProjectUtils.FASHION_MIST_DATA_BUCKET_KEY]
+
+    def get_results_bucket(self, data_set_name=DATA_SET_FASHION_MNIST):
+        return self.__get_buckets(data_set_name)[ProjectUtils.FASHION_MIST_RESULTS_BUCKET_KEY]
 
-    def get_results_bucket(self):
-        return self.settings[ProjectUtils.FASHION_MIST_ROOT_KEY][ProjectUtils.FASHION_MIST_RESULTS_BUCKET_KEY]
+    # Local directory download_dataset() saves a dataset's files to, e.g. for LocalExperiment's $DATA_DIR
+    @staticmethod
+    def get_data_directory(data_set_name=DATA_SET_FASHION_MNIST):
+        return os.path.join("data", data_set_name)
 
     def get_project_id(self):
         if ProjectUtils.PROJECT_ID_KEY in self.settings:
@@ -51,62 +60,74 @@ class ProjectUtils:
         self.settings[ProjectUtils.PROJECT_ID_KEY] = project_id
         self.save_project_settings()
 
-    def download_dataset(self, data_set_name):
-
-        # only support one dataset for now
-        if data_set_name is ProjectUtils.DATA_SET_FASHION_MNIST:
-
-            print('\nCreating data and results buckets in COS')
-            cos_utils = self.studio_utils.get_cos_utils()
-
-            all_buckets = cos_utils.get_all_buckets()
-            print(all_buckets)
-
-            self.data_bucket = cos_utils.create_unique_bucket("fashion-mnist-data")
-            self.results_bucket = cos_utils.create_unique_bucket("fashion-mnist-results")
+    # Transfer a dataset from the dataset registry to COS.  Buckets created by an earlier call are reused and files
+    # that are already present in the data bucket with the expected size and checksum are skipped, so repeating
+    # the project setup only transfers what's missing.  Files are transferred in parallel and verified as they
+    # stream through.
+    def download_dataset(self, data_set_name, max_workers=4):
+
+        dataset = get_dataset(data_set_name)
+        cos_utils = self.studio_utils.get_cos_utils()
+        buckets_key = ProjectUtils.__get_buckets_key(data_set_name)
+
+        print('\nCreating data and results buckets in COS')
+        all_buckets = cos_utils.get_all_buckets()
+        print(all_buckets)
+
+        buckets = self.settings.get(buckets_key, {})
+        self.data_bucket = buckets.get(ProjectUtils.FASHION_MIST_DATA_BUCKET_KEY)
+        self.results_bucket = buckets.get(ProjectUtils.FASHION_MIST_RESULTS_BUCKET_KEY)
+        if self.data_bucket not in all_buckets:
+            self.data_bucket = cos_utils.create_unique_bucket("%s-data" % dataset["bucket_prefix"])
+        if self.results_bucket not in all_buckets:
+            self.results_bucket = cos_utils.create_unique_bucket("%s-results" % dataset["bucket_prefix"])
+
+        # Save the buckets right away so a failed transfer is resumed in the same buckets
+        self.settings[buckets_key] = {}
+        self.settings[buckets_key][ProjectUtils.FASHION_MIST_DATA_BUCKET_KEY] = self.data_bucket
+        self.settings[buckets_key][ProjectUtils.FASHION_MIST_RESULTS_BUCKET_KEY] = self.results_bucket
+        self.save_project_settings()
 
-            print('\nTransferring Fashion MNIST data to COS')
+        print('\nTransferring %s data to COS' % data_set_name)
 
-            train_data_file = "train-images-idx3-ubyte.gz"
-            train_labels_file = "train-labels-idx1-ubyte.gz"
-            test_data_file = "t10k-images-idx3-ubyte.gz"
-            test_labels_file = "t10k-labels-idx1-ubyte.gz"
-            train_data_url = "https://github.com/zalandoresearch/fashion-mnist/raw/master/data/fashion/train-images-idx3-ubyte.gz"
-            train_labels_url = "https://github.com/zalandoresearch/fashion-mnist/raw/master/data/fashion/train-labels-idx1-ubyte.gz"
-            test_data_url = "https://github.com/zalandoresearch/fashion-mnist/raw/master/data/fashion/t10k-images-idx3-ubyte.gz"
-            test_labels_url = "https://github.com/zalandoresearch/fashion-mnist/raw/master/data/fashion/t10k-labels-idx1-ubyte.gz"
+        # Provide a save directory to rather than delete local downloaded files
+        save_directory = ProjectUtils.get_data_directory(data_set_name)
 
-            # Provide a save directory to rather than delete local downloaded files
-            save_directory = os.path.join("data", "fashion_mnist")
+        def transfer(file):
+            if cos_utils.is_object_valid(self.data_bucket, file["name"], file["size"], file["checksum"]):
+                print("Skipping %s as it's already in bucket %s" % (file["name"], self.data_bucket))
+                return
 
-            cos_utils.transfer_remote_file_to_bucket(train_data_url,
-                                                     train_data_file,
+            cos_utils.transfer_remote_file_to_bucket(file["url"],
+                                                     file["name"],
                                                      self.data_bucket,
                                                      save_directory=save_directory,
-                                                     redownload=False)
-            cos_utils.transfer_remote_file_to_bucket(train_labels_url,
-                                                     train_labels_file,
-                                                     self.data_bucket,
-                                                     save_directory=save_directory,
-                                                     redownload=False)
-            cos_utils.transfer_remote_file_to_bucket(test_data_url,
-                                                     test_data_file,
-                                                     self.data_bucket,
-                                                     save_directory=save_directory,
-                                                     redownload=False)
-            cos_utils.transfer_remote_file_to_bucket(test_labels_url,
-                                                     test_labels_file,
-                                                     self.data_bucket,
-                                                     save_directory=save_directory,
-                                                     redownload=False)
-
-            print('\nFashion MNIST data uploaded to %s' % self.data_bucket)
-            print('Results directory created at %s' % self.results_bucket)
-
-            self.settings[ProjectUtils.FASHION_MIST_ROOT_KEY] = {}
-            self.settings[ProjectUtils.FASHION_MIST_ROOT_KEY][ProjectUtils.FASHION_MIST_DATA_BUCKET_KEY] = self.data_bucket
-            self.settings[ProjectUtils.FASHION_MIST_ROOT_KEY][ProjectUtils.FASHION_MIST_RESULTS_BUCKET_KEY] = self.results_bucket
-            self.save_project_settings()
+                                                     redownload=False,
+                                                     checksum=file["checksum"])
+            if not cos_utils.is_object_valid(self.data_bucket, file["name"], file["size"], file["checksum"]):
+                raise ValueError("Uploaded %s does not have the expected size of %d bytes" %
+                                 (file["name"], file["size"]))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for future in [executor.submit(transfer, file) for file in dataset["files"]]:
+                future.result()
+
+        print('\n%s data uploaded to %s' % (data_set_name, self.data_bucket))
+        print('Results directory created at %s' % self.results_bucket)
+
+    def __get_buckets(self, data_set_name):
+
+        buckets_key = ProjectUtils.__get_buckets_key(data_set_name)
+        if buckets_key not in self.settings:
+            raise ValueError("No buckets found for dataset %s.  Run the project setup to transfer it to COS" %
+                             data_set_name)
+        return self.settings[buckets_key]
+
+    # Settings key of the buckets of a dataset, e.g. "fashion_mnist_buckets"
+    @staticmethod
+    def __get_buckets_key(data_set_name):
+        get_dataset(data_set_name)  # raises ValueError for unknown datasets
+        return "%s_buckets" % data_set_name
 
     def save_project_settings(self):
         with open(self.settings_file, 'w') as outfile:
@@ -21,68 +21,337 @@
 # the interval is 1 minus that quantity. We want at least a .95 probability of success. To figure out the
 # number of draws we need, just solve for n in the equation"
 
-import random
+
+import hashlib
+import warnings
+
+# Number of decimals step range values are rounded to.  Drops the float error of min_val + index * step so 0.3 is
+# 0.3 rather than 0.30000000000000004.
+STEP_DECIMALS = 10
+
 
 class RandomSearch:
 
-    def __init__(self):
+    STRATEGY_RANDOM = "random"
+    STRATEGY_UNIQUE = "unique"
+    STRATEGY_SOBOL = "sobol"
+    STRATEGY_HALTON = "halton"
+    STRATEGY_LATIN_HYPERCUBE = "latin_hypercube"
+
+    # seed makes the searches reproducible.  Samples are drawn with NumPy which is only imported once a search is
+    # created.
+    def __init__(self, seed=None):
 
         self.params_ranges = {}
         self.statics = {}
         self.params_powers = {}
         self.hpo_lists = {}
 
+        self.seed = seed
+        self.generator = None
+        self.search_space = None
+        self.grid_sampler = None
+        self.qmc_engines = {}
+
     def add_step_range(self, name, min_val, max_val, step):
         self.params_ranges[name] = [min_val, max_val, step]
+        self.search_space = None
 
     def add_power_range(self, name, min_val, max_val, power):
         self.params_powers[name] = [min_val, max_val, power]
+        self.search_space = None
 
     def add_static_var(self, name, value):
         self.statics[name] = value
+        self.search_space = None
 
     def add_list(self, name, value_list):
         self.hpo_lists[name] = value_list
+        self.search_space = None
 
-    def create_random_search(self, search_count):
+    # Compile the ranges, powers and lists into the values of each parameter.  This only happens once (or after
+    # the search is changed) rather than for every parameter of every sample.
+    def get_search_space(self):
 
-        random_search= []
-        for i in range(0, search_count):
-            hyperparameters = {}
-            random_search.append(hyperparameters)
+        if self.search_space is None:
+            names = []
+            values = []
 
             # add value for ranges
             for name in self.params_ranges:
-                min_val = self.params_ranges[name][0]
-                max_val = self.params_ranges[name][1]
-                step = self.params_ranges[name][2]
-                values = []
-                value = min_val
-                while value <= max_val:
-                    values.append(value)
-                    value += step
-                index = random.randint(0, len(values)-1)
-                hyperparameters[name] = values[index]
+                min_val, max_val, step = self.params_ranges[name]
+                names.append(name)
+                values.append(_get_step_values(min_val, max_val, step))
 
             # add value for powers
             for name in self.params_powers:
-                min_val = self.params_powers[name][0]
-                max_val = self.params_powers[name][1]
-                power = self.params_powers[name][2]
-                powers = []
-                for index in range(min_val, max_val + 1):
-                    powers.append(power ** index)
-                index = random.randint(0, len(powers)-1)
-                hyperparameters[name] = powers[index]
+                min_val, max_val, power = self.params_powers[name]
+                names.append(name)
+                values.append([power ** index for index in range(min_val, max_val + 1)])
 
             # add lists
             for name in self.hpo_lists:
-                value_list = self.hpo_lists[name]
-                index = random.randint(0, len(value_list)-1)
-                hyperparameters[name] = value_list[index]
+                names.append(name)
+                values.append(list(self.hpo_lists[name]))
+
+            self.search_space = SearchSpace(names, values, self.statics)
+            self.grid_sampler = None
+            self.qmc_engines = {}
+        return self.search_space
+
+    def get_generator(self):
+        if self.generator is None:
+            np = _import_numpy()
+            self.generator = np.random.default_rng(self.seed)
+        return self.generator
+
+    # Draw the value indices of search_count samples at once.  Returns a search_count x parameter count array
+    # which can be converted with get_search_space().get_hyperparameters().
+    def create_random_indices(self, search_count):
+        radices = self.get_search_space().get_radices()
+        return self.get_generator().integers(0, radices, size=(search_count, len(radices)))
+
+    def create_random_search(self, search_count):
+        return self.get_search_space().get_hyperparameters(self.create_random_indices(search_count))
+
+    # Yield random hyperparameters forever or until search_count samples have been drawn.  Samples are drawn
+    # batch_size at a time so pre-screening a large number of candidates never holds them all in memory.
+    def iterate_random_search(self, search_count=None, batch_size=10000):
+
+        remaining = search_count
+        while remaining is None or remaining > 0:
+            count = batch_size if remaining is None else min(batch_size, remaining)
+            for hyperparameters in self.create_random_search(count):
+                yield hyperparameters
+            if remaining is not None:
+                remaining -= count
+
+    # Number of distinct hyperparameter combinations
+    def get_cardinality(self):
+        return self.get_search_space().get_cardinality()
+
+    # Like create_random_search() but without duplicates.  Samples are distinct grid points, also across calls, so
+    # no GPU time is spent training the same configuration twice.  Raises a ValueError once the grid is exhausted.
+    def create_unique_search(self, search_count):
+        return self.get_search_space().get_hyperparameters(self.create_unique_indices(search_count))
+
+    def create_unique_indices(self, search_count):
+
+        search_space = self.get_search_space()
+        if self.grid_sampler is None:
+            self.grid_sampler = GridSampler(search_space.get_cardinality(), self.get_generator())
+
+        if search_count > self.grid_sampler.get_remaining():
+            raise ValueError("Unable to create %d unique samples as only %d of the %d grid points remain" %
+                             (search_count, self.grid_sampler.get_remaining(), search_space.get_cardinality()))
+        return search_space.get_grid_indices(self.grid_sampler.next_indices(search_count))
+
+    def iterate_unique_search(self, search_count=None, batch_size=10000):
+
+        remaining = self.get_cardinality() if search_count is None else search_count
+        while remaining > 0:
+            count = min(batch_size, remaining)
+            for hyperparameters in self.create_unique_search(count):
+                yield hyperparameters
+            remaining -= count
+
+    # Create search_count samples with one of the STRATEGY_* strategies.  With only a few training runs random
+    # samples leave large gaps in the search space.  Sobol and Halton sequences (scrambled) and Latin hypercubes
+    # spread the samples evenly over the values of every parameter instead.
+    def create_search(self, search_count, strategy=STRATEGY_RANDOM):
+        return self.get_search_space().get_hyperparameters(self.create_indices(search_count, strategy))
+
+    def create_indices(self, search_count, strategy=STRATEGY_RANDOM):
+
+        if strategy == RandomSearch.STRATEGY_RANDOM:
+            return self.create_random_indices(search_count)
+        if strategy == RandomSearch.STRATEGY_UNIQUE:
+            return self.create_unique_indices(search_count)
+        return self.create_qmc_indices(search_count, strategy)
+
+    # Draw search_count points in the unit hypercube with a quasi-Monte Carlo engine from scipy.stats.qmc and map
+    # each coordinate onto the value indices of its parameter.  Sobol and Halton samples continue the same
+    # sequence on every call.
+    def create_qmc_indices(self, search_count, strategy):
+
+        np = _import_numpy()
+
+        radices = self.get_search_space().get_radices()
+        if len(radices) == 0:
+            return np.zeros((search_count, 0), dtype=np.int64)
+
+        engine = self.__get_qmc_engine(strategy, len(radices))
+        with warnings.catch_warnings():
+            # Sobol warns when search_count isn't a power of 2.  Any prefix of the sequence is still far more even
+            # than random samples.
+            warnings.simplefilter("ignore", UserWarning)
+            points = engine.random(search_count)
+        return np.minimum((points * radices).astype(np.int64), radices - 1)
+
+    def __get_qmc_engine(self, strategy, dimensions):
+
+        if strategy not in self.qmc_engines or strategy == RandomSearch.STRATEGY_LATIN_HYPERCUBE:
+            qmc = _import_qmc()
+
+            if strategy == RandomSearch.STRATEGY_SOBOL:
+                engine = qmc.Sobol(dimensions, scramble=True, seed=self.get_generator())
+            elif strategy == RandomSearch.STRATEGY_HALTON:
+                engine = qmc.Halton(dimensions, scramble=True, seed=self.get_generator())
+            elif strategy == RandomSearch.STRATEGY_LATIN_HYPERCUBE:
+                # Each call is a new hypercube so every batch is stratified on its own
+                engine = qmc.LatinHypercube(dimensions, seed=self.get_generator())
+            else:
+                raise ValueError("Search strategy not recognized: %s" % strategy)
+            self.qmc_engines[strategy] = engine
+        return self.qmc_engines[strategy]
+
+
+# Visits the integers 0 to cardinality - 1 in a random order without storing them so huge grids can be sampled
+# without replacement.  A Feistel network is a bijection on the power of 4 at or above cardinality, and values
+# outside the grid are mapped again ("cycle walking") until they're inside it.
+class GridSampler:
+
+    ROUND_COUNT = 6
+
+    def __init__(self, cardinality, generator):
 
+        self.cardinality = cardinality
+        self.position = 0
+        self.half_bits = max((cardinality - 1).bit_length() + 1, 2) // 2
+        self.half_mask = (1 << self.half_bits) - 1
+        self.keys = [generator.bytes(16) for _ in range(GridSampler.ROUND_COUNT)]
+
+    def get_cardinality(self):
+        return self.cardinality
+
+    def get_remaining(self):
+        return self.cardinality - self.position
+
+    def next_indices(self, count):
+
+        if count > self.get_remaining():
+            raise ValueError("Only %d grid points remain" % self.get_remaining())
+
+        indices = [self.get_index(position) for position in range(self.position, self.position + count)]
+        self.position += count
+        return indices
+
+    # The grid index at position in the random order
+    def get_index(self, position):
+
+        index = self.__permute(position)
+        while index >= self.cardinality:
+            index = self.__permute(index)
+        return index
+
+    def __permute(self, value):
+
+        left = value >> self.half_bits
+        right = value & self.half_mask
+        for key in self.keys:
+            left, right = right, left ^ self.__round(right, key)
+        return (left << self.half_bits) | right
+
+    def __round(self, value, key):
+        digest = hashlib.blake2b(value.to_bytes(16, "little"), key=key, digest_size=16).digest()
+        return int.from_bytes(digest, "little") & self.half_mask
+
+
+# The values of each parameter of a search.  Samples are represented by one value index per parameter.
+class SearchSpace:
+
+    def __init__(self, names, values, statics):
+
+        np = _import_numpy()
+
+        for name, parameter_values in zip(names, values):
+            if len(parameter_values) == 0:
+                raise ValueError("Parameter %s has no values" % name)
+
+        self.names = names
+        self.values = values
+        self.statics = dict(statics)
+        self.radices = np.array([len(parameter_values) for parameter_values in values], dtype=np.int64)
+
+        # Object arrays so values are looked up for many samples at once and stay Python types for json
+        self.value_arrays = []
+        for parameter_values in values:
+            value_array = np.empty(len(parameter_values), dtype=object)
+            value_array[:] = parameter_values
+            self.value_arrays.append(value_array)
+
+    def get_names(self):
+        return self.names
+
+    def get_values(self, name):
+        return self.values[self.names.index(name)]
+
+    def get_radices(self):
+        return self.radices
+
+    def get_statics(self):
+        return self.statics
+
+    # Number of points in the grid of all parameter values.  A Python int as it can exceed 64 bits.
+    def get_cardinality(self):
+        cardinality = 1
+        for radix in self.radices.tolist():
+            cardinality *= radix
+        return cardinality
+
+    # Convert grid indices to value indices.  A grid index is a mixed radix number with one digit per parameter,
+    # the last parameter being the least significant.
+    def get_grid_indices(self, grid_indices):
+
+        np = _import_numpy()
+
+        radices = self.radices.tolist()
+        indices = np.zeros((len(grid_indices), len(radices)), dtype=np.int64)
+        for row, grid_index in enumerate(grid_indices):
+            for column in range(len(radices) - 1, -1, -1):
+                grid_index, indices[row, column] = divmod(grid_index, radices[column])
+        return indices
+
+    # Convert an array of value indices, one row per sample, to a list of hyperparameters dicts
+    def get_hyperparameters(self, indices):
+
+        columns = [self.value_arrays[column][indices[:, column]].tolist() for column in range(len(self.names))]
+        hyperparameters = []
+        for row in zip(*columns) if len(columns) > 0 else [()] * len(indices):
+            sample = dict(zip(self.names, row))
             # add static variables
-            for name in self.statics:
-                hyperparameters[name] = self.statics[name]
+            sample.update(self.statics)
+            hyperparameters.append(sample)
+        return hyperparameters
+
+
+# Values from min_val to max_val (inclusive) in steps of step.  Each value is computed from its index rather than
+# by repeatedly adding step so floating point error doesn't build up and drop max_val.
+def _get_step_values(min_val, max_val, step):
+
+    if step <= 0:
+        raise ValueError("step must be positive: %s" % step)
+
+    count = int((max_val - min_val) / step + 1e-9) + 1
+    if all(isinstance(value, int) for value in [min_val, max_val, step]):
+        return [min_val + index * step for index in range(count)]
+    return [round(min_val + index * step, STEP_DECIMALS) for index in range(count)]
+
+
+# numpy, and scipy for the quasi-random strategies, are only imported when a search needs them so the other
+# utilities work without them
+def _import_numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ImportError("Hyperparameter searches need numpy, install it with: pip install numpy")
+    return numpy
+
 
-        return random_search
+def _import_qmc():
+    try:
+        from scipy.stats import qmc
+    except ImportError:
+        raise ImportError("The Sobol, Halton and Latin hypercube strategies need scipy 1.7 or later, install it "
+                          "with: pip install \"scipy>=1.7\"")
+    return qmc
@@ -35,6 +35,7 @@ class RBFOptConfig:
         self.params_ranges = {}
         self.params_powers = {}
         self.hpo_lists = {}
+        self.statics = {}
 
     def add_step_range(self, name, min_val, max_val, step):
         self.params_ranges[name] = [min_val, max_val, step]
@@ -43,11 +44,37 @@ class RBFOptConfig:
         self.params_powers[name] = [min_val, max_val, power]
 
     def add_static_var(self,name, value):
+        self.statics[name] = value
         self.__add_hyperparameter(name, value, value, "", -1)
 
     def add_list(self, name, value_list):
         self.hpo_lists[name] = value_list
 
+    def get_training_run_count(self):
+        return self.training_run_count
+
+    def get_objective(self):
+        return self.objective
+
+    def get_goal(self):
+        return self.max_or_min.lower()
+
+    # The same search space as a RandomSearch, e.g. for the client side BatchOptimizer
+    def get_random_search(self, seed=None):
+
+        from random_search import RandomSearch
+
+        search = RandomSearch(seed=seed)
+        for name in self.params_ranges:
+            search.add_step_range(name, *self.params_ranges[name])
+        for name in self.params_powers:
+            search.add_power_range(name, *self.params_powers[name])
+        for name in self.hpo_lists:
+            search.add_list(name, self.hpo_lists[name])
+        for name in self.statics:
+            search.add_static_var(name, self.statics[name])
+        return search
+
     # Let WML's HPO capability execute an RBFOpt experiment for us.
     # NOTE: a current limitation of WML's HPO capability is that training runs are executed
     # synchronously rather than parallel.
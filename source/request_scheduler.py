@@ -0,0 +1,189 @@
+import heapq
+import itertools
+import random
+import threading
+import time
+
+
+# Client-side scheduling of WML and COS API calls.
+#
+# Every call belongs to an endpoint class with its own token bucket (sustained requests per second plus a burst
+# allowance) and cap on concurrent calls.  All WML classes additionally share a service-wide bucket whose waiters
+# are served by priority so a flood of status polls can never starve repository stores or run submissions.
+#
+# METADATA covers stores to the WML repository (training definitions and experiments), RUN_SUBMIT starting and
+# canceling runs, STATUS_POLL run details and COS_DATA every COS request.  COS isn't rate limited by default as
+# transfers are bounded by their concurrency; pass e.g. limits={RequestScheduler.COS_DATA: {"rate": 100}} to cap it.
+# Calls that fail with a throttling (429) or server (5xx) error are retried with exponential backoff and jitter.
+class RequestScheduler:
+
+    METADATA = "metadata"
+    RUN_SUBMIT = "run_submit"
+    STATUS_POLL = "status_poll"
+    COS_DATA = "cos_data"
+
+    # Lower values are served first
+    PRIORITY_HIGH = 0
+    PRIORITY_NORMAL = 1
+    PRIORITY_LOW = 2
+
+    # rate: requests per second (None for unlimited), burst: bucket size, concurrency: max calls in flight,
+    # retry_statuses: HTTP statuses that are retried.  Submitting a run isn't idempotent so it's only retried
+    # when the service explicitly throttled the request.
+    DEFAULT_LIMITS = {
+        METADATA: {"rate": 10, "burst": 20, "concurrency": 8, "priority": PRIORITY_HIGH, "wml": True,
+                   "retry_statuses": [429, 500, 502, 503, 504]},
+        RUN_SUBMIT: {"rate": 2, "burst": 5, "concurrency": 4, "priority": PRIORITY_HIGH, "wml": True,
+                     "retry_statuses": [429]},
+        STATUS_POLL: {"rate": 10, "burst": 20, "concurrency": 8, "priority": PRIORITY_LOW, "wml": True,
+                      "retry_statuses": [429, 500, 502, 503, 504]},
+        COS_DATA: {"rate": None, "burst": 200, "concurrency": 64, "priority": PRIORITY_NORMAL, "wml": False,
+                   "retry_statuses": [429, 500, 502, 503, 504]}
+    }
+
+    # Service-wide limit shared by all WML endpoint classes
+    DEFAULT_WML_RATE = 20
+    DEFAULT_WML_BURST = 40
+
+    MAX_RETRIES = 5
+    RETRY_BASE_DELAY = 1
+    RETRY_MAX_DELAY = 30
+
+    def __init__(self, limits=None, wml_rate=DEFAULT_WML_RATE, wml_burst=DEFAULT_WML_BURST,
+                 max_retries=MAX_RETRIES):
+
+        self.limits = {name: dict(limit) for name, limit in RequestScheduler.DEFAULT_LIMITS.items()}
+        if limits is not None:
+            for name, limit in limits.items():
+                self.limits.setdefault(name, {"rate": None, "burst": 1, "concurrency": 8,
+                                              "priority": RequestScheduler.PRIORITY_NORMAL, "wml": False,
+                                              "retry_statuses": [429, 500, 502, 503, 504]})
+                self.limits[name].update(limit)
+
+        self.max_retries = max_retries
+        self.wml_bucket = _TokenBucket(wml_rate, wml_burst)
+        self.buckets = {name: _TokenBucket(limit["rate"], limit["burst"]) for name, limit in self.limits.items()}
+        self.semaphores = {name: threading.BoundedSemaphore(limit["concurrency"])
+                           for name, limit in self.limits.items()}
+
+        self.stats_lock = threading.Lock()
+        self.stats = {name: {"calls": 0, "retries": 0, "failures": 0} for name in self.limits}
+
+    # Call function(*args, **kwargs) as a request of the given endpoint class.  priority overrides the class's
+    # default priority and max_retries its retry count (e.g. 0 for calls that consume a stream).
+    def call(self, endpoint_class, function, *args, priority=None, max_retries=None, **kwargs):
+
+        if endpoint_class not in self.limits:
+            raise ValueError("Unknown endpoint class: %s" % endpoint_class)
+
+        limit = self.limits[endpoint_class]
+        if priority is None:
+            priority = limit["priority"]
+        if max_retries is None:
+            max_retries = self.max_retries
+
+        attempt = 0
+        while True:
+            self.buckets[endpoint_class].acquire(priority)
+            if limit["wml"]:
+                self.wml_bucket.acquire(priority)
+
+            with self.semaphores[endpoint_class]:
+                try:
+                    result = function(*args, **kwargs)
+                    self.__count(endpoint_class, "calls")
+                    return result
+                except Exception as err:
+                    status_code = get_status_code(err)
+                    if status_code not in limit["retry_statuses"] or attempt >= max_retries:
+                        self.__count(endpoint_class, "failures")
+                        raise
+                    delay = get_retry_after(err)
+
+            if delay is None:
+                delay = min(RequestScheduler.RETRY_BASE_DELAY * 2 ** attempt, RequestScheduler.RETRY_MAX_DELAY)
+                delay = random.uniform(delay / 2, delay)
+            attempt += 1
+            self.__count(endpoint_class, "retries")
+            print("Request to %s failed with status %s, retrying in %.1f seconds" %
+                  (endpoint_class, status_code, delay))
+            time.sleep(delay)
+
+    # Number of calls, retries and failures per endpoint class
+    def get_stats(self):
+        with self.stats_lock:
+            return {name: dict(stats) for name, stats in self.stats.items()}
+
+    def __count(self, endpoint_class, stat):
+        with self.stats_lock:
+            self.stats[endpoint_class][stat] += 1
+
+
+# Return the HTTP status code of a failed ibm_boto3 or WML client request or None if unknown
+def get_status_code(err):
+
+    response = getattr(err, "response", None)
+    if isinstance(response, dict):
+        # ibm_botocore ClientError
+        return response.get("ResponseMetadata", {}).get("HTTPStatusCode")
+    if response is not None:
+        # requests.Response, e.g. from the WML client's ApiRequestFailure
+        return getattr(response, "status_code", None)
+    return getattr(err, "status_code", None)
+
+
+# Return the delay requested by a Retry-After header or None
+def get_retry_after(err):
+
+    response = getattr(err, "response", None)
+    if isinstance(response, dict):
+        headers = response.get("ResponseMetadata", {}).get("HTTPHeaders", {})
+    else:
+        headers = getattr(response, "headers", None) or {}
+
+    try:
+        return float(headers.get("Retry-After", headers.get("retry-after")))
+    except (TypeError, ValueError):
+        return None
+
+
+# Token bucket whose waiters are served in priority order (then first come first served)
+class _TokenBucket:
+
+    def __init__(self, rate, burst):
+
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.tokens = float(self.burst)
+        self.last_refill = time.time()
+        self.condition = threading.Condition()
+        self.waiters = []
+        self.sequence = itertools.count()
+
+    def acquire(self, priority):
+
+        if self.rate is None:
+            return
+
+        with self.condition:
+            waiter = (priority, next(self.sequence))
+            heapq.heappush(self.waiters, waiter)
+            try:
+                while True:
+                    self.__refill()
+                    if self.waiters[0] == waiter:
+                        if self.tokens >= 1:
+                            self.tokens -= 1
+                            return
+                        self.condition.wait((1 - self.tokens) / self.rate)
+                    else:
+                        self.condition.wait()
+            finally:
+                self.waiters.remove(waiter)
+                heapq.heapify(self.waiters)
+                self.condition.notify_all()
+
+    def __refill(self):
+        now = time.time()
+        self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
@@ -0,0 +1,282 @@
+import json
+import time
+
+from experiment_utils import read_objective_history
+from random_search import RandomSearch
+
+
+# Asynchronous successive halving (ASHA) on top of Experiment.  Rather than training every configuration for the
+# full number of epochs, configurations start with min_epochs and only the best 1 / reduction_factor of each rung
+# are promoted to reduction_factor times more epochs, up to max_epochs.  Promotions happen as soon as results
+# arrive rather than waiting for whole rungs to finish so the GPUs never sit idle.
+#
+# Each rung is a new training run with its "epochs" hyperparameter raised through save_hyperparameters_config() so
+# experiments need to read "epochs" from config.json and write their per-epoch objective to
+# $RESULT_DIR/val_dict_list.json.  Experiments that update val_dict_list.json every epoch are also stopped early
+# when they fall in the bottom of their rung at one of the rung epochs.
+#
+# experiment_factory creates an Experiment (or LocalExperiment) for each batch of training runs, e.g.
+#   lambda name: Experiment(name, "ASHA", "tensorflow", "1.5", "python", "3.5", studio_utils, project_utils)
+class SuccessiveHalving:
+
+    RESULTS_FILE = "val_dict_list.json"
+    EPOCHS_HYPERPARAMETER = "epochs"
+
+    TERMINAL_STATES = ["completed", "error", "failed", "canceled"]
+
+    # Seconds a training run may take to be assigned a guid after its experiment was executed.  Runs that time out
+    # are counted as failed and cancelled if their guid still appears later.
+    GUID_TIMEOUT = 600
+
+    def __init__(self, experiment_factory, random_search, command, experiment_zip, gpu_type="k80",
+                 min_epochs=1, max_epochs=27, reduction_factor=3, max_configurations=27, max_concurrent_runs=8,
+                 objective="accuracy", goal="maximize", strategy=RandomSearch.STRATEGY_UNIQUE, poll_interval=60,
+                 stop_early=True):
+
+        if reduction_factor < 2:
+            raise ValueError("reduction_factor must be at least 2")
+        if min_epochs < 1 or max_epochs < min_epochs:
+            raise ValueError("Epochs must satisfy 1 <= min_epochs <= max_epochs")
+        if goal not in ["maximize", "minimize"]:
+            raise ValueError("Invalid goal.  Must be 'maximize' or 'minimize'")
+
+        self.experiment_factory = experiment_factory
+        self.random_search = random_search
+        self.command = command
+        self.experiment_zip = experiment_zip
+        self.gpu_type = gpu_type
+        self.reduction_factor = reduction_factor
+        self.max_configurations = max_configurations
+        self.max_concurrent_runs = max_concurrent_runs
+        self.objective = objective
+        self.goal = goal
+        self.strategy = strategy
+        self.poll_interval = poll_interval
+        self.stop_early = stop_early
+
+        # Epochs of each rung, e.g. 1, 3, 9 and 27
+        self.rung_epochs = []
+        epochs = min_epochs
+        while epochs < max_epochs:
+            self.rung_epochs.append(epochs)
+            epochs *= reduction_factor
+        self.rung_epochs.append(max_epochs)
+
+        self.trials = []
+        self.rung_scores = [{} for _ in self.rung_epochs]
+        self.promoted = [set() for _ in self.rung_epochs]
+        self.experiments = []
+
+    def get_rung_epochs(self):
+        return self.rung_epochs
+
+    def get_trials(self):
+        return self.trials
+
+    # Submit, poll and promote training runs until every configuration has been trained as far as it deserves.
+    # Returns the best trial of the highest rung reached.
+    def run(self):
+
+        start = time.time()
+        while True:
+            self.__cancel_timed_out_runs()
+            for trial in self.__get_active_trials():
+                self.__update_trial(trial)
+
+            launches = []
+            while len(self.__get_active_trials()) + len(launches) < self.max_concurrent_runs:
+                launch = self.__get_promotion()
+                if launch is None:
+                    launch = self.__get_new_configuration(launches)
+                if launch is None:
+                    break
+                launches.append(launch)
+
+            if len(launches) > 0:
+                self.__submit(launches)
+            elif len(self.__get_active_trials()) == 0:
+                break
+            else:
+                time.sleep(self.poll_interval)
+
+        self.__cancel_timed_out_runs()
+        for trial in [trial for trial in self.trials if trial["timed_out"]]:
+            print("Training run %s still has no guid, it may need to be cancelled once it starts" %
+                  trial["run"].get_name())
+
+        print("Successive halving finished in %.0f seconds with %d training runs for %d configurations" %
+              (time.time() - start, len(self.trials), len([t for t in self.trials if t["rung"] == 0])))
+        return self.get_best_trial()
+
+    def get_best_trial(self):
+        for rung in range(len(self.rung_epochs) - 1, -1, -1):
+            ranked = self.__get_ranked(rung)
+            if len(ranked) > 0:
+                return self.__get_trial(ranked[0], rung)
+        return None
+
+    def get_summary(self):
+
+        summary = {"rung_epochs": self.rung_epochs, "rungs": []}
+        for rung in range(len(self.rung_epochs)):
+            summary["rungs"].append({
+                "epochs": self.rung_epochs[rung],
+                "completed": len(self.rung_scores[rung]),
+                "promoted": len(self.promoted[rung]),
+                "results": [{"configuration": configuration, "score": self.rung_scores[rung][configuration]}
+                            for configuration in self.__get_ranked(rung)]
+            })
+
+        best = self.get_best_trial()
+        if best is not None:
+            summary["best"] = {"hyperparameters": best["hyperparameters"], "epochs": self.rung_epochs[best["rung"]],
+                               "score": best["score"], "guid": best["run"].get_guid()}
+        return summary
+
+    def print_summary(self):
+        print("\n**** Successive Halving Summary Start ****\n%s" % json.dumps(self.get_summary(), indent=2))
+        print("**** Successive Halving Summary End ****\n\n")
+
+    def __get_active_trials(self):
+        return [trial for trial in self.trials if trial["state"] not in SuccessiveHalving.TERMINAL_STATES]
+
+    def __get_trial(self, configuration, rung=None):
+        for trial in self.trials:
+            if trial["configuration"] == configuration and (rung is None or trial["rung"] == rung):
+                return trial
+        return None
+
+    # Configurations of a rung ordered from best to worst
+    def __get_ranked(self, rung):
+        scores = self.rung_scores[rung]
+        return sorted(scores, key=lambda configuration: scores[configuration], reverse=self.goal == "maximize")
+
+    # ASHA promotes any configuration in the top 1 / reduction_factor of the results of its rung so far,
+    # starting with the highest rung
+    def __get_promotion(self):
+
+        for rung in range(len(self.rung_epochs) - 2, -1, -1):
+            ranked = self.__get_ranked(rung)
+            for configuration in ranked[:len(ranked) // self.reduction_factor]:
+                if configuration not in self.promoted[rung]:
+                    self.promoted[rung].add(configuration)
+                    trial = self.__get_trial(configuration, rung)
+                    return {"configuration": configuration, "rung": rung + 1,
+                            "hyperparameters": trial["hyperparameters"]}
+        return None
+
+    def __get_new_configuration(self, launches):
+
+        configuration = len([trial for trial in self.trials if trial["rung"] == 0]) + \
+                        len([launch for launch in launches if launch["rung"] == 0])
+        if configuration >= self.max_configurations:
+            return None
+
+        try:
+            hyperparameters = self.random_search.create_search(1, self.strategy)[0]
+        except ValueError as err:
+            # The grid is exhausted
+            print("No more configurations: %s" % err)
+            self.max_configurations = configuration
+            return None
+        return {"configuration": configuration, "rung": 0, "hyperparameters": hyperparameters}
+
+    def __submit(self, launches):
+
+        specs = []
+        for launch in launches:
+            hyperparameters = dict(launch["hyperparameters"])
+            hyperparameters[SuccessiveHalving.EPOCHS_HYPERPARAMETER] = self.rung_epochs[launch["rung"]]
+            specs.append({"name": "asha-c%d-r%d" % (launch["configuration"], launch["rung"]),
+                          "command": self.command,
+                          "experiment_zip": self.experiment_zip,
+                          "gpu_type": self.gpu_type,
+                          "hyperparameters": hyperparameters})
+
+        experiment = self.experiment_factory("Successive halving batch %d" % (len(self.experiments) + 1))
+        self.experiments.append(experiment)
+        experiment.add_training_runs(specs)
+        experiment.execute()
+
+        runs = {run.get_name(): run for run in experiment.get_training_runs()}
+        for launch, spec in zip(launches, specs):
+            trial = dict(launch)
+            trial.update({"run": runs[spec["name"]], "experiment": experiment, "submitted": time.time(),
+                          "state": "pending", "score": None, "history": {}, "stop_requested": False,
+                          "timed_out": False})
+            self.trials.append(trial)
+
+        print("Submitted %d training runs: %s" %
+              (len(specs), ", ".join("%d epochs" % self.rung_epochs[launch["rung"]] for launch in launches)))
+
+    # Cancel runs that timed out waiting for their guid as soon as it appears so they don't keep training unseen
+    def __cancel_timed_out_runs(self):
+
+        for trial in [trial for trial in self.trials if trial["timed_out"]]:
+            if trial["run"].get_guid() is None:
+                trial["experiment"].get_training_statuses(max_age=self.poll_interval)
+            if trial["run"].get_guid() is not None:
+                print("Cancelling training run %s which started after it timed out" % trial["run"].get_name())
+                trial["timed_out"] = False
+                trial["run"].cancel()
+
+    def __update_trial(self, trial):
+
+        # Runs that started slowly get their guid from the experiment run details
+        if trial["run"].get_guid() is None:
+            trial["experiment"].get_training_statuses()
+            if trial["run"].get_guid() is None:
+                if time.time() - trial["submitted"] > SuccessiveHalving.GUID_TIMEOUT:
+                    print("Training run %s has no guid after %d seconds" %
+                          (trial["run"].get_name(), SuccessiveHalving.GUID_TIMEOUT))
+                    trial["state"] = "failed"
+                    trial["timed_out"] = True
+                return
+
+        details = trial["run"].get_details()
+        state = details["entity"]["status"]["state"] if details is not None else "failed"
+
+        if state in SuccessiveHalving.TERMINAL_STATES or (state == "running" and self.stop_early):
+            trial["history"] = read_objective_history(trial["run"], self.objective, SuccessiveHalving.RESULTS_FILE)
+
+        if state not in SuccessiveHalving.TERMINAL_STATES:
+            trial["state"] = state
+            if state == "running" and self.stop_early and not trial["stop_requested"] and self.__should_stop(trial):
+                print("Stopping %s as it's in the bottom of its rung" % trial["run"].get_name())
+                trial["stop_requested"] = True
+                trial["run"].cancel()
+            return
+
+        # Runs without results, e.g. failed runs, aren't ranked so they're never promoted.  Neither are stopped
+        # runs as their score is only for the epochs they reached.
+        trial["state"] = state
+        if trial["stop_requested"]:
+            print("Training run %s stopped early (%s)" % (trial["run"].get_name(), state))
+        elif len(trial["history"]) > 0:
+            trial["score"] = self.__get_best_score(trial["history"].values())
+            self.rung_scores[trial["rung"]][trial["configuration"]] = trial["score"]
+        else:
+            print("Training run %s finished (%s) without results" % (trial["run"].get_name(), state))
+
+    # A running trial is stopped when, at one of the lower rung epochs, it's outside the top 1 / reduction_factor
+    # of every trial that has reached that epoch
+    def __should_stop(self, trial):
+
+        for epochs in self.rung_epochs[:trial["rung"] + 1]:
+            if epochs not in trial["history"] or epochs == self.rung_epochs[trial["rung"]]:
+                continue
+
+            scores = [other["history"][epochs] for other in self.trials if epochs in other["history"]]
+            if len(scores) < self.reduction_factor:
+                continue
+
+            scores.sort(reverse=self.goal == "maximize")
+            cutoff = scores[max(len(scores) // self.reduction_factor, 1) - 1]
+            if self.goal == "maximize" and trial["history"][epochs] < cutoff:
+                return True
+            if self.goal == "minimize" and trial["history"][epochs] > cutoff:
+                return True
+        return False
+
+    def __get_best_score(self, scores):
+        return max(scores) if self.goal == "maximize" else min(scores)
@@ -0,0 +1,154 @@
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+# Caches authentication tokens on disk so consecutive script invocations (e.g. from cron) reuse a valid token
+# instead of authenticating again.  The cache file is protected with a file lock so several processes can share
+# it safely, and tokens are refreshed refresh_margin seconds before they expire.  Entries are keyed by a hash
+# of the credentials so no API key is ever written to disk.
+class TokenCache:
+
+    IAM_AUTH_ENDPOINT = "https://iam.ng.bluemix.net/oidc/token"
+    DEFAULT_REFRESH_MARGIN = 15 * 60
+
+    def __init__(self, cache_file=None, refresh_margin=DEFAULT_REFRESH_MARGIN):
+
+        if cache_file is None:
+            cache_file = os.path.join("..", "settings", "token_cache.json")
+
+        self.cache_file = cache_file
+        self.lock_file = cache_file + ".lock"
+        self.refresh_margin = refresh_margin
+        self.thread_lock = threading.Lock()
+
+    def get_cache_file(self):
+        return self.cache_file
+
+    def get_refresh_margin(self):
+        return self.refresh_margin
+
+    # Return the cached token for cache_key or call fetch_token() to create a new one.  fetch_token must return
+    # a dict containing at least "access_token" and "expiration" (seconds since the epoch).
+    def get_token(self, cache_key, fetch_token):
+
+        cache_key = hashlib.sha256(cache_key.encode("utf-8")).hexdigest()
+        with self.thread_lock, _FileLock(self.lock_file):
+            tokens = self.__load()
+            token = tokens.get(cache_key)
+            if token is not None and token["expiration"] - self.refresh_margin > time.time():
+                return token
+
+            token = fetch_token()
+            tokens = {key: value for key, value in tokens.items() if value["expiration"] > time.time()}
+            tokens[cache_key] = token
+            self.__save(tokens)
+            return token
+
+    # Return an IAM token response for an API key in the format returned by the IAM token endpoint.
+    # This can be used directly as the auth_function of an ibm_boto3 client.
+    def get_iam_token(self, api_key, auth_endpoint=IAM_AUTH_ENDPOINT):
+
+        def fetch_token():
+            data = urllib.parse.urlencode({
+                "grant_type": "urn:ibm:params:oauth:grant-type:apikey",
+                "response_type": "cloud_iam",
+                "apikey": api_key
+            }).encode("utf-8")
+            request = urllib.request.Request(auth_endpoint, data=data, headers={
+                "Content-Type": "application/x-www-form-urlencoded",
+                "Accept": "application/json",
+                "Authorization": "Basic Yng6Yng="  # bx:bx
+            })
+            with urllib.request.urlopen(request) as response:
+                return json.loads(response.read().decode("utf-8"))
+
+        token = dict(self.get_token("iam:%s:%s" % (auth_endpoint, api_key), fetch_token))
+        token["expires_in"] = max(int(token["expiration"] - time.time()), 0)
+        return token
+
+    # Return a WML token for username/password credentials via the WML identity endpoint as a dict with the
+    # "access_token" and its "expiration"
+    def get_wml_token(self, wml_credentials):
+
+        def fetch_token():
+            auth = base64.b64encode(("%s:%s" % (wml_credentials["username"], wml_credentials["password"]))
+                                    .encode("utf-8")).decode("utf-8")
+            request = urllib.request.Request("%s/v3/identity/token" % wml_credentials["url"],
+                                             headers={"Authorization": "Basic %s" % auth})
+            with urllib.request.urlopen(request) as response:
+                access_token = json.loads(response.read().decode("utf-8"))["token"]
+            return {"access_token": access_token, "expiration": TokenCache.__get_jwt_expiration(access_token)}
+
+        cache_key = "wml:%s:%s:%s" % (wml_credentials["url"], wml_credentials["username"], wml_credentials["password"])
+        return dict(self.get_token(cache_key, fetch_token))
+
+    def clear(self):
+        with self.thread_lock, _FileLock(self.lock_file):
+            self.__save({})
+
+    def __load(self):
+        if not os.path.exists(self.cache_file):
+            return {}
+        try:
+            with open(self.cache_file) as json_data:
+                return json.load(json_data)
+        except ValueError:
+            # Corrupted cache so simply authenticate again
+            return {}
+
+    def __save(self, tokens):
+        temp_file = "%s.%d.tmp" % (self.cache_file, os.getpid())
+        with open(os.open(temp_file, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "w") as outfile:
+            json.dump(tokens, outfile)
+        os.replace(temp_file, self.cache_file)
+
+    @staticmethod
+    def __get_jwt_expiration(jwt):
+
+        # The payload is the second, base64url encoded, segment of the token
+        payload = jwt.split(".")[1]
+        payload += "=" * (-len(payload) % 4)
+        try:
+            return json.loads(base64.urlsafe_b64decode(payload).decode("utf-8"))["exp"]
+        except (ValueError, KeyError):
+            # Unknown format so assume the token lives for an hour
+            return time.time() + 60 * 60
+
+
+# Exclusive lock on a file shared between processes
+class _FileLock:
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        directory = os.path.dirname(self.path)
+        if len(directory) > 0:
+            os.makedirs(directory, exist_ok=True)
+        self.file = open(self.path, "a+")
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
@@ -1,18 +1,34 @@
 import json
 import os
 import os.path
+import threading
+import time
 from cos_utils import CosUtils
-from watson_machine_learning_client import WatsonMachineLearningAPIClient
+from definition_cache import DefinitionCache
+from details_cache import DetailsCache
+from request_scheduler import RequestScheduler
+from token_cache import TokenCache
 
 
 class WatsonStudioUtils:
 
-    def __init__(self, region=None):
+    # token_cache is an optional TokenCache shared by the COS and WML clients and definition_cache an optional
+    # DefinitionCache used by Experiment to reuse stored training definitions.  configure_utilities_from_file()
+    # creates both in the settings directory if they're not provided.  All COS and WML requests are routed
+    # through a single RequestScheduler.
+    def __init__(self, region=None, token_cache=None, definition_cache=None, scheduler=None):
 
         self.cos_credentials = None
         self.wml_credentials = None
         self.cos_utils = None
+        self.wml_client = None
+        self.wml_client_lock = threading.Lock()
         self.region = region
+        self.token_cache = token_cache
+        self.definition_cache = definition_cache
+        self.details_cache = None
+        self.details_cache_file = None
+        self.scheduler = scheduler if scheduler is not None else RequestScheduler()
 
     def configure_utilities_from_file(self):
 
@@ -23,6 +39,12 @@ class WatsonStudioUtils:
         if not os.path.isfile(wml_creds_file):
             raise FileExistsError("WML credentials not found at %s" % wml_creds_file)
 
+        if self.token_cache is None:
+            self.token_cache = TokenCache(os.path.join("..", "settings", "token_cache.json"))
+        if self.definition_cache is None:
+            self.definition_cache = DefinitionCache(os.path.join("..", "settings", "definition_cache.json"))
+        self.details_cache_file = os.path.join("..", "settings", "details_cache.json")
+
         with open(cos_creds_file) as json_data:
             cos_credentials = json.load(json_data)
         with open(wml_creds_file) as json_data:
@@ -35,15 +57,104 @@ class WatsonStudioUtils:
         self.cos_credentials = cos_credentials
         self.wml_credentials = wml_credentials
 
-        self.cos_utils = CosUtils(self.cos_credentials, self.region)
-        self.wml_client = WatsonMachineLearningAPIClient(self.wml_credentials)
-        print("WML client version: %s" % self.wml_client.version)
+        # Creating the COS and WML clients is slow (heavy imports plus authentication) so both are only
+        # created the first time they're used.  Scripts that only need one of them never pay for the other.
+        self.cos_utils = CosUtils(self.cos_credentials, self.region, token_cache=self.token_cache,
+                                  scheduler=self.scheduler)
+        self.wml_client = None
 
     def get_cos_utils(self):
         return self.cos_utils
 
     def get_wml_client(self):
+        if self.wml_client is None:
+            with self.wml_client_lock:
+                if self.wml_client is None:
+                    from watson_machine_learning_client import WatsonMachineLearningAPIClient
+
+                    def create_client():
+                        wml_credentials, expiration = self.__get_wml_credentials_with_token()
+                        return WatsonMachineLearningAPIClient(wml_credentials), expiration
+
+                    refresh_margin = self.token_cache.get_refresh_margin() if self.token_cache is not None else 0
+                    self.wml_client = _RefreshingWmlClient(create_client, refresh_margin)
+                    print("WML client version: %s" % self.wml_client.version)
         return self.wml_client
 
+    # Use an already created WML client, e.g. the LocalWmlClient from local_services.py
+    def set_wml_client(self, wml_client):
+        with self.wml_client_lock:
+            self.wml_client = wml_client
+            self.details_cache = None
+
+    def get_request_scheduler(self):
+        return self.scheduler
+
+    def get_token_cache(self):
+        return self.token_cache
+
+    def get_definition_cache(self):
+        return self.definition_cache
+
+    # Shared cache of WML run and training details.  When configured from file, details of finished runs are
+    # persisted to the settings directory so they're never requested again.
+    def get_details_cache(self):
+        if self.details_cache is None:
+            with self.wml_client_lock:
+                if self.details_cache is None:
+                    self.details_cache = DetailsCache(self.get_wml_client(), persist_file=self.details_cache_file,
+                                                      scheduler=self.scheduler)
+        return self.details_cache
+
+    # Add a cached token to the WML credentials so the client can skip its own token request.  Returns the
+    # credentials and the expiration of the added token or None if no token was added.
+    def __get_wml_credentials_with_token(self):
+
+        wml_credentials = dict(self.wml_credentials)
+        if self.token_cache is None or "token" in wml_credentials:
+            return wml_credentials, None
+
+        token = None
+        try:
+            if "apikey" in wml_credentials:
+                token = self.token_cache.get_iam_token(wml_credentials["apikey"])
+            elif "username" in wml_credentials and "password" in wml_credentials:
+                token = self.token_cache.get_wml_token(wml_credentials)
+        except Exception as err:
+            # The WML client can still authenticate itself
+            print("Unable to use cached WML token: %s" % err)
+
+        if token is None:
+            return wml_credentials, None
+        wml_credentials["token"] = token["access_token"]
+        return wml_credentials, token["expiration"]
+
     def get_cos_credentials(self):
         return self.cos_credentials
+
+    def get_wml_credentials(self):
+        return self.wml_credentials
+
+
+# A WML client given a token never refreshes it, so long running scripts would start failing with 401s once it
+# expires.  This wraps the client created with a cached token and creates a new client, with a fresh token from
+# the TokenCache, once the token is within refresh_margin seconds of expiring.  Attributes are looked up on the
+# current client on every access so Experiment and DetailsCache, which keep a reference to the client, always
+# use a valid token.
+class _RefreshingWmlClient:
+
+    def __init__(self, create_client, refresh_margin):
+
+        self._create_client = create_client
+        self._refresh_margin = refresh_margin
+        self._lock = threading.Lock()
+        self._client, self._expiration = create_client()
+
+    def __getattr__(self, name):
+
+        if self._expiration is not None and self._expiration - self._refresh_margin < time.time():
+            with self._lock:
+                if self._expiration is not None and self._expiration - self._refresh_margin < time.time():
+                    print("WML token expires soon, creating a new WML client")
+                    self._client, self._expiration = self._create_client()
+        return getattr(self._client, name)
@@ -0,0 +1,48 @@
+import os
+import sys
+
+import pytest
+
+# The utilities are flat modules in source/, the same way the scripts import them
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "source"))
+
+from local_services import LocalCosServer, LocalWmlClient
+
+
+# The utilities keep settings and caches relative to the working directory (e.g. ../settings) so every test runs
+# in its own directory
+@pytest.fixture
+def work_directory(tmp_path, monkeypatch):
+    work_directory = tmp_path / "work"
+    work_directory.mkdir()
+    monkeypatch.chdir(work_directory)
+    return work_directory
+
+
+@pytest.fixture
+def cos_server():
+    server = LocalCosServer()
+    server.start()
+    yield server
+    server.stop()
+
+
+@pytest.fixture
+def cos_utils(cos_server, work_directory):
+    pytest.importorskip("ibm_boto3")
+    from cos_utils import CosUtils
+    return CosUtils(cos_server.get_credentials(), "us-south")
+
+
+@pytest.fixture
+def bucket(cos_utils):
+    return cos_utils.create_unique_bucket("test")
+
+
+@pytest.fixture
+def studio_utils(cos_server, work_directory):
+    from watson_studio_utils import WatsonStudioUtils
+    studio_utils = WatsonStudioUtils(region="us-south")
+    studio_utils.configure_utilities(cos_server.get_credentials(), {})
+    studio_utils.set_wml_client(LocalWmlClient(queue_seconds=0, training_seconds=0, guid_delay=0))
+    return studio_utils
@@ -0,0 +1,185 @@
+import os
+
+import pytest
+
+from download_cache import DownloadCache
+
+
+def write_file(path, data):
+    os.makedirs(os.path.dirname(str(path)), exist_ok=True)
+    with open(str(path), "wb") as file:
+        file.write(data)
+    return str(path)
+
+
+def read_file(path):
+    with open(str(path), "rb") as file:
+        return file.read()
+
+
+def put_object(cos_utils, bucket, key, data):
+    cos_utils.get_cos_client().put_object(Bucket=bucket, Key=key, Body=data)
+
+
+# Count the GETs of object bodies made through the client
+@pytest.fixture
+def get_object_calls(cos_utils, monkeypatch):
+    client = cos_utils.get_cos_client()
+    get_object = client.get_object
+    calls = []
+
+    def counting_get_object(**kwargs):
+        calls.append(kwargs)
+        return get_object(**kwargs)
+
+    monkeypatch.setattr(client, "get_object", counting_get_object)
+    return calls
+
+
+@pytest.mark.parametrize("resumable", [False, True])
+def test_cached_download(cos_utils, bucket, work_directory, get_object_calls, resumable):
+
+    cos_utils.set_download_cache(DownloadCache(str(work_directory / "cache")))
+    put_object(cos_utils, bucket, "data/train.bin", b"first version" * 1000)
+
+    save_file = str(work_directory / "download" / "train.bin")
+    cos_utils.download_file(bucket, "data/train.bin", save_file, resumable=resumable)
+    assert read_file(save_file) == b"first version" * 1000
+    calls = len(get_object_calls)
+    assert calls > 0
+
+    # Unchanged objects are copied from the cache
+    os.remove(save_file)
+    cos_utils.download_file(bucket, "data/train.bin", save_file, resumable=resumable)
+    assert read_file(save_file) == b"first version" * 1000
+    assert len(get_object_calls) == calls
+
+    # A changed object is downloaded again
+    put_object(cos_utils, bucket, "data/train.bin", b"second version")
+    cos_utils.download_file(bucket, "data/train.bin", save_file, is_redownload=True, resumable=resumable)
+    assert read_file(save_file) == b"second version"
+    assert len(get_object_calls) > calls
+    assert all(call["IfMatch"] for call in get_object_calls)
+
+
+def test_resumable_download_resumes(cos_utils, bucket, work_directory, monkeypatch):
+
+    data = os.urandom(10 * 1024)
+    put_object(cos_utils, bucket, "model.bin", data)
+    save_file = str(work_directory / "new" / "model.bin")
+
+    client = cos_utils.get_cos_client()
+    get_object = client.get_object
+    ranges = []
+
+    # Fail the download after 4 of its 10 parts
+    def get_object_range(**kwargs):
+        if len(ranges) == 4 and failing:
+            raise IOError("connection lost")
+        ranges.append(kwargs["Range"])
+        return get_object(**kwargs)
+
+    monkeypatch.setattr(client, "get_object", get_object_range)
+    failing = True
+    with pytest.raises(IOError):
+        cos_utils.download_file_resumable(bucket, "model.bin", save_file, part_size=1024, max_workers=1)
+    assert not os.path.exists(save_file)
+    assert os.path.exists(save_file + ".part.json")
+
+    # Only the missing parts are downloaded
+    failing = False
+    cos_utils.download_file_resumable(bucket, "model.bin", save_file, part_size=1024, max_workers=1)
+    assert read_file(save_file) == data
+    assert len(ranges) == 10 and len(set(ranges)) == 10
+    assert not os.path.exists(save_file + ".part.json")
+
+
+def test_resumable_download_restarts_changed_object(cos_utils, bucket, work_directory, monkeypatch):
+
+    put_object(cos_utils, bucket, "model.bin", b"a" * 4096)
+    save_file = str(work_directory / "model.bin")
+
+    client = cos_utils.get_cos_client()
+    get_object = client.get_object
+    monkeypatch.setattr(client, "get_object", lambda **kwargs: (_ for _ in ()).throw(IOError("connection lost")))
+    with pytest.raises(IOError):
+        cos_utils.download_file_resumable(bucket, "model.bin", save_file, part_size=1024, max_workers=1)
+
+    monkeypatch.setattr(client, "get_object", get_object)
+    put_object(cos_utils, bucket, "model.bin", b"b" * 3000)
+    cos_utils.download_file_resumable(bucket, "model.bin", save_file, part_size=1024, max_workers=1)
+    assert read_file(save_file) == b"b" * 3000
+
+
+def test_sync_prefix(cos_utils, bucket, work_directory):
+
+    for name in ["a", "b", "c"]:
+        put_object(cos_utils, bucket, "runs/%s.txt" % name, name.encode())
+    put_object(cos_utils, bucket, "other/d.txt", b"d")
+    local_directory = str(work_directory / "sync")
+
+    summary = cos_utils.sync_prefix(bucket, "runs/", local_directory)
+    assert summary["files"] == 3 and summary["unchanged"] == 0 and summary["failures"] == {}
+    assert read_file(os.path.join(local_directory, "runs", "b.txt")) == b"b"
+    assert not os.path.exists(os.path.join(local_directory, "other"))
+
+    # Only changed objects are downloaded again
+    summary = cos_utils.sync_prefix(bucket, "runs/", local_directory)
+    assert summary["files"] == 0 and summary["unchanged"] == 3
+
+    put_object(cos_utils, bucket, "runs/a.txt", b"changed")
+    cos_utils.get_cos_client().delete_object(Bucket=bucket, Key="runs/c.txt")
+    summary = cos_utils.sync_prefix(bucket, "runs/", local_directory)
+    assert summary["files"] == 1 and summary["deleted"] == 0
+    assert read_file(os.path.join(local_directory, "runs", "a.txt")) == b"changed"
+    assert os.path.exists(os.path.join(local_directory, "runs", "c.txt"))
+
+    summary = cos_utils.sync_prefix(bucket, "runs/", local_directory, delete=True)
+    assert summary["files"] == 0 and summary["deleted"] == 1
+    assert not os.path.exists(os.path.join(local_directory, "runs", "c.txt"))
+
+
+def test_sync_whole_bucket(cos_utils, bucket, work_directory):
+
+    put_object(cos_utils, bucket, "runs/a.txt", b"a")
+    put_object(cos_utils, bucket, "b.txt", b"b")
+    local_directory = str(work_directory / "sync")
+
+    summary = cos_utils.sync_prefix(bucket, None, local_directory, delete=True)
+    assert summary["files"] == 2 and summary["deleted"] == 0
+    assert read_file(os.path.join(local_directory, "b.txt")) == b"b"
+
+
+def test_paginated_listing(cos_utils, cos_server, bucket):
+
+    keys = sorted(["runs/run-%d/file-%02d" % (run, index) for run in range(3) for index in range(9)])
+    keys.append("top-level.txt")
+    for key in keys:
+        put_object(cos_utils, bucket, key, b"x")
+
+    # 28 objects are listed in 3 pages
+    assert [obj["Key"] for obj in cos_utils.iterate_objects_in_bucket(bucket, page_size=10)] == sorted(keys)
+    assert cos_server.get_stats()["GET bucket"]["calls"] == 3
+
+    assert cos_utils.get_common_prefixes(bucket, prefix="runs/") == ["runs/run-0/", "runs/run-1/", "runs/run-2/"]
+    parallel = cos_utils.iterate_objects_in_bucket_parallel(bucket, max_workers=2, page_size=4)
+    assert sorted(obj["Key"] for obj in parallel) == sorted(keys)
+
+
+def test_bulk_transfer_failures(cos_utils, bucket, work_directory):
+
+    files = [(write_file(work_directory / "upload" / ("%d.bin" % index), b"x" * index), "bulk/%d.bin" % index)
+             for index in range(1, 5)]
+    files.append((str(work_directory / "upload" / "missing.bin"), "bulk/missing.bin"))
+
+    summary = cos_utils.upload_many(files, bucket, max_workers=3)
+    assert summary["files"] == 4
+    assert summary["bytes"] == 1 + 2 + 3 + 4
+    assert list(summary["failures"]) == [(bucket, "bulk/missing.bin")]
+
+    downloads = [("bulk/%d.bin" % index, str(work_directory / "download" / ("%d.bin" % index)))
+                 for index in range(1, 6)]
+    summary = cos_utils.download_many(bucket, downloads, max_workers=3)
+    assert summary["files"] == 4
+    assert list(summary["failures"]) == [(bucket, "bulk/5.bin")]
+    assert read_file(work_directory / "download" / "4.bin") == b"xxxx"
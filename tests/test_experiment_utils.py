@@ -0,0 +1,63 @@
+import zipfile
+
+import pytest
+
+from experiment_utils import ExperimentBatch
+from project_utils import ProjectUtils
+
+
+@pytest.fixture
+def project_utils(studio_utils):
+    project_utils = ProjectUtils(studio_utils)
+    project_utils.settings = {ProjectUtils.FASHION_MIST_ROOT_KEY: {
+        ProjectUtils.FASHION_MIST_DATA_BUCKET_KEY: "data",
+        ProjectUtils.FASHION_MIST_RESULTS_BUCKET_KEY: "results"
+    }}
+    return project_utils
+
+
+@pytest.fixture
+def experiment_zip(work_directory):
+    experiment_zip = str(work_directory / "experiment.zip")
+    with zipfile.ZipFile(experiment_zip, "w") as file:
+        file.writestr("experiment.py", "print('training')")
+    return experiment_zip
+
+
+def create_specs(count, experiment_zip):
+    return [{"name": "run-%d" % index, "command": "python3 experiment.py", "experiment_zip": experiment_zip,
+             "gpu_type": "k80", "hyperparameters": {"index": index}} for index in range(count)]
+
+
+def create_batch(studio_utils, project_utils, max_runs_per_experiment):
+    return ExperimentBatch("Batch", "Test batch", "tensorflow", "1.5", "python", "3.5",
+                           studio_utils, project_utils, max_runs_per_experiment=max_runs_per_experiment)
+
+
+def test_batch_splits_runs(studio_utils, project_utils, experiment_zip):
+
+    batch = create_batch(studio_utils, project_utils, 3)
+    batch.add_training_runs(create_specs(7, experiment_zip))
+    experiments = batch.execute(guid_deadline=5)
+
+    assert len(experiments) == 3
+    assert [run.get_name() for run in batch.get_training_runs()] == ["run-%d" % index for index in range(7)]
+    assert all(guid is not None for guid in batch.get_training_run_guids())
+    assert len(batch.get_training_statuses()) == 7
+
+
+def test_batch_keeps_started_experiments(studio_utils, project_utils, experiment_zip, work_directory):
+
+    specs = create_specs(7, experiment_zip)
+    # The second experiment fails to start as one of its archives is missing
+    specs[4]["experiment_zip"] = str(work_directory / "missing.zip")
+
+    batch = create_batch(studio_utils, project_utils, 3)
+    batch.add_training_runs(specs)
+    with pytest.raises(Exception) as error:
+        batch.execute(guid_deadline=5)
+
+    assert "1 of 3 experiments" in str(error.value)
+    assert len(batch.get_experiments()) == 2
+    assert [run.get_name() for run in batch.get_training_runs()] == ["run-0", "run-1", "run-2", "run-6"]
+    assert all(guid is not None for guid in batch.get_experiment_run_guids())
@@ -0,0 +1,49 @@
+import pytest
+
+from random_search import GridSampler, RandomSearch
+
+np = pytest.importorskip("numpy")
+
+
+@pytest.mark.parametrize("cardinality", [1, 2, 3, 7, 64, 100, 1000])
+def test_grid_sampler_is_permutation(cardinality):
+
+    sampler = GridSampler(cardinality, np.random.default_rng(1))
+    indices = sampler.next_indices(cardinality - cardinality // 2) + sampler.next_indices(cardinality // 2)
+
+    assert sorted(indices) == list(range(cardinality))
+    assert sampler.get_remaining() == 0
+    with pytest.raises(ValueError):
+        sampler.next_indices(1)
+
+
+def test_grid_sampler_order_depends_on_seed():
+
+    first = GridSampler(1000, np.random.default_rng(1)).next_indices(1000)
+    assert GridSampler(1000, np.random.default_rng(1)).next_indices(1000) == first
+    assert GridSampler(1000, np.random.default_rng(2)).next_indices(1000) != first
+    assert first != list(range(1000))
+
+
+def test_grid_sampler_huge_grid():
+
+    cardinality = 10 ** 30
+    sampler = GridSampler(cardinality, np.random.default_rng(1))
+    indices = sampler.next_indices(1000)
+
+    assert len(set(indices)) == 1000
+    assert all(0 <= index < cardinality for index in indices)
+    assert sampler.get_index(500) == indices[500]
+
+
+def test_unique_search_exhausts_grid():
+
+    random_search = RandomSearch(seed=1)
+    random_search.add_step_range("learning_rate", 0.1, 0.5, 0.1)
+    random_search.add_static_var("epochs", 5)
+    samples = random_search.create_search(5, RandomSearch.STRATEGY_UNIQUE)
+
+    assert sorted(sample["learning_rate"] for sample in samples) == [0.1, 0.2, 0.3, 0.4, 0.5]
+    assert all(sample["epochs"] == 5 for sample in samples)
+    with pytest.raises(ValueError):
+        random_search.create_search(1, RandomSearch.STRATEGY_UNIQUE)